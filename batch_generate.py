@@ -0,0 +1,293 @@
+"""
+Пакетная генерация карт без графического интерфейса
+
+Пример:
+    python batch_generate.py --seeds 0-999 --size 256x256 --preset Леса \
+        --output maps --workers 8
+
+Для каждого seed записываются архив карты (map_<seed>.maparc, см.
+map_archive: terrain, moisture, temperature, biomes, ml_predictions и
+параметры генератора) и PNG, а в manifest.jsonl добавляется строка с
+параметрами, файлами и временем каждого этапа. С --profile подробная
+статистика этапов (см. profiling) всех карт сохраняется в JSON.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from enhanced_map_generator import EnhancedMapGenerator
+from biomes import BIOME_TYPES
+from map_archive import save_map_archive, MAP_ARCHIVE_EXTENSION
+from generation_cache import GenerationCache, generation_key
+from profiling import Profiler, get_stats, reset_stats
+
+
+# Генератор и кэш рабочего процесса (создаются один раз на процесс)
+_worker_gen = None
+_worker_options = None
+_worker_cache = None
+
+
+def parse_seeds(text: str) -> List[int]:
+    """
+    Разбор списка seed: "0-99", "1,5,9" или их комбинация "0-9,42"
+    """
+    seeds = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        
+        start, sep, end = part.partition('-')
+        if sep and start:
+            first, last = int(start), int(end)
+            if last < first:
+                raise ValueError(f"Пустой диапазон seed: {part}")
+            seeds.extend(range(first, last + 1))
+        else:
+            seeds.append(int(part))
+    
+    if not seeds:
+        raise ValueError("Не указано ни одного seed")
+    return seeds
+
+
+def parse_size(text: str):
+    """Разбор размера карты: "256x128" или "256" (квадрат)"""
+    width, sep, height = text.lower().partition('x')
+    width = int(width)
+    height = int(height) if sep else width
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Некорректный размер карты: {text}")
+    return width, height
+
+
+def _init_worker(options: Dict[str, Any]):
+    """Инициализация рабочего процесса"""
+    global _worker_gen, _worker_options, _worker_cache
+    _worker_options = options
+    _worker_cache = None
+    if options['cache'] is not None:
+        _worker_cache = GenerationCache(options['cache'], options['cache_size'])
+    _worker_gen = EnhancedMapGenerator(
+        options['width'], options['height'],
+        use_ml=options['use_ml'], auto_train=False
+    )
+    if options['preset'] is not None:
+        _worker_gen.apply_preset(options['preset'])
+
+
+def _generate_map(seed: int) -> Dict[str, Any]:
+    """Генерация и сохранение одной карты; возвращает запись манифеста"""
+    gen = _worker_gen
+    options = _worker_options
+    timings = {}
+    
+    def stage(name, start):
+        now = time.perf_counter()
+        timings[name] = round(now - start, 6)
+        return now
+    
+    if options['profile']:
+        reset_stats()
+    
+    started = time.perf_counter()
+    now = started
+    
+    gen.set_seed(seed)
+    cache_key = generation_key(gen, options) if _worker_cache is not None else None
+    archive = _worker_cache.get(cache_key) if cache_key is not None else None
+    
+    if archive is not None:
+        archive.restore(gen)
+        now = stage('cache', now)
+    else:
+        gen.generate_terrain(scale=options['scale'], roughness=options['roughness'], seed=seed,
+                             island_mode=options.get('island_mode', True),
+                             smooth_iterations=options.get('smooth_iterations', 2))
+        now = stage('terrain', now)
+        
+        gen.generate_climate_maps(scale=options['scale'])
+        now = stage('climate', now)
+        
+        gen.generate_biome_map()
+        now = stage('biomes', now)
+        
+        if cache_key is not None:
+            _worker_cache.put(cache_key, gen, {'scale': options['scale'],
+                                               'roughness': options['roughness']})
+            now = stage('cache', now)
+    biomes = gen.biome_data
+    
+    name = f"map_{seed}"
+    files = {'arrays': f"{name}{MAP_ARCHIVE_EXTENSION}"}
+    save_map_archive(
+        os.path.join(options['output'], files['arrays']), gen,
+        metadata={'scale': options['scale'], 'roughness': options['roughness'],
+                  'preset': options['preset']}
+    )
+    now = stage('arrays', now)
+    
+    if options['png']:
+        files['png'] = f"{name}.png"
+        image = gen.render_image(cell_size=options['cell_size'])
+        image.save(os.path.join(options['output'], files['png']))
+        now = stage('png', now)
+    
+    timings['total'] = round(now - started, 6)
+    
+    counts = np.bincount(biomes.ravel(), minlength=len(BIOME_TYPES))
+    record = {
+        'seed': seed,
+        'width': gen.width,
+        'height': gen.height,
+        'preset': options['preset'],
+        'scale': options['scale'],
+        'roughness': options['roughness'],
+        'ml': bool(gen.ml_predictions is not None and gen.ml_predictions.any()),
+        'cached': archive is not None,
+        'files': files,
+        'biome_counts': {biome.value: int(count) for biome, count in zip(BIOME_TYPES, counts)},
+        'timings': timings,
+    }
+    if options['profile']:
+        record['profile'] = get_stats()
+    return record
+
+
+def _run_serial(seeds: List[int], options: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    _init_worker(options)
+    for seed in seeds:
+        yield _generate_map(seed)
+
+
+def _run_parallel(seeds: List[int], options: Dict[str, Any],
+                  workers: int) -> Iterable[Dict[str, Any]]:
+    chunksize = max(1, min(16, len(seeds) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(options,)) as pool:
+        yield from pool.map(_generate_map, seeds, chunksize=chunksize)
+
+
+def run_batch(seeds: List[int], width: int, height: int, output: str,
+              preset: Optional[str] = None, scale: float = 8.0, roughness: float = 0.5,
+              workers: int = 1, use_ml: bool = False, png: bool = True,
+              cell_size: int = 1, manifest: str = "manifest.jsonl",
+              cache: Optional[str] = None, cache_size: int = 512 * 1024 * 1024,
+              profile: Optional[str] = None, verbose: bool = True) -> str:
+    """
+    Генерация карт для списка seed
+    
+    Записи манифеста добавляются по мере готовности карт (в порядке seeds),
+    поэтому прерванный запуск оставляет корректный частичный манифест.
+    
+    Если задан cache (каталог GenerationCache), карты с теми же входными
+    данными берутся из него, а новые в него добавляются.
+    
+    Если задан profile, статистика этапов всех карт суммируется и
+    сохраняется в этот JSON файл.
+    
+    Returns:
+        Путь к файлу манифеста
+    """
+    if preset is not None and preset not in EnhancedMapGenerator.PRESETS:
+        raise ValueError(f"Неизвестный пресет: {preset}")
+    
+    os.makedirs(output, exist_ok=True)
+    options = {
+        'width': width, 'height': height, 'output': output,
+        'preset': preset, 'scale': scale, 'roughness': roughness,
+        'use_ml': use_ml, 'png': png, 'cell_size': cell_size,
+        'cache': cache, 'cache_size': cache_size,
+        'profile': profile is not None,
+    }
+    
+    if workers > 1 and len(seeds) > 1:
+        records = _run_parallel(seeds, options, workers)
+    else:
+        records = _run_serial(seeds, options)
+    
+    manifest_path = os.path.join(output, manifest)
+    profiler = Profiler()
+    started = time.perf_counter()
+    with open(manifest_path, 'a', encoding='utf-8') as f:
+        for done, record in enumerate(records, 1):
+            if profile is not None:
+                profiler.merge(record.pop('profile'))
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            
+            if verbose and (done % 100 == 0 or done == len(seeds)):
+                elapsed = time.perf_counter() - started
+                print(f"  Сгенерировано {done}/{len(seeds)} карт ({elapsed:.1f} с)")
+    
+    if profile is not None:
+        profiler.dump_json(profile, {'maps': len(seeds), 'width': width, 'height': height,
+                                     'workers': workers})
+    
+    return manifest_path
+
+
+def main(argv=None):
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Пакетная генерация карт без графического интерфейса"
+    )
+    parser.add_argument('--seeds', required=True,
+                        help='seed или диапазоны: "0-99", "1,5,9", "0-9,42"')
+    parser.add_argument('--size', default='60x40',
+                        help='размер карты ШxВ (по умолчанию 60x40)')
+    parser.add_argument('--preset', choices=sorted(EnhancedMapGenerator.PRESETS),
+                        help='пресет биомов')
+    parser.add_argument('--scale', type=float, default=8.0, help='масштаб шума')
+    parser.add_argument('--roughness', type=float, default=0.5, help='шероховатость')
+    parser.add_argument('--output', default='maps', help='директория для результатов')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='число рабочих процессов')
+    parser.add_argument('--ml', action='store_true',
+                        help='использовать ML классификатор (нужна обученная модель)')
+    parser.add_argument('--no-png', action='store_true', help='не сохранять PNG')
+    parser.add_argument('--cell-size', type=int, default=1,
+                        help='размер клетки в PNG, пикселей')
+    parser.add_argument('--manifest', default='manifest.jsonl',
+                        help='имя файла манифеста в директории результатов')
+    parser.add_argument('--cache', help='каталог кэша сгенерированных карт')
+    parser.add_argument('--cache-size', type=int, default=512,
+                        help='максимальный размер кэша, МБ')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='сохранить статистику времени этапов в JSON')
+    args = parser.parse_args(argv)
+    
+    try:
+        seeds = parse_seeds(args.seeds)
+        width, height = parse_size(args.size)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    print(f"Генерация {len(seeds)} карт {width}x{height} "
+          f"в {args.output} ({max(1, args.workers)} процессов)...")
+    
+    start_time = time.time()
+    manifest_path = run_batch(
+        seeds, width, height, args.output,
+        preset=args.preset, scale=args.scale, roughness=args.roughness,
+        workers=max(1, args.workers), use_ml=args.ml, png=not args.no_png,
+        cell_size=args.cell_size, manifest=args.manifest,
+        cache=args.cache, cache_size=args.cache_size * 1024 * 1024,
+        profile=args.profile
+    )
+    
+    elapsed = time.time() - start_time
+    print(f"Готово за {elapsed:.1f} секунд, манифест: {manifest_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,497 @@
+"""
+Замеры производительности генерации карт
+
+Пример:
+    python benchmark.py --sizes 60x40,256x256,1024x1024 --octaves 1,4,8 \
+        --output bench.json --baseline baseline.json
+
+Каждый случай - один этап (шум, сглаживание, классификация по правилам,
+ML предсказание, полная генерация, экспорт PNG, подготовка изображений
+для DisplayPanel) для одного размера карты, числа октав и режима ML.
+Первый запуск случая - прогрев под tracemalloc (пиковая память), затем
+--repeat замеров без него; в результат идет лучшее время и пропускная
+способность в клетках в секунду.
+
+Результаты сохраняются в JSON (--output) и сравниваются с сохраненным
+базовым файлом (--baseline): случаи, ставшие медленнее или
+потребляющие больше памяти сверх --tolerance, а также выбранные для
+запуска случаи базового файла, пропущенные или не замеренные в новом
+запуске, считаются регрессиями, и код возврата равен 1. Случаи базового
+файла вне выбранных --cases, --sizes, --octaves и --ml не сравниваются.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import profiling
+from batch_generate import parse_size
+from biomes import BiomeSystem
+from enhanced_map_generator import EnhancedMapGenerator
+from ml_biome_classifier import MLBiomeClassifier
+from noise_generator import ImprovedNoiseGenerator, NoisePyramid
+from colormaps import colorize_layer
+
+
+BENCHMARK_VERSION = 1
+BENCHMARK_SEED = 12345
+
+DEFAULT_SIZES = "60x40,256x256,1024x1024"
+FULL_SIZES = "60x40,256x256,1024x1024,4096x4096"
+DEFAULT_OCTAVES = "1,4,8"
+
+# Поклеточные API (classify_biome, predict_biome) замеряются на выборке
+SCALAR_SAMPLES = 20000
+ML_SCALAR_SAMPLES = 200
+
+# Статусы сравнения с базовыми результатами, считающиеся регрессиями
+REGRESSION_STATUSES = ('slower', 'memory', 'skipped', 'missing')
+
+
+class SkipCase(Exception):
+    """Случай нельзя выполнить в этом окружении (нет модели, PIL, GUI)"""
+    pass
+
+
+# Подготовленные карты: размер -> генератор со сгенерированной картой
+_maps: Dict[Tuple[int, int], EnhancedMapGenerator] = {}
+_classifier: Optional[MLBiomeClassifier] = None
+
+
+def _prepared_map(width: int, height: int) -> EnhancedMapGenerator:
+    """Карта заданного размера для входных данных замеров (без ML)"""
+    key = (width, height)
+    if key not in _maps:
+        gen = EnhancedMapGenerator(width, height, use_ml=False, auto_train=False)
+        gen.generate_terrain(seed=BENCHMARK_SEED)
+        gen.generate_climate_maps()
+        gen.generate_biome_map(use_ml=False)
+        _maps[key] = gen
+    return _maps[key]
+
+
+def _ml_classifier() -> MLBiomeClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = MLBiomeClassifier(use_ml=True)
+    if not _classifier.is_trained:
+        raise SkipCase("ML модель не обучена")
+    return _classifier
+
+
+def _sample(gen: EnhancedMapGenerator, count: int):
+    """Высота, влажность и температура count клеток карты"""
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    index = rng.integers(0, gen.width * gen.height, size=min(count, gen.width * gen.height))
+    return (gen.map_data.ravel()[index].tolist(),
+            gen.moisture_data.ravel()[index].tolist(),
+            gen.temperature_data.ravel()[index].tolist())
+
+
+def _levels(gen: EnhancedMapGenerator):
+    return gen.water_level, gen.mountain_level, gen.desert_moisture, gen.forest_moisture
+
+
+# Случаи замеров: функция (width, height, octaves, ml) -> (замеряемая функция, число клеток)
+
+def _case_noise(width, height, octaves, ml):
+    def run():
+        ImprovedNoiseGenerator.perlin_noise(width, height, scale=8.0, octaves=octaves,
+                                            seed=BENCHMARK_SEED)
+    return run, width * height
+
+
+def _case_noise_preview(width, height, octaves, ml):
+    # Первый уровень предпросмотра GenerationWorker (см. NoisePyramid)
+    steps = NoisePyramid.preview_steps(width, height)
+    step = steps[0] if steps else 1
+    
+    def run():
+        NoisePyramid(width, height, scale=8.0, octaves=octaves,
+                     seed=BENCHMARK_SEED).refine(step)
+    return run, -(-width // step) * -(-height // step)
+
+
+def _case_smooth(width, height, octaves, ml):
+    gen = _prepared_map(width, height)
+    terrain = gen.map_data
+    return (lambda: gen.smooth_terrain(terrain)), terrain.size
+
+
+def _case_classify(width, height, octaves, ml):
+    gen = _prepared_map(width, height)
+    elevation, moisture, temperature = _sample(gen, SCALAR_SAMPLES)
+    levels = _levels(gen)
+    biome_system = BiomeSystem()
+    
+    def run():
+        for values in zip(elevation, moisture, temperature):
+            biome_system.classify_biome(*values, *levels)
+    return run, len(elevation)
+
+
+def _case_classify_grid(width, height, octaves, ml):
+    gen = _prepared_map(width, height)
+    levels = _levels(gen)
+    
+    def run():
+        gen.biome_system.classify_biome_grid(gen.map_data, gen.moisture_data,
+                                             gen.temperature_data, *levels)
+    return run, gen.map_data.size
+
+
+def _case_ml_predict(width, height, octaves, ml):
+    classifier = _ml_classifier()
+    gen = _prepared_map(width, height)
+    elevation, moisture, temperature = _sample(gen, ML_SCALAR_SAMPLES)
+    levels = _levels(gen)
+    
+    def run():
+        for values in zip(elevation, moisture, temperature):
+            classifier.predict_biome(*values, *levels)
+    return run, len(elevation)
+
+
+def _case_ml_predict_grid(width, height, octaves, ml):
+    classifier = _ml_classifier()
+    gen = _prepared_map(width, height)
+    levels = _levels(gen)
+    
+    def run():
+        classifier.predict_biome_grid(gen.map_data, gen.moisture_data,
+                                      gen.temperature_data, *levels)
+    return run, gen.map_data.size
+
+
+def _case_generate(width, height, octaves, ml):
+    if ml:
+        _ml_classifier()
+    gen = EnhancedMapGenerator(width, height, use_ml=ml, auto_train=False)
+    
+    def run():
+        gen.generate_terrain(seed=BENCHMARK_SEED)
+        gen.generate_climate_maps()
+        gen.generate_biome_map()
+    return run, width * height
+
+
+def _case_export(width, height, octaves, ml):
+    try:
+        from gui.utils.export_utils import export_map_to_png
+        import PIL  # noqa: F401
+    except ImportError as e:
+        raise SkipCase(f"экспорт недоступен: {e}")
+    
+    gen = _prepared_map(width, height)
+    filename = os.path.join(tempfile.gettempdir(), f"benchmark_{os.getpid()}.png")
+    
+    def run():
+        export_map_to_png(gen.map_data, gen, filename=filename, cell_size=1)
+    return run, gen.map_data.size
+
+
+def _case_display(width, height, octaves, ml):
+    try:
+        from gui.display_panel import DisplayPanel
+    except ImportError as e:
+        raise SkipCase(f"DisplayPanel недоступен: {e}")
+    
+    gen = _prepared_map(width, height)
+    # Размер канваса по умолчанию (см. DisplayPanel._blit)
+    view = (600, 400)
+    cell_size = min(view[0] / width, view[1] / height)
+    size = (max(1, round(cell_size * width)), max(1, round(cell_size * height)))
+    
+    def run():
+        # Путь GenerationWorker + DisplayPanel.show_layers до PhotoImage
+        layers = [gen.render_rgb(), colorize_layer("height", gen.map_data),
+                  colorize_layer("temperature", gen.temperature_data),
+                  colorize_layer("moisture", gen.moisture_data)]
+        for rgb in layers:
+            scaled = DisplayPanel._scale_rgb(rgb, size)
+            np.ascontiguousarray(scaled).tobytes()
+    return run, width * height
+
+
+# Имя -> (функция случая, зависит от числа октав, режимы ML)
+CASES = {
+    'noise': (_case_noise, True, (False,)),
+    'noise_preview': (_case_noise_preview, True, (False,)),
+    'smooth': (_case_smooth, False, (False,)),
+    'classify': (_case_classify, False, (False,)),
+    'classify_grid': (_case_classify_grid, False, (False,)),
+    'ml_predict': (_case_ml_predict, False, (True,)),
+    'ml_predict_grid': (_case_ml_predict_grid, False, (True,)),
+    'generate': (_case_generate, False, (False, True)),
+    'export': (_case_export, False, (False,)),
+    'display': (_case_display, False, (False,)),
+}
+
+
+def case_id(name: str, width: int, height: int, octaves: Optional[int], ml: bool) -> str:
+    """Идентификатор случая для сравнения с базовыми результатами"""
+    parts = [name, f"{width}x{height}"]
+    if octaves is not None:
+        parts.append(f"o{octaves}")
+    if ml:
+        parts.append("ml")
+    return "/".join(parts)
+
+
+def build_cases(sizes: List[Tuple[int, int]], octaves: List[int],
+                names: Optional[List[str]] = None, ml_modes=(False, True)) -> List[Dict[str, Any]]:
+    """Список случаев: декартово произведение размеров, октав и режимов ML"""
+    cases = []
+    for name, (_, uses_octaves, case_ml_modes) in CASES.items():
+        if names is not None and name not in names:
+            continue
+        for width, height in sizes:
+            for case_octaves in (octaves if uses_octaves else [None]):
+                for ml in case_ml_modes:
+                    if ml not in ml_modes:
+                        continue
+                    cases.append({
+                        'id': case_id(name, width, height, case_octaves, ml),
+                        'name': name, 'width': width, 'height': height,
+                        'octaves': case_octaves, 'ml': ml,
+                    })
+    return cases
+
+
+def measure(func: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    """
+    Замер функции
+    
+    Первый вызов выполняется под tracemalloc (прогрев и пиковая память
+    выделений numpy и Python), остальные repeat - без него.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    
+    return {'best': min(times), 'median': statistics.median(times), 'peak_bytes': peak}
+
+
+def run_case(case: Dict[str, Any], repeat: int = 5) -> Dict[str, Any]:
+    """Выполнение одного случая; возвращает запись результата"""
+    func = CASES[case['name']][0]
+    result = dict(case)
+    try:
+        run, cells = func(case['width'], case['height'], case['octaves'] or 4, case['ml'])
+    except SkipCase as e:
+        result['skipped'] = str(e)
+        return result
+    
+    timing = measure(run, repeat)
+    result.update({
+        'cells': cells,
+        'seconds': timing['best'],
+        'median_seconds': timing['median'],
+        'cells_per_second': cells / timing['best'] if timing['best'] > 0 else 0.0,
+        'peak_bytes': timing['peak_bytes'],
+    })
+    return result
+
+
+def environment_info() -> Dict[str, Any]:
+    """Сведения об окружении для сопоставления результатов"""
+    return {
+        'version': BENCHMARK_VERSION,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float = 0.1, selected: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Сравнение результатов с базовыми
+    
+    Args:
+        selected: id случаев, выбранных для запуска (build_cases); случаи
+            базовых результатов вне выбора (другие --cases, размеры,
+            режимы ML) не сравниваются. None - выбраны случаи results
+    
+    Returns:
+        Записи (id, ratio - отношение пропускной способности к базовой,
+        memory_ratio, status: "ok", "faster", "slower", "memory", "new",
+        "skipped" - пропущен, хотя в базовых результатах есть, "missing" -
+        выбран и есть в базовых результатах, но не замерен)
+    """
+    rows = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if 'skipped' in result:
+            if base is not None and 'skipped' not in base:
+                rows.append({'id': key, 'ratio': None, 'memory_ratio': None, 'status': 'skipped'})
+            continue
+        
+        if base is None or 'skipped' in base:
+            rows.append({'id': key, 'ratio': None, 'memory_ratio': None, 'status': 'new'})
+            continue
+        
+        ratio = result['cells_per_second'] / base['cells_per_second'] if base['cells_per_second'] else None
+        memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else None
+        
+        status = 'ok'
+        if ratio is not None and ratio < 1 - tolerance:
+            status = 'slower'
+        elif (memory_ratio is not None and memory_ratio > 1 + tolerance
+              and result['peak_bytes'] - base['peak_bytes'] > 1024 * 1024):
+            status = 'memory'
+        elif ratio is not None and ratio > 1 + tolerance:
+            status = 'faster'
+        rows.append({'id': key, 'ratio': ratio, 'memory_ratio': memory_ratio, 'status': status})
+    
+    for key in (selected if selected is not None else []):
+        base = baseline.get(key)
+        if key not in results and base is not None and 'skipped' not in base:
+            rows.append({'id': key, 'ratio': None, 'memory_ratio': None, 'status': 'missing'})
+    return rows
+
+
+def format_results(results: Dict[str, Dict[str, Any]],
+                   comparison: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Текстовая таблица результатов"""
+    compared = {row['id']: row for row in comparison or []}
+    width = max([len(key) for key in list(results) + list(compared)] + [4])
+    lines = [f"{'Случай':<{width}}  {'клеток':>9}  {'лучшее, мс':>10}  "
+             f"{'Мклеток/с':>9}  {'пик, МБ':>8}  сравнение"]
+    
+    for key, result in results.items():
+        row = compared.get(key)
+        if 'skipped' in result:
+            note = '  (регрессия: есть в базовых результатах)' if row is not None else ''
+            lines.append(f"{key:<{width}}  пропущен: {result['skipped']}{note}")
+            continue
+        
+        note = ''
+        if row is not None:
+            note = row['status']
+            if row['ratio'] is not None:
+                note = f"x{row['ratio']:.2f} {note}"
+        lines.append(
+            f"{key:<{width}}  {result['cells']:>9}  {result['seconds'] * 1000:>10.2f}  "
+            f"{result['cells_per_second'] / 1e6:>9.2f}  {result['peak_bytes'] / 2**20:>8.1f}  {note}"
+        )
+    
+    for row in comparison or []:
+        if row['status'] == 'missing':
+            lines.append(f"{row['id']:<{width}}  отсутствует (регрессия: есть в базовых результатах)")
+    return "\n".join(lines)
+
+
+def run_benchmark(sizes: List[Tuple[int, int]], octaves: List[int],
+                  names: Optional[List[str]] = None, ml_modes=(False, True),
+                  repeat: int = 5, verbose: bool = True) -> Dict[str, Any]:
+    """
+    Выполнение набора случаев
+    
+    Returns:
+        {'environment': ..., 'results': {id случая: запись}}
+    """
+    # Счетчики profiling не должны влиять на замеры
+    profiling_enabled = profiling.profiler.enabled
+    profiling.set_enabled(False)
+    
+    results = {}
+    try:
+        for case in build_cases(sizes, octaves, names, ml_modes):
+            result = run_case(case, repeat)
+            results[case['id']] = result
+            if verbose:
+                if 'skipped' in result:
+                    print(f"  {case['id']}: пропущен ({result['skipped']})")
+                else:
+                    print(f"  {case['id']}: {result['cells_per_second'] / 1e6:.2f} Мклеток/с")
+    finally:
+        profiling.set_enabled(profiling_enabled)
+        _maps.clear()
+    
+    return {'environment': environment_info(), 'results': results}
+
+
+def main(argv=None):
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Замеры производительности генерации карт")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'размеры карт через запятую (по умолчанию {DEFAULT_SIZES})')
+    parser.add_argument('--full', action='store_true',
+                        help=f'полный набор размеров: {FULL_SIZES}')
+    parser.add_argument('--octaves', default=DEFAULT_OCTAVES,
+                        help=f'числа октав для шума (по умолчанию {DEFAULT_OCTAVES})')
+    parser.add_argument('--cases', help='случаи через запятую: ' + ', '.join(CASES))
+    parser.add_argument('--ml', choices=('on', 'off', 'both'), default='both',
+                        help='режимы ML (по умолчанию both)')
+    parser.add_argument('--repeat', type=int, default=5, help='число замеров каждого случая')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='базовые результаты JSON для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='допустимое отклонение от базовых результатов (доля)')
+    args = parser.parse_args(argv)
+    
+    try:
+        sizes = [parse_size(size) for size in (FULL_SIZES if args.full else args.sizes).split(',')]
+        octaves = [int(value) for value in args.octaves.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+    
+    names = None
+    if args.cases:
+        names = [name.strip() for name in args.cases.split(',')]
+        unknown = [name for name in names if name not in CASES]
+        if unknown:
+            parser.error(f"Неизвестные случаи: {', '.join(unknown)}")
+    
+    ml_modes = {'on': (True,), 'off': (False,), 'both': (False, True)}[args.ml]
+    
+    print("Замеры производительности...")
+    report = run_benchmark(sizes, octaves, names, ml_modes, args.repeat)
+    
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        selected = [case['id'] for case in build_cases(sizes, octaves, names, ml_modes)]
+        comparison = compare(report['results'], baseline['results'], args.tolerance, selected)
+    
+    print()
+    print(format_results(report['results'], comparison))
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены: {args.output}")
+    
+    if comparison:
+        regressions = [row for row in comparison if row['status'] in REGRESSION_STATUSES]
+        if regressions:
+            print(f"\nРегрессии: {len(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
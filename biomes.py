@@ -5,6 +5,8 @@
 from enum import Enum
 from typing import Dict
 
+import numpy as np
+
 
 class BiomeType(Enum):
     """Типы биомов (упрощенный список)"""
@@ -17,6 +19,71 @@ class BiomeType(Enum):
     SNOWY_MOUNTAINS = "snowy_mountains"
 
 
+# Порядок биомов для компактного (индексного) представления карт
+BIOME_TYPES = tuple(BiomeType)
+BIOME_INDEX = {biome: index for index, biome in enumerate(BIOME_TYPES)}
+
+_DEEP_OCEAN = BIOME_INDEX[BiomeType.DEEP_OCEAN]
+_COAST = BIOME_INDEX[BiomeType.COAST]
+_BEACH = BIOME_INDEX[BiomeType.BEACH]
+_PLAINS = BIOME_INDEX[BiomeType.PLAINS]
+_FOREST = BIOME_INDEX[BiomeType.FOREST]
+_MOUNTAINS = BIOME_INDEX[BiomeType.MOUNTAINS]
+_SNOWY_MOUNTAINS = BIOME_INDEX[BiomeType.SNOWY_MOUNTAINS]
+
+_BIOME_OBJECTS = np.array(BIOME_TYPES, dtype=object)
+
+
+def encode_biomes(biomes) -> np.ndarray:
+    """Преобразование карты биомов (BiomeType или индексы) в индексы uint8"""
+    if isinstance(biomes, BiomeMapView):
+        return biomes.indices
+    
+    biomes = np.asarray(biomes)
+    if biomes.dtype == object:
+        lookup = np.vectorize(BIOME_INDEX.__getitem__, otypes=[np.uint8])
+        return lookup(biomes) if biomes.size else biomes.astype(np.uint8)
+    return biomes.astype(np.uint8, copy=False)
+
+
+def decode_biomes(indices: np.ndarray) -> np.ndarray:
+    """Преобразование индексов в массив объектов BiomeType"""
+    return _BIOME_OBJECTS[indices]
+
+
+class BiomeMapView:
+    """
+    Ленивое представление индексной карты биомов через BiomeType
+    
+    Хранит только ссылку на массив индексов; объекты BiomeType создаются
+    при обращении к клеткам (view[y][x], view[y, x]) или через to_objects().
+    """
+    
+    def __init__(self, indices: np.ndarray):
+        self.indices = indices
+    
+    @property
+    def shape(self):
+        return self.indices.shape
+    
+    def __len__(self):
+        return len(self.indices)
+    
+    def __getitem__(self, key):
+        value = self.indices[key]
+        if np.ndim(value) == 0:
+            return BIOME_TYPES[value]
+        return BiomeMapView(value)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def to_objects(self) -> np.ndarray:
+        """Полный массив объектов BiomeType (dtype=object)"""
+        return decode_biomes(self.indices)
+
+
 class BiomeSystem:
     """Система управления биомами"""
     
@@ -47,6 +114,20 @@ class BiomeSystem:
     def get_biome_name(self, biome_type: BiomeType) -> str:
         return self.biome_names.get(biome_type, "Неизвестно")
     
+    def palette(self) -> np.ndarray:
+        """
+        Палитра биомов в порядке BIOME_TYPES
+        
+        Returns:
+            Массив RGB формы (len(BIOME_TYPES), 3), dtype uint8;
+            карта в цветах: palette()[biome_indices]
+        """
+        colors = [self.get_biome_color(biome).lstrip('#') for biome in BIOME_TYPES]
+        return np.array(
+            [[int(color[i:i + 2], 16) for i in (0, 2, 4)] for color in colors],
+            dtype=np.uint8
+        )
+    
     def classify_biome(self, elevation: float, moisture: float, temperature: float, 
                       water_level: float = -0.3, mountain_level: float = 0.4,
                       desert_moisture: float = 0.3, forest_moisture: float = 0.6) -> BiomeType:
@@ -136,4 +217,78 @@ class BiomeSystem:
             if temperature < 0.5:
                 return BiomeType.SNOWY_MOUNTAINS
             else:
-                return BiomeType.MOUNTAINS
\ No newline at end of file
+                return BiomeType.MOUNTAINS
+    
+    def classify_biome_grid(self, elevation, moisture, temperature,
+                            water_level=-0.3, mountain_level=0.4,
+                            desert_moisture=0.3, forest_moisture=0.6) -> np.ndarray:
+        """
+        Векторная классификация биомов для целых массивов
+        
+        Повторяет дерево решений classify_biome (результат совпадает
+        поклеточно), но вычисляет его через np.select. Все аргументы,
+        включая пороги, могут быть скалярами или массивами с общей формой
+        после broadcasting.
+        
+        Returns:
+            Массив индексов BIOME_TYPES (uint8)
+        """
+        e, m, t, wl, ml, dm, fm = np.broadcast_arrays(
+            *(np.asarray(v, dtype=np.float64) for v in (
+                elevation, moisture, temperature,
+                water_level, mountain_level, desert_moisture, forest_moisture
+            ))
+        )
+        
+        # Ветви if/elif в том же порядке: np.select берет первое совпадение
+        lowland = e < 0.1
+        midland = e < 0.3
+        highland = e < ml
+        
+        conditions = [
+            # Водные биомы
+            e < wl,
+            e < wl + 0.15,
+            e < wl + 0.25,
+            # Низменности
+            lowland & (m > 0.65),
+            lowland & (m < dm) & (t > 0.7),
+            lowland & (m < dm),
+            lowland & (t > 0.8) & (m > 0.5),
+            lowland,
+            # Средние высоты
+            midland & (m > fm),
+            midland & (m > dm + 0.1),
+            midland & (m < dm) & (t > 0.6),
+            midland,
+            # Высокие горы
+            highland & (t < 0.4) & (e > ml - 0.1),
+            highland & (t < 0.4),
+            highland & (t < 0.6) & (e > ml - 0.15),
+            highland & (t < 0.6),
+            highland,
+            # Очень высокие горы
+            t < 0.5,
+        ]
+        choices = [
+            _DEEP_OCEAN,
+            _COAST,
+            _BEACH,
+            _FOREST,
+            _BEACH,
+            _PLAINS,
+            _FOREST,
+            _PLAINS,
+            _FOREST,
+            _PLAINS,
+            _BEACH,
+            _PLAINS,
+            _SNOWY_MOUNTAINS,
+            _MOUNTAINS,
+            _MOUNTAINS,
+            _PLAINS,
+            _MOUNTAINS,
+            _SNOWY_MOUNTAINS,
+        ]
+        
+        return np.select(conditions, choices, default=_MOUNTAINS).astype(np.uint8)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Цветовые карты (таблицы цветов) для отображения слоев карты
+
+Каждая цветовая карта - таблица из LUT_SIZE цветов RGB. Слой (высоты,
+температура, влажность, ...) регистрируется со своей цветовой картой и
+диапазоном значений; раскраска всей карты - одно индексирование таблицы.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+# Число цветов в таблице
+LUT_SIZE = 256
+
+# Зарегистрированные цветовые карты: имя -> таблица (LUT_SIZE, 3) uint8
+_COLORMAPS: Dict[str, np.ndarray] = {}
+
+# Слои: имя слоя -> (имя цветовой карты, диапазон значений или None)
+_LAYERS: Dict[str, Tuple[str, Optional[Tuple[float, float]]]] = {}
+
+
+def register_colormap(name: str, colors) -> np.ndarray:
+    """
+    Регистрация цветовой карты
+    
+    Args:
+        name: Имя цветовой карты
+        colors: Таблица RGB формы (LUT_SIZE, 3) или функция, получающая
+            массив позиций 0..1 и возвращающая цвета RGB (0..255) для них
+    
+    Returns:
+        Таблица цветов (только для чтения)
+    """
+    if callable(colors):
+        colors = colors(np.linspace(0.0, 1.0, LUT_SIZE))
+    
+    lut = np.clip(np.round(np.asarray(colors, dtype=np.float64)), 0, 255).astype(np.uint8)
+    if lut.shape != (LUT_SIZE, 3):
+        raise ValueError(f"Таблица цветов должна иметь форму ({LUT_SIZE}, 3), а не {lut.shape}")
+    
+    lut.flags.writeable = False
+    _COLORMAPS[name] = lut
+    return lut
+
+
+def get_colormap(name: str) -> np.ndarray:
+    """Таблица цветов по имени"""
+    if name not in _COLORMAPS:
+        raise KeyError(f"Неизвестная цветовая карта: {name}")
+    return _COLORMAPS[name]
+
+
+def register_layer(layer: str, colormap: str,
+                   value_range: Optional[Tuple[float, float]] = None):
+    """
+    Назначение цветовой карты слою
+    
+    Args:
+        layer: Имя слоя
+        colormap: Имя зарегистрированной цветовой карты
+        value_range: Диапазон значений слоя (min, max); None - растягивать
+            по фактическим min/max данных
+    """
+    get_colormap(colormap)
+    _LAYERS[layer] = (colormap, value_range)
+
+
+def lut_indices(values, value_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Индексы таблицы цветов для массива значений
+    
+    Значения приводятся к 0..1 по value_range (или по min/max данных,
+    вычисленным один раз) и отображаются на 0..LUT_SIZE-1.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if value_range is None:
+        low, high = (float(np.min(values)), float(np.max(values))) if values.size else (0.0, 1.0)
+    else:
+        low, high = value_range
+    
+    if high > low:
+        normalized = (values - low) / (high - low)
+    else:
+        normalized = np.full(values.shape, 0.5)
+    
+    indices = np.trunc(normalized * (LUT_SIZE - 1))
+    return np.clip(indices, 0, LUT_SIZE - 1).astype(np.uint8)
+
+
+def apply_colormap(values, colormap: str,
+                   value_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Раскраска массива значений цветовой картой
+    
+    Returns:
+        Массив RGB формы values.shape + (3,), dtype uint8
+    """
+    return get_colormap(colormap)[lut_indices(values, value_range)]
+
+
+def colorize_layer(layer: str, values) -> np.ndarray:
+    """Раскраска слоя его зарегистрированной цветовой картой"""
+    if layer not in _LAYERS:
+        raise KeyError(f"Для слоя {layer} не назначена цветовая карта")
+    colormap, value_range = _LAYERS[layer]
+    return apply_colormap(values, colormap, value_range)
+
+
+def _grayscale(t: np.ndarray) -> np.ndarray:
+    """Градации серого"""
+    gray = t * 255
+    return np.stack([gray, gray, gray], axis=-1)
+
+
+def _temperature(t: np.ndarray) -> np.ndarray:
+    """Синий -> голубой -> желтый -> красный"""
+    cold = t < 0.3
+    mild = ~cold & (t < 0.7)
+    
+    mild_t = (t - 0.3) / 0.4
+    hot_t = (t - 0.7) / 0.3
+    red = np.select([cold, mild], [0.0, 255 * mild_t], 255.0)
+    green = np.select([cold, mild], [255 * t / 0.3, 255.0], 255 * (1 - hot_t))
+    blue = np.select([cold, mild], [255.0, 255 * (1 - mild_t)], 0.0)
+    return np.stack([red, green, blue], axis=-1)
+
+
+def _moisture(t: np.ndarray) -> np.ndarray:
+    """Сухая земля (коричневый) -> зелень -> вода (синий)"""
+    stops = np.array([0.0, 0.5, 1.0])
+    colors = np.array([
+        [153, 102, 51],     # Коричневый
+        [102, 204, 102],    # Зеленый
+        [0, 51, 204],       # Синий
+    ], dtype=np.float64)
+    return np.stack([np.interp(t, stops, colors[:, i]) for i in range(3)], axis=-1)
+
+
+# Стандартные цветовые карты и слои
+register_colormap("grayscale", _grayscale)
+register_colormap("temperature", _temperature)
+register_colormap("moisture", _moisture)
+
+register_layer("height", "grayscale")
+register_layer("temperature", "temperature", (0.0, 1.0))
+register_layer("moisture", "moisture", (0.0, 1.0))
@@ -0,0 +1,152 @@
+"""
+Дерево решений в виде плоских массивов
+
+Дерево хранится массивами feature/threshold/left/right/value и
+вычисляется NumPy по уровням: на каждом уровне все клетки сетки делают
+один шаг вниз одновременно. Для вычисления нужен только NumPy; sklearn
+нужен лишь при построении дерева (дистилляции леса).
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+# Версия формата файла дерева
+COMPILED_TREE_VERSION = 1
+
+
+class CompiledTree:
+    """
+    Дерево решений в плоских массивах
+    
+    Узел i: если x[feature[i]] <= threshold[i], переход в left[i], иначе в
+    right[i]. Листья ссылаются сами на себя (threshold = +inf), поэтому
+    вычисление - ровно depth шагов без проверок на окончание. value[i] -
+    результат листа (индекс BIOME_TYPES).
+    """
+    
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray,
+                 left: np.ndarray, right: np.ndarray, value: np.ndarray,
+                 depth: Optional[int] = None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.uint8)
+        self.depth = int(depth) if depth is not None else self._measure_depth()
+    
+    @property
+    def node_count(self) -> int:
+        return len(self.feature)
+    
+    @property
+    def nbytes(self) -> int:
+        """Размер массивов дерева в байтах"""
+        return sum(a.nbytes for a in (self.feature, self.threshold,
+                                      self.left, self.right, self.value))
+    
+    def _measure_depth(self) -> int:
+        """Глубина дерева (число переходов от корня до самого глубокого листа)"""
+        depth = 0
+        level = np.array([0])
+        while True:
+            internal = level[self.left[level] != level]
+            if len(internal) == 0:
+                return depth
+            level = np.concatenate([self.left[internal], self.right[internal]])
+            depth += 1
+    
+    @classmethod
+    def from_sklearn(cls, estimator, class_values: Sequence[int]) -> 'CompiledTree':
+        """
+        Преобразование обученного sklearn DecisionTreeClassifier
+        
+        Args:
+            estimator: Обученное дерево
+            class_values: Результат для каждого класса дерева (например,
+                индекс BIOME_TYPES для каждого номера класса)
+        """
+        tree = estimator.tree_
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        feature = tree.feature.astype(np.int32)
+        threshold = tree.threshold.astype(np.float64)
+        
+        # Листья: переход в себя при любом значении признака
+        leaves = left < 0
+        nodes = np.arange(tree.node_count, dtype=np.int32)
+        left[leaves] = nodes[leaves]
+        right[leaves] = nodes[leaves]
+        feature[leaves] = 0
+        threshold[leaves] = np.inf
+        
+        class_values = np.asarray(class_values, dtype=np.uint8)
+        value = class_values[np.argmax(tree.value[:, 0, :], axis=1)]
+        return cls(feature, threshold, left, right, value, depth=tree.max_depth)
+    
+    def predict(self, X) -> np.ndarray:
+        """
+        Результаты листьев для матрицы признаков X формы (n, n_features)
+        
+        Признаки сравниваются в float32, как в sklearn, поэтому дерево,
+        полученное from_sklearn, дает те же ответы, что и исходное.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int32)
+        
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        
+        return self.value[node]
+    
+    def save(self, path: str):
+        """Сохранение дерева в .npz"""
+        np.savez_compressed(
+            path, version=COMPILED_TREE_VERSION, depth=self.depth,
+            feature=self.feature, threshold=self.threshold,
+            left=self.left, right=self.right, value=self.value
+        )
+    
+    @classmethod
+    def load(cls, path: str) -> 'CompiledTree':
+        """Загрузка дерева из .npz"""
+        with np.load(path) as data:
+            version = int(data['version'])
+            if version != COMPILED_TREE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия дерева: {version}")
+            return cls(data['feature'], data['threshold'], data['left'],
+                       data['right'], data['value'], depth=int(data['depth']))
+
+
+def distill_forest(teacher_predict, X: np.ndarray, class_values: Sequence[int],
+                   max_depth: int = 24, min_samples_leaf: int = 1,
+                   random_state: int = 42) -> CompiledTree:
+    """
+    Дистилляция ансамбля в одно дерево
+    
+    Дерево обучается на ответах учителя (а не на исходных метках), чтобы
+    повторять его решения.
+    
+    Args:
+        teacher_predict: Функция X -> номера классов учителя
+        X: Признаки для дистилляции (исходные, без масштабирования:
+            дереву масштаб не нужен)
+        class_values: Результат для каждого номера класса
+        max_depth: Максимальная глубина дерева
+    """
+    from sklearn.tree import DecisionTreeClassifier
+    
+    labels = teacher_predict(X)
+    student = DecisionTreeClassifier(
+        max_depth=max_depth,
+        min_samples_leaf=min_samples_leaf,
+        random_state=random_state
+    )
+    student.fit(X, labels)
+    
+    # Номера классов дерева -> номера классов учителя -> результат
+    class_values = np.asarray(class_values, dtype=np.uint8)
+    return CompiledTree.from_sklearn(student, class_values[student.classes_.astype(np.intp)])
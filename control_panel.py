@@ -31,6 +31,14 @@ class ControlPanel:
         self.roughness_var = tk.DoubleVar(value=0.6)
         self.seed_var = tk.StringVar(value="0")
         
+        # Допустимые размеры карты (диапазоны Spinbox)
+        self.size_limits = {'width': (20, 300), 'height': (20, 200)}
+        # Последние примененные значения полей ввода: изменения в полях
+        # применяются по Enter, уходу фокуса или стрелкам Spinbox
+        self._applied = {'width': 90, 'height': 60, 'seed': "0"}
+        # Параметры устанавливаются программно (set_params) - без перезапуска
+        self._loading = False
+        
         # Пресеты
         self.presets = {
             "Архипелаг": (0.9, 0.2, 0.1, 0.3, 0.6),
@@ -87,13 +95,21 @@ class ControlPanel:
         
         # Ширина
         ttk.Label(grid, text="Ширина:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=3)
-        ttk.Spinbox(grid, from_=20, to=300, textvariable=self.width_var, width=10
-                   ).grid(row=0, column=1, padx=5, pady=3, sticky=tk.W)
+        low, high = self.size_limits['width']
+        width_spinbox = ttk.Spinbox(grid, from_=low, to=high, textvariable=self.width_var,
+                                    width=10, command=self.commit_inputs)
+        width_spinbox.grid(row=0, column=1, padx=5, pady=3, sticky=tk.W)
         
         # Высота
         ttk.Label(grid, text="Высота:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=3)
-        ttk.Spinbox(grid, from_=20, to=200, textvariable=self.height_var, width=10
-                   ).grid(row=1, column=1, padx=5, pady=3, sticky=tk.W)
+        low, high = self.size_limits['height']
+        height_spinbox = ttk.Spinbox(grid, from_=low, to=high, textvariable=self.height_var,
+                                     width=10, command=self.commit_inputs)
+        height_spinbox.grid(row=1, column=1, padx=5, pady=3, sticky=tk.W)
+        
+        for widget in (width_spinbox, height_spinbox):
+            widget.bind('<Return>', lambda e: self.commit_inputs())
+            widget.bind('<FocusOut>', lambda e: self.commit_inputs())
     
     def create_gen_params_section(self):
         """Создание секции параметров генерации"""
@@ -123,6 +139,8 @@ class ControlPanel:
         ttk.Label(grid, text="Seed:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=3)
         seed_entry = ttk.Entry(grid, textvariable=self.seed_var, width=15)
         seed_entry.grid(row=2, column=1, padx=5, pady=3, sticky=tk.W)
+        seed_entry.bind('<Return>', lambda e: self.commit_inputs())
+        seed_entry.bind('<FocusOut>', lambda e: self.commit_inputs())
         ttk.Button(grid, text="Случайный", command=self.generate_random_seed, width=10
                   ).grid(row=2, column=2, padx=5, pady=3)
         
@@ -192,6 +210,13 @@ class ControlPanel:
         self.desert_var.trace('w', lambda *args: self.update_desert_label())
         self.forest_var.trace('w', lambda *args: self.update_forest_label())
         self.temperature_var.trace('w', lambda *args: self.update_temperature_label())
+        
+        # Перезапуск текущей генерации при изменении ползунков и флажка ML
+        # (поля ввода применяются в commit_inputs)
+        for var in (self.scale_var, self.roughness_var, self.use_ml_var,
+                    self.water_var, self.mountain_var, self.desert_var,
+                    self.forest_var, self.temperature_var):
+            var.trace('w', lambda *args: self._on_var_changed())
     
     def create_presets_section(self):
         """Создание секции пресетов"""
@@ -233,6 +258,12 @@ class ControlPanel:
         
         ttk.Button(btn_frame, text="Экспорт в PNG", 
                   command=self.app.export_current_map).pack(pady=5, fill=tk.X)
+        
+        ttk.Button(btn_frame, text="Сохранить карту", 
+                  command=self.app.save_current_map).pack(pady=5, fill=tk.X)
+        
+        ttk.Button(btn_frame, text="Открыть карту", 
+                  command=self.app.open_map).pack(pady=5, fill=tk.X)
     
     def create_legend_section(self):
         """Создание упрощенной секции легенды биомов"""
@@ -330,15 +361,97 @@ class ControlPanel:
         """Генерация случайного seed"""
         seed = random.randint(1, 1000000)
         self.seed_var.set(str(seed))
+        self.commit_inputs()
+    
+    def read_inputs(self):
+        """
+        Проверка полей ввода размеров и seed
+        
+        Пустые, нечисловые и выходящие за диапазон Spinbox значения
+        заменяются в полях последними примененными.
+        
+        Returns:
+            Словарь width, height, seed (строка) с корректными значениями
+        """
+        values = dict(self._applied)
+        
+        for name, var, title in (('width', self.width_var, "Ширина"),
+                                 ('height', self.height_var, "Высота")):
+            low, high = self.size_limits[name]
+            try:
+                value = int(var.get())
+            except (tk.TclError, ValueError):
+                value = None
+            
+            # Размер открытой карты (set_params) может быть вне диапазона
+            if value is not None and (low <= value <= high or value == self._applied[name]):
+                values[name] = value
+            else:
+                var.set(self._applied[name])
+                self.status_bar.set_error(f"{title} карты должна быть от {low} до {high}")
+        
+        seed_str = self.seed_var.get().strip()
+        if not seed_str or seed_str.isdigit():
+            values['seed'] = seed_str
+        else:
+            self.seed_var.set(self._applied['seed'])
+            self.status_bar.set_error("Seed должен быть неотрицательным целым числом")
+        
+        return values
+    
+    def _on_var_changed(self):
+        """Изменение ползунка или флажка ML"""
+        if not self._loading:
+            self.app.on_params_changed()
+    
+    def set_params(self, params, biome_params):
+        """
+        Установка параметров в элементы управления без перезапуска генерации
+        
+        Args:
+            params: Параметры генерации (как get_generation_params;
+                отсутствующие ключи не меняются)
+            biome_params: Параметры биомов (как get_biome_params)
+        """
+        variables = {
+            'width': self.width_var, 'height': self.height_var,
+            'scale': self.scale_var, 'roughness': self.roughness_var,
+            'use_ml': self.use_ml_var,
+            'water': self.water_var, 'mountain': self.mountain_var,
+            'desert': self.desert_var, 'forest': self.forest_var,
+            'temperature': self.temperature_var,
+        }
+        
+        self._loading = True
+        try:
+            for name, value in list(params.items()) + list(biome_params.items()):
+                if name == 'seed':
+                    self.seed_var.set(str(value) if value is not None else "0")
+                elif name in variables and value is not None:
+                    variables[name].set(value)
+        finally:
+            self._loading = False
+        
+        self._applied = {'width': int(self.width_var.get()),
+                         'height': int(self.height_var.get()),
+                         'seed': self.seed_var.get().strip()}
+    
+    def commit_inputs(self):
+        """Применение полей ввода (Enter, уход фокуса, стрелки Spinbox)"""
+        values = self.read_inputs()
+        if values != self._applied:
+            self._applied = values
+            self.app.on_params_changed()
     
     def get_generation_params(self):
         """Получение параметров генерации"""
-        seed_str = self.seed_var.get().strip()
-        seed = int(seed_str) if seed_str and seed_str != "0" else None
+        self._applied = self.read_inputs()
+        seed_str = self._applied['seed']
+        seed = int(seed_str) if seed_str and int(seed_str) != 0 else None
         
         return {
-            'width': self.width_var.get(),
-            'height': self.height_var.get(),
+            'width': self._applied['width'],
+            'height': self._applied['height'],
             'scale': self.scale_var.get(),
             'roughness': self.roughness_var.get(),
             'seed': seed,
@@ -387,7 +500,7 @@ class ControlPanel:
             elif isinstance(widget, (ttk.Frame, ttk.LabelFrame)):
                 # Рекурсивно ищем кнопки во вложенных фреймах
                 self._set_buttons_state_recursive(widget, enabled)
-
+    
     def _set_buttons_state_recursive(self, parent, enabled):
         """Рекурсивное изменение состояния кнопок"""
         for widget in parent.winfo_children():
@@ -6,6 +6,9 @@ import tkinter as tk
 from tkinter import ttk
 import numpy as np
 
+from colormaps import colorize_layer
+from profiling import timed, format_stats
+
 
 class DisplayPanel:
     """
@@ -21,9 +24,13 @@ class DisplayPanel:
         self.terrain_canvas = None
         self.height_canvas = None
         self.temp_canvas = None
+        self.moisture_canvas = None
         self.stats_text = None
         self.ml_text = None
         
+        # Изображения канвасов: канвас -> {rgb, photo, size, item}
+        self._images = {}
+        
         self.setup_panel()
     
     def setup_panel(self):
@@ -36,6 +43,7 @@ class DisplayPanel:
         self.create_terrain_tab()
         self.create_height_tab()
         self.create_temperature_tab()
+        self.create_moisture_tab()
         self.create_stats_tab()
         self.create_ml_tab()
     
@@ -47,6 +55,7 @@ class DisplayPanel:
         self.terrain_canvas = tk.Canvas(terrain_tab, bg='white', 
                                        highlightthickness=0)
         self.terrain_canvas.pack(fill=tk.BOTH, expand=True)
+        self._bind_resize(self.terrain_canvas)
     
     def create_height_tab(self):
         """Создание вкладки с картой высот"""
@@ -56,6 +65,7 @@ class DisplayPanel:
         self.height_canvas = tk.Canvas(height_tab, bg='white',
                                       highlightthickness=0)
         self.height_canvas.pack(fill=tk.BOTH, expand=True)
+        self._bind_resize(self.height_canvas)
     
     def create_temperature_tab(self):
         """Создание вкладки с картой температуры"""
@@ -65,6 +75,17 @@ class DisplayPanel:
         self.temp_canvas = tk.Canvas(temp_tab, bg='white',
                                     highlightthickness=0)
         self.temp_canvas.pack(fill=tk.BOTH, expand=True)
+        self._bind_resize(self.temp_canvas)
+    
+    def create_moisture_tab(self):
+        """Создание вкладки с картой влажности"""
+        moisture_tab = ttk.Frame(self.notebook)
+        self.notebook.add(moisture_tab, text="Карта влажности")
+        
+        self.moisture_canvas = tk.Canvas(moisture_tab, bg='white',
+                                        highlightthickness=0)
+        self.moisture_canvas.pack(fill=tk.BOTH, expand=True)
+        self._bind_resize(self.moisture_canvas)
     
     def create_stats_tab(self):
         """Создание вкладки со статистикой"""
@@ -113,45 +134,71 @@ class DisplayPanel:
         if terrain_data is None or map_gen is None:
             return
         
-        self._draw_map(
-            self.terrain_canvas,
-            terrain_data,
-            map_gen,
-            lambda x, y, elevation, gen: gen.get_terrain_color(
-                gen.classify_terrain(elevation, x, y, terrain_data)
-            )
-        )
+        self._show_image(self.terrain_canvas, map_gen.render_rgb(terrain_data))
     
     def draw_height_map(self, terrain_data, map_gen):
         """Отрисовка карты высот"""
         if terrain_data is None:
             return
         
-        self._draw_map(
-            self.height_canvas,
-            terrain_data,
-            map_gen,
-            lambda x, y, elevation, gen: self._height_to_color(elevation, terrain_data)
-        )
+        self._show_image(self.height_canvas, colorize_layer("height", terrain_data))
     
     def draw_temperature_map(self, temperature_data, map_gen):
         """Отрисовка карты температуры"""
         if temperature_data is None:
             return
         
-        self._draw_map(
-            self.temp_canvas,
-            temperature_data,
-            map_gen,
-            lambda x, y, temperature, gen: self._temperature_to_color(temperature)
-        )
+        self._show_image(self.temp_canvas, colorize_layer("temperature", temperature_data))
+    
+    def draw_moisture_map(self, moisture_data, map_gen):
+        """Отрисовка карты влажности"""
+        if moisture_data is None:
+            return
+        
+        self._show_image(self.moisture_canvas, colorize_layer("moisture", moisture_data))
+    
+    @timed("display.show_layers")
+    def show_layers(self, images):
+        """
+        Вывод заранее подготовленных изображений слоев
+        
+        Args:
+            images: Словарь слой -> RGB массив; слои: 'terrain', 'height',
+                'temperature', 'moisture'
+        """
+        canvases = {
+            'terrain': self.terrain_canvas,
+            'height': self.height_canvas,
+            'temperature': self.temp_canvas,
+            'moisture': self.moisture_canvas,
+        }
+        for layer, rgb in images.items():
+            if layer in canvases and rgb is not None:
+                self._show_image(canvases[layer], rgb)
+    
+    def _bind_resize(self, canvas):
+        """Перерисовка изображения при изменении размеров канваса"""
+        canvas.bind('<Configure>', lambda event, c=canvas: self._blit(c))
     
-    def _draw_map(self, canvas, data, map_gen, color_func):
-        """Общий метод отрисовки карты"""
-        if data is None or map_gen is None:
+    def _show_image(self, canvas, rgb):
+        """Вывод новой RGB карты (height, width, 3) на канвас"""
+        self._images[canvas] = {'rgb': np.ascontiguousarray(rgb, dtype=np.uint8)}
+        self._blit(canvas)
+    
+    @timed("display.blit")
+    def _blit(self, canvas):
+        """
+        Вывод изображения карты одним элементом канваса
+        
+        Масштабированное изображение кэшируется: пока размер клетки не
+        меняется, при перерисовке только обновляется положение элемента.
+        """
+        image = self._images.get(canvas)
+        if image is None:
             return
         
-        canvas.delete("all")
+        rgb = image['rgb']
+        map_height, map_width = rgb.shape[:2]
         
         # Размеры канваса
         canvas_width = canvas.winfo_width()
@@ -161,72 +208,44 @@ class DisplayPanel:
             canvas_width = 600
             canvas_height = 400
         
-        # Размер клетки
-        cell_width = canvas_width / map_gen.width
-        cell_height = canvas_height / map_gen.height
-        cell_size = min(cell_width, cell_height)
-        
-        # Смещение для центрирования
-        offset_x = (canvas_width - cell_size * map_gen.width) / 2
-        offset_y = (canvas_height - cell_size * map_gen.height) / 2
-        
-        # Отрисовка клеток (оптимизированная - без сетки)
-        for y in range(map_gen.height):
-            for x in range(map_gen.width):
-                value = data[y][x]
-                color = color_func(x, y, value, map_gen)
-                
-                # Координаты клетки
-                x1 = offset_x + x * cell_size
-                y1 = offset_y + y * cell_size
-                x2 = x1 + cell_size
-                y2 = y1 + cell_size
-                
-                # Рисуем клетку без обводки для скорости
-                canvas.create_rectangle(x1, y1, x2, y2, 
-                                      fill=color, outline="", width=0)
-    
-    def _height_to_color(self, elevation, terrain_data):
-        """Преобразование высоты в цвет (градации серого)"""
-        min_height = np.min(terrain_data)
-        max_height = np.max(terrain_data)
-        height_range = max_height - min_height
-        
-        if height_range > 0:
-            normalized = (elevation - min_height) / height_range
-        else:
-            normalized = 0.5
+        # Размер клетки и изображения
+        cell_size = min(canvas_width / map_width, canvas_height / map_height)
+        size = (max(1, round(cell_size * map_width)), max(1, round(cell_size * map_height)))
         
-        gray_value = int(normalized * 255)
-        return f'#{gray_value:02x}{gray_value:02x}{gray_value:02x}'
-    
-    def _temperature_to_color(self, temperature):
-        """Преобразование температуры в цвет (упрощенная версия)"""
-        # Упрощенный градиент для производительности
-        if temperature < 0.3:
-            # От синего к голубому
-            blue = 255
-            green = int(255 * temperature / 0.3)
-            red = 0
-        elif temperature < 0.7:
-            # От голубого к желтому
-            normalized = (temperature - 0.3) / 0.4
-            red = int(255 * normalized)
-            green = 255
-            blue = int(255 * (1 - normalized))
+        if image.get('size') != size:
+            image['photo'] = self._make_photo(canvas, self._scale_rgb(rgb, size))
+            image['size'] = size
+        
+        # Центрирование
+        center = (canvas_width / 2, canvas_height / 2)
+        item = image.get('item')
+        if item is None or not canvas.find_withtag(item):
+            canvas.delete("all")
+            image['item'] = canvas.create_image(*center, image=image['photo'], anchor=tk.CENTER)
         else:
-            # От желтого к красному
-            normalized = (temperature - 0.7) / 0.3
-            red = 255
-            green = int(255 * (1 - normalized))
-            blue = 0
-        
-        # Ограничиваем значения
-        red = max(0, min(255, red))
-        green = max(0, min(255, green))
-        blue = max(0, min(255, blue))
-        
-        return f'#{red:02x}{green:02x}{blue:02x}'
+            canvas.itemconfigure(item, image=image['photo'])
+            canvas.coords(item, *center)
+    
+    @staticmethod
+    def _scale_rgb(rgb, size):
+        """Масштабирование методом ближайшего соседа до size = (ширина, высота)"""
+        width, height = size
+        map_height, map_width = rgb.shape[:2]
+        if (width, height) == (map_width, map_height):
+            return rgb
+        
+        rows = np.arange(height) * map_height // height
+        cols = np.arange(width) * map_width // width
+        return rgb[rows[:, None], cols[None, :]]
+    
+    @staticmethod
+    def _make_photo(canvas, rgb):
+        """PhotoImage из RGB массива (через двоичный PPM)"""
+        height, width = rgb.shape[:2]
+        header = f'P6 {width} {height} 255 '.encode('ascii')
+        return tk.PhotoImage(master=canvas, width=width, height=height,
+                             data=header + np.ascontiguousarray(rgb).tobytes(),
+                             format='PPM')
     
     def update_stats(self, stats):
         """Обновление статистики"""
@@ -269,6 +288,11 @@ class DisplayPanel:
         if ml_stats.get('enabled'):
             text += f"\nML: {ml_stats.get('ml_percent', 0):.1f}%\n"
         
+        profile = stats.get('profile')
+        if profile:
+            text += "\nВремя этапов:\n"
+            text += format_stats(profile)
+        
         return text
     
     def update_ml_info(self, info_text):
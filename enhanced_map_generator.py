@@ -3,13 +3,16 @@
 Расширенный генератор карт с дополнительными параметрами и ML поддержкой
 """
 
+import copy
 import numpy as np
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, Iterator
 
 from map_generator import MapGenerator
-from biomes import BiomeType
-from noise_generator import ImprovedNoiseGenerator
-from ml_biome_classifier import MLBiomeClassifier  # <-- ИМПОРТ МЛ МОДУЛЯ
+from biomes import BiomeType, BiomeMapView, BIOME_TYPES
+from noise_generator import ImprovedNoiseGenerator, NoisePyramid
+from ml_biome_classifier import UNKNOWN_BIOME_INDEX, BIOME_LABELS
+from model_registry import get_registry  # <-- ИМПОРТ МЛ МОДУЛЯ
+from profiling import stage, timed
 
 
 class EnhancedMapGenerator(MapGenerator):
@@ -17,7 +20,35 @@ class EnhancedMapGenerator(MapGenerator):
     Расширенный генератор с дополнительными параметрами и ML классификацией
     """
     
-    def __init__(self, width=60, height=40, use_ml: bool = True):
+    # Слои шума климата (общая таблица перестановок с рельефом, слой 0)
+    MOISTURE_LAYER = 1
+    TEMPERATURE_LAYER = 2
+    
+    # Старые типы местности для биомов (в порядке BIOME_TYPES)
+    BIOME_TERRAIN = tuple({
+        BiomeType.DEEP_OCEAN: "deep_water",
+        BiomeType.COAST: "water",
+        BiomeType.BEACH: "sand",
+        BiomeType.PLAINS: "grass",
+        BiomeType.FOREST: "forest",
+        BiomeType.MOUNTAINS: "mountain",
+        BiomeType.SNOWY_MOUNTAINS: "snow",
+    }[biome] for biome in BIOME_TYPES)
+    
+    # Пресеты биомов: (вода, горы, пустыни, леса, температура)
+    PRESETS = {
+        "Архипелаг": (0.9, 0.2, 0.1, 0.3, 0.6),
+        "Пустыня": (0.1, 0.2, 0.9, 0.1, 0.8),
+        "Леса": (0.3, 0.2, 0.1, 0.9, 0.5),
+        "Горы": (0.3, 0.9, 0.2, 0.3, 0.3),
+        "Континент": (0.5, 0.5, 0.3, 0.6, 0.5),
+        "Джунгли": (0.6, 0.1, 0.1, 0.8, 0.8),
+    }
+    
+    # Пороги высоты резервной классификации (между типами BIOME_TERRAIN)
+    TERRAIN_THRESHOLDS = (-0.5, -0.15, 0.0, 0.25, 0.45, 0.7)
+    
+    def __init__(self, width=60, height=40, use_ml: bool = True, auto_train: bool = True):
         super().__init__(width, height)
         self.moisture_data = None
         self.temperature_data = None
@@ -31,11 +62,26 @@ class EnhancedMapGenerator(MapGenerator):
         self.forest_amount = 0.6
         self.temperature_amount = 0.5
         
-        # ML классификатор
+        # Тип данных карт влажности и температуры (np.float64 или np.float32)
+        self.climate_dtype = np.float64
+        
+        # ML классификатор: общий для процесса, модель загружается один раз;
+        # недостающая модель обучается в фоне (см. ModelRegistry)
         self.use_ml = use_ml
-        self.ml_classifier = MLBiomeClassifier(use_ml=use_ml, auto_train=True)
+        if use_ml:
+            self.ml_classifier = get_registry().ensure_model(auto_train=auto_train)
+        else:
+            self.ml_classifier = get_registry().classifier(load=False)
         self.ml_accuracy = None
-        self.ml_enabled = use_ml and self.ml_classifier.is_trained
+    
+    @property
+    def ml_enabled(self) -> bool:
+        """Используется ли ML (включен и модель обучена)"""
+        return self.use_ml and self.ml_classifier.is_trained
+    
+    @ml_enabled.setter
+    def ml_enabled(self, enabled: bool):
+        self.use_ml = enabled
     
     def adjust_water_amount(self, amount: float):
         """Переопределяем для сохранения значения water_amount"""
@@ -64,73 +110,133 @@ class EnhancedMapGenerator(MapGenerator):
     def set_ml_enabled(self, enabled: bool):
         """Включить/выключить ML классификацию"""
         self.use_ml = enabled
-        self.ml_enabled = enabled and self.ml_classifier.is_trained
         if enabled and not self.ml_classifier.is_trained:
-            print("Предупреждение: ML модель не обучена. Используются правила.")
+            # Модель могла появиться на диске после создания генератора
+            get_registry().classifier(load=True)
+            if not self.ml_classifier.is_trained:
+                print("Предупреждение: ML модель не обучена. Используются правила.")
     
-    def generate_climate_maps(self, scale=8.0) -> Tuple[np.ndarray, np.ndarray]:
-        """Генерация карт влажности и температуры"""
-        moisture_seed = self.seed + 1000
+    def generate_climate_maps(self, scale=8.0, dtype=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Генерация карт влажности и температуры
+        
+        Args:
+            dtype: Тип данных результата (None - self.climate_dtype)
+        """
+        moisture_noise, temperature_noise = self.climate_noise(scale)
+        return self.climate_from_noise(moisture_noise, temperature_noise, dtype)
+    
+    @timed("climate.noise", cells=lambda self, *args, **kwargs: self.width * self.height)
+    def climate_noise(self, scale=8.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Шум влажности и температуры
+        
+        Зависит только от seed, размеров карты и масштаба; настройки биомов
+        применяются позже в climate_from_noise.
+        """
+        moisture_params, temperature_params = self._climate_noise_params(scale)
         moisture_map = ImprovedNoiseGenerator.perlin_noise(
-            width=self.width,
-            height=self.height,
-            scale=scale * 0.7,
-            octaves=3,
-            persistence=0.5,
-            lacunarity=2.0,
-            seed=moisture_seed
+            width=self.width, height=self.height, **moisture_params
         )
-        
-        # Корректируем влажность на основе настроек биомов
-        for y in range(self.height):
-            for x in range(self.width):
-                elevation = self.map_data[y][x] if self.map_data is not None else 0
-                
-                # Увеличиваем влажность в лесах
-                if self.forest_amount > 0.7 and 0.1 < elevation < 0.4:
-                    moisture_map[y][x] = min(1.0, moisture_map[y][x] * 1.3)
-                elif self.forest_amount < 0.3 and 0.1 < elevation < 0.4:
-                    moisture_map[y][x] = max(0.0, moisture_map[y][x] * 0.7)
-                
-                # Уменьшаем влажность для песка/пустынь
-                if self.desert_amount > 0.7 and elevation < 0.2:
-                    moisture_map[y][x] = max(0.0, moisture_map[y][x] * 0.5)
-                elif self.desert_amount < 0.3 and elevation < 0.2:
-                    moisture_map[y][x] = min(1.0, moisture_map[y][x] * 1.2)
-        
-        temperature_seed = self.seed + 2000
         temp_base = ImprovedNoiseGenerator.perlin_noise(
-            width=self.width,
-            height=self.height,
-            scale=scale * 0.5,
-            octaves=2,
-            persistence=0.4,
-            lacunarity=2.0,
-            seed=temperature_seed
+            width=self.width, height=self.height, **temperature_params
         )
         
-        temperature_map = np.zeros((self.height, self.width))
-        for y in range(self.height):
-            lat_factor = 1.0 - abs(y / self.height - 0.5) * 1.5
-            lat_factor = max(0.0, min(1.0, lat_factor))
-            
-            for x in range(self.width):
-                if self.map_data is not None:
-                    height_factor = 1.0 - max(0, self.map_data[y][x]) * 0.8
-                else:
-                    height_factor = 1.0
-                
-                # Базовая температура с учетом настройки пользователя
-                base_temp = (temp_base[y][x] * 0.4 + 
-                            lat_factor * 0.5 + 
-                            height_factor * 0.1)
-                
-                # Применяем глобальную настройку температуры
-                temp_adjustment = (self.temperature_amount - 0.5) * 0.5
-                adjusted_temp = base_temp + temp_adjustment
-                
-                temperature_map[y][x] = max(0.0, min(1.0, adjusted_temp))
+        return moisture_map, temp_base
+    
+    def _climate_noise_params(self, scale: float) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Параметры шума влажности и температуры"""
+        moisture = {'scale': scale * 0.7, 'octaves': 3, 'persistence': 0.5,
+                    'lacunarity': 2.0, 'seed': self.seed, 'layer': self.MOISTURE_LAYER}
+        temperature = {'scale': scale * 0.5, 'octaves': 2, 'persistence': 0.4,
+                       'lacunarity': 2.0, 'seed': self.seed, 'layer': self.TEMPERATURE_LAYER}
+        return moisture, temperature
+    
+    def climate_pyramids(self, scale=8.0) -> Tuple[NoisePyramid, NoisePyramid]:
+        """Шум влажности и температуры с постепенным уточнением (см. terrain_pyramid)"""
+        return tuple(NoisePyramid(self.width, self.height, **params)
+                     for params in self._climate_noise_params(scale))
+    
+    def preview_generator(self, step: int) -> 'EnhancedMapGenerator':
+        """
+        Копия генератора для карты, уменьшенной в step раз
+        
+        Настройки биомов, seed и ML классификатор общие с исходным
+        генератором, слои карты не заполнены.
+        """
+        preview = copy.copy(self)
+        preview.width = -(-self.width // step)
+        preview.height = -(-self.height // step)
+        preview.map_data = None
+        preview.moisture_data = None
+        preview.temperature_data = None
+        preview.biome_data = None
+        preview.ml_predictions = None
+        return preview
+    
+    def climate_from_noise(self, moisture_noise: np.ndarray, temperature_noise: np.ndarray,
+                           dtype=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Карты влажности и температуры из шума с учетом рельефа и настроек биомов"""
+        moisture_map, temperature_map = self._climate_rows(
+            moisture_noise, temperature_noise, self.map_data
+        )
+        return self._finish_climate_maps(moisture_map, temperature_map, dtype)
+    
+    @timed("climate.rows", cells=lambda self, moisture_map, *args, **kwargs: moisture_map.size)
+    def _climate_rows(self, moisture_map: np.ndarray, temp_base: np.ndarray,
+                      terrain: Optional[np.ndarray], row_offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Корректировка влажности и расчет температуры для полосы строк
+        
+        Args:
+            moisture_map: Шум влажности полосы
+            temp_base: Шум температуры полосы
+            terrain: Рельеф полосы или None
+            row_offset: Номер первой строки полосы на карте (для широты)
+        """
+        rows, cols = moisture_map.shape
+        elevation = terrain if terrain is not None else np.zeros((rows, cols))
+        
+        # Корректируем влажность на основе настроек биомов
+        # Увеличиваем влажность в лесах
+        forest_band = (0.1 < elevation) & (elevation < 0.4)
+        if self.forest_amount > 0.7:
+            moisture_map = np.where(forest_band, np.minimum(1.0, moisture_map * 1.3), moisture_map)
+        elif self.forest_amount < 0.3:
+            moisture_map = np.where(forest_band, np.maximum(0.0, moisture_map * 0.7), moisture_map)
+        
+        # Уменьшаем влажность для песка/пустынь
+        lowland = elevation < 0.2
+        if self.desert_amount > 0.7:
+            moisture_map = np.where(lowland, np.maximum(0.0, moisture_map * 0.5), moisture_map)
+        elif self.desert_amount < 0.3:
+            moisture_map = np.where(lowland, np.minimum(1.0, moisture_map * 1.2), moisture_map)
+        
+        # Широта зависит только от строки - считаем ее один раз на вектор строк
+        y = np.arange(row_offset, row_offset + rows)
+        lat_factor = 1.0 - np.abs(y / self.height - 0.5) * 1.5
+        lat_factor = np.clip(lat_factor, 0.0, 1.0)[:, None]
+        
+        if terrain is not None:
+            height_factor = 1.0 - np.maximum(0, terrain) * 0.8
+        else:
+            height_factor = 1.0
+        
+        # Базовая температура с учетом настройки пользователя
+        base_temp = (temp_base * 0.4 + 
+                    lat_factor * 0.5 + 
+                    height_factor * 0.1)
         
+        # Применяем глобальную настройку температуры
+        temp_adjustment = (self.temperature_amount - 0.5) * 0.5
+        temperature_map = np.clip(base_temp + temp_adjustment, 0.0, 1.0)
+        
+        return moisture_map, temperature_map
+    
+    @timed("climate.normalize", cells=lambda self, moisture_map, *args, **kwargs: moisture_map.size)
+    def _finish_climate_maps(self, moisture_map: np.ndarray, temperature_map: np.ndarray,
+                             dtype=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Нормализация климатических карт всей карты и сохранение результата"""
         # Нормализация
         if np.max(moisture_map) - np.min(moisture_map) > 0:
             moisture_map = (moisture_map - np.min(moisture_map)) / (np.max(moisture_map) - np.min(moisture_map))
@@ -142,6 +248,10 @@ class EnhancedMapGenerator(MapGenerator):
         else:
             temperature_map = np.ones_like(temperature_map) * 0.5
         
+        dtype = self.climate_dtype if dtype is None else dtype
+        moisture_map = moisture_map.astype(dtype, copy=False)
+        temperature_map = temperature_map.astype(dtype, copy=False)
+        
         self.moisture_data = moisture_map
         self.temperature_data = temperature_map
         
@@ -153,6 +263,10 @@ class EnhancedMapGenerator(MapGenerator):
         
         Args:
             use_ml: Использовать ML классификатор (None - использовать настройку по умолчанию)
+        
+        Returns:
+            Карта индексов BIOME_TYPES (uint8); представление через BiomeType
+            доступно в biome_view
         """
         if self.map_data is None:
             self.generate_terrain()
@@ -163,119 +277,161 @@ class EnhancedMapGenerator(MapGenerator):
         # Определяем, использовать ли ML
         use_ml_final = use_ml if use_ml is not None else self.ml_enabled
         
-        biome_map = np.empty((self.height, self.width), dtype=object)
-        ml_predictions = np.zeros((self.height, self.width), dtype=bool)
-        
-        # Счетчики для статистики
-        ml_count = 0
-        rule_count = 0
-        
-        for y in range(self.height):
-            for x in range(self.width):
-                elevation = self.map_data[y][x]
-                moisture = self.moisture_data[y][x]
-                temperature = self.temperature_data[y][x]
-                
-                # Дополнительные корректировки на основе настроек
-                adjusted_elevation = elevation
-                adjusted_moisture = moisture
-                adjusted_temperature = temperature
-                
-                # Корректировка для воды
-                if self.water_amount > 0.7 and elevation < -0.1:
-                    adjusted_elevation -= 0.15
-                elif self.water_amount < 0.3 and elevation < -0.1:
-                    adjusted_elevation += 0.15
-                
-                # Корректировка для гор
-                if self.mountain_amount > 0.7 and elevation > 0.2:
-                    adjusted_elevation += 0.15
-                elif self.mountain_amount < 0.3 and elevation > 0.2:
-                    adjusted_elevation -= 0.15
-                
-                # Корректировка для пустынь/песка
-                if self.desert_amount > 0.7 and elevation < 0.3:
-                    adjusted_moisture *= 0.6
-                    adjusted_temperature = min(1.0, adjusted_temperature * 1.2)
-                elif self.desert_amount < 0.3 and elevation < 0.3:
-                    adjusted_moisture = min(1.0, adjusted_moisture * 1.3)
-                
-                # Корректировка для лесов
-                if self.forest_amount > 0.7 and 0.1 < elevation < 0.5:
-                    adjusted_moisture = min(1.0, adjusted_moisture * 1.3)
-                elif self.forest_amount < 0.3 and 0.1 < elevation < 0.5:
-                    adjusted_moisture *= 0.7
-                
-                # Корректировка температуры на основе общего параметра температуры
-                temp_adjustment = (self.temperature_amount - 0.5) * 0.3
-                adjusted_temperature = max(0.0, min(1.0, adjusted_temperature + temp_adjustment))
-                
-                # Пробуем ML классификацию
-                ml_biome = None
-                if use_ml_final:
-                    ml_biome = self.ml_classifier.predict_biome(
-                        adjusted_elevation, 
-                        adjusted_moisture, 
-                        adjusted_temperature,
-                        self.water_level,
-                        self.mountain_level,
-                        self.desert_moisture,
-                        self.forest_moisture
-                    )
-                
-                if ml_biome is not None:
-                    biome_map[y][x] = ml_biome
-                    ml_predictions[y][x] = True
-                    ml_count += 1
-                else:
-                    # Используем классификацию по правилам
-                    biome = self.biome_system.classify_biome(
-                        adjusted_elevation, 
-                        adjusted_moisture, 
-                        adjusted_temperature,
-                        self.water_level,
-                        self.mountain_level,
-                        self.desert_moisture,
-                        self.forest_moisture
-                    )
-                    biome_map[y][x] = biome
-                    rule_count += 1
+        biome_map, ml_predictions = self._classify_rows(
+            self.map_data, self.moisture_data, self.temperature_data, use_ml_final
+        )
+        return self._finish_biome_map(biome_map, ml_predictions, use_ml_final)
+    
+    @timed("biomes.adjust", cells=lambda self, terrain, *args, **kwargs: terrain.size)
+    def _adjusted_climate(self, terrain: np.ndarray, moisture_map: np.ndarray,
+                          temperature_map: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Корректировка высоты, влажности и температуры по настройкам генератора
+        
+        Условия проверяются по исходной высоте клетки, как и раньше.
+        
+        Returns:
+            (высота, влажность, температура) после корректировок
+        """
+        elevation = terrain
+        adjusted_elevation = terrain.astype(np.float64)
+        adjusted_moisture = moisture_map.astype(np.float64)
+        adjusted_temperature = temperature_map.astype(np.float64)
+        
+        # Корректировка для воды
+        if self.water_amount > 0.7:
+            adjusted_elevation[elevation < -0.1] -= 0.15
+        elif self.water_amount < 0.3:
+            adjusted_elevation[elevation < -0.1] += 0.15
+        
+        # Корректировка для гор
+        if self.mountain_amount > 0.7:
+            adjusted_elevation[elevation > 0.2] += 0.15
+        elif self.mountain_amount < 0.3:
+            adjusted_elevation[elevation > 0.2] -= 0.15
+        
+        # Корректировка для пустынь/песка
+        lowland = elevation < 0.3
+        if self.desert_amount > 0.7:
+            adjusted_moisture[lowland] *= 0.6
+            adjusted_temperature[lowland] = np.minimum(1.0, adjusted_temperature[lowland] * 1.2)
+        elif self.desert_amount < 0.3:
+            adjusted_moisture[lowland] = np.minimum(1.0, adjusted_moisture[lowland] * 1.3)
+        
+        # Корректировка для лесов
+        hills = (elevation > 0.1) & (elevation < 0.5)
+        if self.forest_amount > 0.7:
+            adjusted_moisture[hills] = np.minimum(1.0, adjusted_moisture[hills] * 1.3)
+        elif self.forest_amount < 0.3:
+            adjusted_moisture[hills] *= 0.7
+        
+        # Корректировка температуры на основе общего параметра температуры
+        temp_adjustment = (self.temperature_amount - 0.5) * 0.3
+        adjusted_temperature = np.clip(adjusted_temperature + temp_adjustment, 0.0, 1.0)
+        
+        return adjusted_elevation, adjusted_moisture, adjusted_temperature
+    
+    def _classify_rows(self, terrain: np.ndarray, moisture_map: np.ndarray,
+                       temperature_map: np.ndarray, use_ml: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Классификация биомов для полосы строк
+        
+        Returns:
+            (карта индексов BIOME_TYPES, маска клеток, классифицированных ML)
+        """
+        elevation, moisture, temperature = self._adjusted_climate(
+            terrain, moisture_map, temperature_map
+        )
+        
+        # Классификация по правилам сразу для всей полосы
+        with stage("biomes.rules", terrain.size):
+            biome_indices = self.biome_system.classify_biome_grid(
+                elevation, moisture, temperature,
+                self.water_level,
+                self.mountain_level,
+                self.desert_moisture,
+                self.forest_moisture
+            )
+        ml_predictions = np.zeros(terrain.shape, dtype=bool)
+        
+        # ML предсказания заменяют правила там, где модель дала ответ
+        if use_ml:
+            predicted = self.ml_classifier.predict_biome_grid(
+                elevation, moisture, temperature,
+                self.water_level,
+                self.mountain_level,
+                self.desert_moisture,
+                self.forest_moisture
+            )
+            if predicted is not None:
+                ml_predictions = predicted != UNKNOWN_BIOME_INDEX
+                biome_indices[ml_predictions] = predicted[ml_predictions]
+        
+        return biome_indices, ml_predictions
+    
+    def iter_training_data(self, chunk_size: int = 100000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Тренировочные примеры по текущей карте
+        
+        Признаки - те же, что получает ML классификатор при генерации
+        (высота, влажность и температура после корректировок, уровни
+        биомов), метки - классификация по правилам. Примеры выдаются
+        блоками строк карты для MLBiomeClassifier.train_model_streaming.
         
+        Yields:
+            (X, y) блока примерно из chunk_size клеток
+        """
+        if self.map_data is None or self.moisture_data is None or self.temperature_data is None:
+            return
+        
+        rows_per_chunk = max(1, chunk_size // max(1, self.width))
+        levels = (self.water_level, self.mountain_level, self.desert_moisture, self.forest_moisture)
+        
+        for row_start in range(0, self.height, rows_per_chunk):
+            rows = slice(row_start, row_start + rows_per_chunk)
+            elevation, moisture, temperature = self._adjusted_climate(
+                self.map_data[rows], self.moisture_data[rows], self.temperature_data[rows]
+            )
+            labels = self.biome_system.classify_biome_grid(elevation, moisture, temperature, *levels)
+            
+            X = np.empty((elevation.size, 3 + len(levels)))
+            X[:, 0] = elevation.ravel()
+            X[:, 1] = moisture.ravel()
+            X[:, 2] = temperature.ravel()
+            X[:, 3:] = levels
+            yield X, BIOME_LABELS[labels.ravel()]
+    
+    def _finish_biome_map(self, biome_map: np.ndarray, ml_predictions: np.ndarray,
+                          use_ml: bool) -> np.ndarray:
+        """Сохранение карты биомов всей карты и вывод статистики ML"""
         self.biome_data = biome_map
         self.ml_predictions = ml_predictions
         
         # Статистика использования ML
+        ml_count = int(np.sum(ml_predictions))
         total_cells = self.width * self.height
         ml_percent = (ml_count / total_cells) * 100 if total_cells > 0 else 0
         
-        if use_ml_final and ml_count > 0:
+        if use_ml and ml_count > 0:
             print(f"ML классификация: {ml_count}/{total_cells} клеток ({ml_percent:.1f}%)")
         
         return biome_map
     
+    @property
+    def biome_view(self) -> Optional[BiomeMapView]:
+        """Карта биомов в виде BiomeType (ленивое представление biome_data)"""
+        if self.biome_data is None:
+            return None
+        return BiomeMapView(self.biome_data)
+    
     def classify_terrain(self, elevation, x=None, y=None, terrain_map=None):
         """Классификация типа местности с поддержкой ML"""
         # Если доступны ML предсказания, используем их
         if (self.biome_data is not None and x is not None and y is not None 
             and 0 <= y < self.height and 0 <= x < self.width):
             
-            biome = self.biome_data[y][x]
-            
             # Конвертируем в старый формат для совместимости
-            if biome == BiomeType.DEEP_OCEAN:
-                return "deep_water"
-            elif biome == BiomeType.COAST:
-                return "water"
-            elif biome == BiomeType.BEACH:
-                return "sand"
-            elif biome == BiomeType.PLAINS:
-                return "grass"
-            elif biome == BiomeType.FOREST:
-                return "forest"
-            elif biome == BiomeType.MOUNTAINS:
-                return "mountain"
-            elif biome == BiomeType.SNOWY_MOUNTAINS:
-                return "snow"
+            return self.BIOME_TERRAIN[self.biome_data[y, x]]
         
         # Резервная классификация
         if elevation < -0.5:
@@ -293,6 +449,51 @@ class EnhancedMapGenerator(MapGenerator):
         else:
             return "snow"
     
+    def terrain_biome_grid(self, terrain_map: np.ndarray) -> np.ndarray:
+        """
+        Векторная версия classify_terrain для всей карты
+        
+        Returns:
+            Карта индексов BIOME_TYPES (uint8): biome_data, если она есть,
+            иначе резервная классификация по высоте
+        """
+        if self.biome_data is not None and self.biome_data.shape == np.shape(terrain_map):
+            return self.biome_data
+        return np.digitize(terrain_map, self.TERRAIN_THRESHOLDS).astype(np.uint8)
+    
+    @timed("render.rgb", cells=lambda self, *args, **kwargs: self.width * self.height)
+    def render_rgb(self, terrain_map: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Карта в цветах биомов, одна клетка - один пиксель
+        
+        Returns:
+            Массив RGB формы (height, width, 3), dtype uint8
+        """
+        if terrain_map is None:
+            terrain_map = self.map_data
+        return self.biome_system.palette()[self.terrain_biome_grid(terrain_map)]
+    
+    def render_image(self, terrain_map: Optional[np.ndarray] = None, cell_size: int = 1):
+        """
+        Карта в цветах биомов как изображение PIL (требуется Pillow)
+        
+        Общий путь экспорта PNG для интерфейса (export_map_to_png) и
+        пакетной генерации (batch_generate.py).
+        
+        Args:
+            terrain_map: Карта высот (по умолчанию map_data)
+            cell_size: Размер клетки в пикселях (увеличение без сглаживания)
+        """
+        from PIL import Image
+        
+        image = Image.fromarray(self.render_rgb(terrain_map), 'RGB')
+        if cell_size != 1:
+            image = image.resize(
+                (image.width * cell_size, image.height * cell_size),
+                Image.NEAREST
+            )
+        return image
+    
     def get_all_biomes(self):
         """Возвращает все типы биомов с их цветами и названиями"""
         return [
@@ -307,14 +508,7 @@ class EnhancedMapGenerator(MapGenerator):
     
     def apply_preset(self, preset_name: str):
         """Применение пресета биомов"""
-        presets = {
-            "Архипелаг": (0.9, 0.2, 0.1, 0.3, 0.6),
-            "Пустыня": (0.1, 0.2, 0.9, 0.1, 0.8),
-            "Леса": (0.3, 0.2, 0.1, 0.9, 0.5),
-            "Горы": (0.3, 0.9, 0.2, 0.3, 0.3),
-            "Континент": (0.5, 0.5, 0.3, 0.6, 0.5),
-            "Джунгли": (0.6, 0.1, 0.1, 0.8, 0.8),
-        }
+        presets = self.PRESETS
         
         if preset_name in presets:
             water, mountain, desert, forest, temperature = presets[preset_name]
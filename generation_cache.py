@@ -0,0 +1,227 @@
+"""
+Кэш сгенерированных карт на диске
+
+Одинаковые входные данные (seed, размеры, масштаб, шероховатость,
+настройки биомов, модель ML) всегда дают одну и ту же карту, поэтому
+результат генерации сохраняется в архив карты (map_archive) с именем -
+SHA-256 от всех входных данных. Повторный запрос - одно чтение файла.
+
+Размер кэша ограничен: при превышении max_bytes удаляются давно не
+использованные архивы (время использования - mtime файла, обновляется
+при каждом попадании). Каталог просматривается только когда оценка
+размера превышает предел. Запись атомарная (os.replace), поэтому несколько
+процессов могут одновременно читать и пополнять один каталог кэша.
+
+По умолчанию кэш находится в каталоге кэша пользователя
+(default_cache_dir).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from map_archive import MapArchive, save_map_archive, MAP_ARCHIVE_EXTENSION
+
+
+# Версия ключа: увеличивается при изменении алгоритмов генерации,
+# чтобы старые записи кэша не использовались
+CACHE_KEY_VERSION = 1
+
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    """
+    Каталог кэша карт пользователя
+    
+    %LOCALAPPDATA% в Windows, иначе $XDG_CACHE_HOME или ~/.cache; не
+    зависит от текущего каталога, из которого запущена программа.
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'map_generator', 'maps')
+
+
+DEFAULT_CACHE_DIR = default_cache_dir()
+
+
+def generation_key(map_gen, params: Dict[str, Any]) -> Optional[str]:
+    """
+    Ключ кэша для генерации карты генератором map_gen
+    
+    Args:
+        map_gen: Генератор с уже примененными настройками биомов
+            (adjust_*), seed и режимом ML
+        params: Параметры генерации (width, height, scale, roughness и
+            необязательные island_mode, smooth_iterations - по умолчанию
+            как в generate_terrain)
+    
+    Returns:
+        Шестнадцатеричный SHA-256 или None, если результат нельзя
+        кэшировать (ML модель не совпадает с файлами на диске или форма
+        острова не встроенная)
+    """
+    # Форма острова, заданная функцией или зарегистрированная
+    # (register_falloff_shape), не хэшируется надежно: под тем же именем
+    # в другом запуске может оказаться другая функция
+    shape = map_gen.island_shape
+    if not isinstance(shape, str) or (
+            map_gen.FALLOFF_SHAPES.get(shape) is not map_gen.BUILTIN_FALLOFF_SHAPES.get(shape)):
+        return None
+    
+    model = None
+    if map_gen.ml_enabled:
+        classifier = map_gen.ml_classifier
+        if classifier.fingerprint is None:
+            return None
+        model = (classifier.fingerprint, bool(classifier.use_compiled))
+    
+    inputs = {
+        'version': CACHE_KEY_VERSION,
+        'seed': map_gen.seed,
+        'width': int(params['width']),
+        'height': int(params['height']),
+        'scale': float(params['scale']),
+        'roughness': float(params['roughness']),
+        'island_mode': bool(params.get('island_mode', True)),
+        'smooth_iterations': int(params.get('smooth_iterations', 2)),
+        'island_shape': map_gen.island_shape,
+        'amounts': [map_gen.water_amount, map_gen.mountain_amount, map_gen.desert_amount,
+                    map_gen.forest_amount, map_gen.temperature_amount],
+        'levels': [map_gen.water_level, map_gen.mountain_level,
+                   map_gen.desert_moisture, map_gen.forest_moisture],
+        'climate_dtype': np.dtype(map_gen.climate_dtype).str,
+        'ml': model,
+    }
+    encoded = json.dumps(inputs, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class GenerationCache:
+    """
+    Кэш архивов карт в каталоге directory
+    
+    Attributes:
+        hits, misses: Счетчики попаданий и промахов этого объекта
+    """
+    
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.directory = os.path.abspath(directory or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Оценка размера кэша: каталог просматривается заново, только
+        # когда она превышает max_bytes (None - еще не просматривался)
+        self._known_size = None
+    
+    def path(self, key: str) -> str:
+        """Путь к архиву для ключа"""
+        return os.path.join(self.directory, key + MAP_ARCHIVE_EXTENSION)
+    
+    def get(self, key: Optional[str]) -> Optional[MapArchive]:
+        """
+        Архив карты по ключу или None
+        
+        Все секции архива отображаются в память сразу, поэтому удаление
+        файла другим процессом после попадания не влияет на результат.
+        """
+        if key is None:
+            return None
+        
+        path = self.path(key)
+        try:
+            archive = MapArchive(path)
+            for name in archive.keys():
+                archive[name]
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+        return archive
+    
+    def put(self, key: Optional[str], map_gen, metadata: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        Сохранение карты генератора под ключом
+        
+        Returns:
+            Путь к архиву или None, если ключа нет
+        """
+        if key is None:
+            return None
+        
+        os.makedirs(self.directory, exist_ok=True)
+        path = save_map_archive(self.path(key), map_gen, metadata)
+        
+        with self._lock:
+            if self._known_size is None:
+                self._known_size = self.size()
+            else:
+                self._known_size += os.path.getsize(path)
+            over_limit = self._known_size > self.max_bytes
+        if over_limit:
+            self.evict()
+        return path
+    
+    def _entries(self):
+        """Записи кэша: (время использования, размер, путь)"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        
+        for name in names:
+            if not name.endswith(MAP_ARCHIVE_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def size(self) -> int:
+        """Общий размер архивов в кэше"""
+        return sum(size for _, size, _ in self._entries())
+    
+    def evict(self):
+        """Удаление давно не использованных архивов сверх max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        
+        with self._lock:
+            self._known_size = total
+    
+    def clear(self):
+        """Удаление всех архивов кэша"""
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        
+        with self._lock:
+            self._known_size = None
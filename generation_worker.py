@@ -0,0 +1,188 @@
+"""
+Фоновая генерация карт для графического интерфейса
+"""
+
+import queue
+import threading
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from colormaps import colorize_layer
+from noise_generator import NoisePyramid
+from map_pipeline import MapPipeline
+from generation_cache import GenerationCache
+
+
+# Событие задачи: kind - 'progress', 'preview', 'done' или 'error'
+GenerationEvent = namedtuple('GenerationEvent', ['kind', 'job_id', 'data'])
+
+
+class GenerationCancelled(Exception):
+    """Задача генерации отменена более новым запросом"""
+
+
+class GenerationJob:
+    """Одна задача генерации карты с флагом отмены"""
+    
+    def __init__(self, job_id: int, params: Dict[str, Any], biome_params: Dict[str, float]):
+        self.job_id = job_id
+        self.params = params
+        self.biome_params = biome_params
+        self.cancelled = threading.Event()
+    
+    def check(self):
+        """Прерывание задачи, если она отменена"""
+        if self.cancelled.is_set():
+            raise GenerationCancelled()
+
+
+class GenerationWorker:
+    """
+    Генерация карт в фоновом потоке
+    
+    Каждый запрос получает номер; новый запрос отменяет предыдущий, и
+    события устаревших задач отбрасываются в poll(). Поток сообщает о
+    ходе работы через очередь событий, которую интерфейс опрашивает
+    из своего главного цикла (root.after). Отмена проверяется между
+    этапами.
+    
+    Карта сохраняется в дисковый кэш конвейера только после завершения
+    задачи и только если за это время не пришел новый запрос, поэтому
+    перетаскивание ползунков не записывает архив на каждое значение.
+    
+    Для больших карт перед полной генерацией отправляются события
+    'preview' с уменьшенными картами (не больше preview_size клеток по
+    большей стороне, затем вдвое подробнее и т.д.); шум предпросмотра
+    уточняется, а не генерируется заново. preview_size = 0 отключает
+    предпросмотр.
+    """
+    
+    # Этапы конвейера и их названия
+    STAGES = (
+        ("terrain", "Рельеф"),
+        ("coast", "Побережья"),
+        ("noise", "Шум климата"),
+        ("climate", "Климат"),
+        ("biomes", "Биомы"),
+        ("images", "Подготовка изображений"),
+    )
+    
+    def __init__(self, pipeline: Optional[MapPipeline] = None, preview_size: int = 128):
+        self.pipeline = pipeline or MapPipeline(cache=GenerationCache())
+        self.preview_size = preview_size
+        self.events = queue.Queue()
+        self._lock = threading.Lock()
+        self._job: Optional[GenerationJob] = None
+        self._last_id = 0
+    
+    @property
+    def busy(self) -> bool:
+        """Выполняется ли актуальная задача"""
+        with self._lock:
+            return self._job is not None
+    
+    def submit(self, params: Dict[str, Any], biome_params: Dict[str, float]) -> int:
+        """
+        Запуск генерации; предыдущая задача отменяется
+        
+        Returns:
+            Номер новой задачи
+        """
+        with self._lock:
+            if self._job is not None:
+                self._job.cancelled.set()
+            
+            self._last_id += 1
+            job = GenerationJob(self._last_id, params, biome_params)
+            self._job = job
+        
+        thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+        thread.start()
+        return job.job_id
+    
+    def cancel(self):
+        """Отмена текущей задачи"""
+        with self._lock:
+            if self._job is not None:
+                self._job.cancelled.set()
+                self._job = None
+    
+    def poll(self) -> List[GenerationEvent]:
+        """События актуальной задачи, накопившиеся с прошлого вызова"""
+        events = []
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            
+            with self._lock:
+                current = self._job is not None and event.job_id == self._job.job_id
+                if current and event.kind not in ('progress', 'preview'):
+                    self._job = None
+            
+            if current:
+                events.append(event)
+        return events
+    
+    def _progress(self, job: GenerationJob, stage_name: str):
+        job.check()
+        stages = [name for name, _ in self.STAGES]
+        stage = stages.index(stage_name)
+        self.events.put(GenerationEvent(
+            'progress', job.job_id, (stage, len(self.STAGES), self.STAGES[stage][1])
+        ))
+    
+    def _run(self, job: GenerationJob):
+        """Выполнение задачи в фоновом потоке"""
+        try:
+            result = self._generate(job)
+            job.check()
+            self.events.put(GenerationEvent('done', job.job_id, result))
+            if not job.cancelled.is_set():
+                self.pipeline.store(result)
+        except GenerationCancelled:
+            pass
+        except Exception as e:
+            if not job.cancelled.is_set():
+                import traceback
+                traceback.print_exc()
+                self.events.put(GenerationEvent('error', job.job_id, str(e)))
+    
+    def _generate(self, job: GenerationJob) -> Dict[str, Any]:
+        """
+        Обновление карты конвейером
+        
+        Пересчитываются только этапы, входные данные которых изменились;
+        отмена проверяется перед каждым пересчитываемым этапом.
+        """
+        job.check()
+        params = job.params
+        
+        if self.preview_size > 0:
+            width, height = int(params['width']), int(params['height'])
+            for step in NoisePyramid.preview_steps(width, height, self.preview_size):
+                preview = self.pipeline.preview(params, job.biome_params, step,
+                                                images=render_layers)
+                if preview is None:
+                    break
+                # Seed выбран при первом предпросмотре: полная карта - та же
+                params = preview['params']
+                job.check()
+                self.events.put(GenerationEvent('preview', job.job_id, preview))
+        
+        return self.pipeline.update(
+            params, job.biome_params,
+            progress=lambda stage: self._progress(job, stage),
+            images=render_layers, store=False
+        )
+
+
+def render_layers(map_gen) -> Dict[str, Any]:
+    """Изображения всех слоев карты (RGB массивы) для DisplayPanel"""
+    return {
+        'terrain': map_gen.render_rgb(map_gen.map_data),
+        'height': colorize_layer('height', map_gen.map_data),
+        'temperature': colorize_layer('temperature', map_gen.temperature_data),
+        'moisture': colorize_layer('moisture', map_gen.moisture_data),
+    }
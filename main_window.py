@@ -2,17 +2,20 @@
 Основное окно приложения - координатор всех компонентов
 """
 
+import os
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
 import numpy as np
-import threading
 
 from .control_panel import ControlPanel
 from .display_panel import DisplayPanel
 from .status_bar import StatusBar
+from .generation_worker import GenerationWorker, render_layers
 from .utils.export_utils import export_map_to_png
-from enhanced_map_generator import EnhancedMapGenerator
-from biomes import BiomeType
+from biomes import BIOME_TYPES
+from model_registry import get_registry
+from map_archive import save_map_archive, open_map_archive, MAP_ARCHIVE_EXTENSION
+from profiling import get_stats, dump_json, PROFILE_ENV
 
 
 class MapGeneratorGUI:
@@ -27,10 +30,16 @@ class MapGeneratorGUI:
         self.current_terrain = None
         self.current_moisture = None
         self.current_temperature = None
+        self.current_params = None
         
         # Флаг состояния
         self.is_generating = False
         
+        # Фоновая генерация: опрос очереди событий и отложенный перезапуск
+        self.worker = GenerationWorker()
+        self._poll_id = None
+        self._restart_id = None
+        
         self.setup_window()
         self.setup_components()
         
@@ -77,61 +86,117 @@ class MapGeneratorGUI:
             self.status_bar
         )
     
-    def generate_map(self):
-        """Синхронная генерация карты (простейшая версия для отладки)"""
-        if self.is_generating:
-            return
-            
+    def generate_map(self, keep_seed=False):
+        """
+        Запуск генерации карты в фоновом потоке
+        
+        Если генерация уже идет, она отменяется: побеждает последний запрос.
+        Этапы, входные данные которых не изменились, берутся из кэша
+        конвейера (см. MapPipeline).
+        
+        Args:
+            keep_seed: При случайном seed оставить seed текущей карты
+        """
+        if self._restart_id is not None:
+            self.root.after_cancel(self._restart_id)
+            self._restart_id = None
+        
         try:
-            self.is_generating = True
-            self.status_bar.set_status("Генерация карты...")
-            
             # Получаем параметры
             params = self.control_panel.get_generation_params()
             biome_params = self.control_panel.get_biome_params()
-            
-            # Создаем генератор
-            self.map_gen = EnhancedMapGenerator(
-                width=params['width'],
-                height=params['height'],
-                use_ml=params['use_ml']
-            )
-            
-            # Применяем настройки биомов
-            self.map_gen.adjust_water_amount(biome_params['water'])
-            self.map_gen.adjust_mountain_amount(biome_params['mountain'])
-            self.map_gen.adjust_desert_amount(biome_params['desert'])
-            self.map_gen.adjust_forest_amount(biome_params['forest'])
-            self.map_gen.adjust_temperature_amount(biome_params['temperature'])
-            
-            # Генерируем карты
-            self.current_terrain = self.map_gen.generate_terrain(
-                scale=params['scale'],
-                roughness=params['roughness'],
-                seed=params['seed']
-            )
-            
-            self.current_moisture, self.current_temperature = self.map_gen.generate_climate_maps(
-                scale=params['scale']
-            )
-            
-            # Генерируем карту биомов
-            self.map_gen.generate_biome_map()
-            
+        except (tk.TclError, ValueError) as e:
+            self.status_bar.set_error(f"Некорректные параметры: {str(e)}")
+            return
+        
+        if keep_seed and params['seed'] is None and self.map_gen is not None:
+            params['seed'] = self.map_gen.seed
+        
+        self.is_generating = True
+        self.status_bar.set_status("Генерация карты...")
+        self.status_bar.set_progress(0, len(self.worker.STAGES))
+        
+        self.worker.submit(params, biome_params)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(50, self._poll_generation)
+    
+    def cancel_generation(self):
+        """Отмена текущей генерации"""
+        self.worker.cancel()
+        if self.is_generating:
+            self.is_generating = False
+            self.status_bar.set_progress(0)
+            self.status_bar.set_status("Генерация отменена")
+    
+    def on_params_changed(self):
+        """
+        Изменение параметров
+        
+        Если карта уже есть или генерируется, она обновляется с новыми
+        параметрами (пересчитываются только зависящие от них этапы).
+        Обновление откладывается, чтобы перетаскивание ползунка не
+        создавало задачу на каждое промежуточное значение.
+        """
+        if not self.is_generating and self.current_terrain is None:
+            return
+        
+        if self._restart_id is not None:
+            self.root.after_cancel(self._restart_id)
+        self._restart_id = self.root.after(200, lambda: self.generate_map(keep_seed=True))
+    
+    def _poll_generation(self):
+        """Обработка событий фоновой генерации (в главном потоке)"""
+        self._poll_id = None
+        
+        for event in self.worker.poll():
+            if event.kind == 'progress':
+                stage, total, name = event.data
+                self.status_bar.set_progress(stage, total)
+                self.status_bar.set_status(f"Генерация карты: {name} ({stage + 1}/{total})...")
+            elif event.kind == 'preview':
+                self.display_panel.show_layers(event.data['images'])
+                self.status_bar.set_status(
+                    f"Предпросмотр 1:{event.data['step']}, уточнение карты..."
+                )
+            elif event.kind == 'done':
+                self._on_generation_done(event.data)
+            elif event.kind == 'error':
+                self.is_generating = False
+                self.status_bar.set_progress(0)
+                self.status_bar.set_error(f"Ошибка при генерации карты: {event.data}")
+        
+        if self.worker.busy:
+            self._poll_id = self.root.after(50, self._poll_generation)
+    
+    def _on_generation_done(self, result):
+        """Вывод результатов завершенной генерации"""
+        self.is_generating = False
+        
+        self.map_gen = result['map_gen']
+        self.current_params = result['params']
+        self.current_terrain = result['terrain']
+        self.current_moisture = result['moisture']
+        self.current_temperature = result['temperature']
+        
+        try:
             # Отображаем карты
-            self.redraw_all_maps()
+            self.display_panel.show_layers(result['images'])
             self.update_stats()
             self.update_ml_info()
             self.update_status()
             
+            # Время этапов для внешних панелей мониторинга
+            profile_path = os.environ.get(PROFILE_ENV)
+            if profile_path:
+                dump_json(profile_path)
+            
+            self.status_bar.set_progress(0)
             self.status_bar.set_status("Карта сгенерирована успешно!")
             
         except Exception as e:
             import traceback
             traceback.print_exc()
             self.status_bar.set_error(f"Ошибка при генерации карты: {str(e)}")
-        finally:
-            self.is_generating = False
     
     def redraw_all_maps(self):
         """Перерисовка всех карт"""
@@ -156,6 +221,13 @@ class MapGeneratorGUI:
                 self.current_temperature,
                 self.map_gen
             )
+        
+        # Отрисовываем карту влажности
+        if self.current_moisture is not None:
+            self.display_panel.draw_moisture_map(
+                self.current_moisture,
+                self.map_gen
+            )
     
     def update_stats(self):
         """Обновление статистики"""
@@ -176,15 +248,9 @@ class MapGeneratorGUI:
         # Подсчет биомов
         biome_counts = {}
         if self.map_gen.biome_data is not None:
-            # Простой подсчет
-            for biome_type in BiomeType:
-                biome_counts[biome_type] = 0
-            
-            for y in range(self.map_gen.height):
-                for x in range(self.map_gen.width):
-                    biome = self.map_gen.biome_data[y][x]
-                    if biome in biome_counts:
-                        biome_counts[biome] += 1
+            counts = np.bincount(self.map_gen.biome_data.ravel(), minlength=len(BIOME_TYPES))
+            for biome_type, count in zip(BIOME_TYPES, counts):
+                biome_counts[biome_type] = int(count)
         
         # Характеристики высот
         min_height = float(np.min(self.current_terrain))
@@ -218,6 +284,7 @@ class MapGeneratorGUI:
             'avg_moisture': avg_moisture,
             'avg_temperature': avg_temperature,
             'ml_stats': ml_stats,
+            'profile': get_stats(),
             'biome_params': self.control_panel.get_biome_params()
         }
     
@@ -268,51 +335,29 @@ class MapGeneratorGUI:
             self.status_bar.set_ml_status("⚪ выключена")
     
     def train_ml_model(self):
-        """Обучение ML модели"""
-        def training_thread():
-            try:
-                self.status_bar.set_status("Начало обучения ML модели...")
-                
-                from ml_biome_classifier import MLBiomeClassifier
-                classifier = MLBiomeClassifier(use_ml=True, auto_train=False)
-                classifier.train_model(samples=20000, save=True)
-                
-                # Обновляем модель в генераторе
-                if self.map_gen:
-                    self.map_gen.ml_classifier = classifier
-                    self.map_gen.ml_enabled = True
-                
-                self.status_bar.set_status("ML модель обучена успешно!")
-                self.status_bar.set_ml_status("✅ обучена")
-                
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                self.status_bar.set_error(f"Ошибка при обучении модели: {str(e)}")
-        
-        # Запускаем обучение в отдельном потоке
-        thread = threading.Thread(target=training_thread, daemon=True)
-        thread.start()
+        """Обучение ML модели в фоновом потоке"""
+        def on_trained(error):
+            if error is not None:
+                self.status_bar.set_error(f"Ошибка при обучении модели: {str(error)}")
+                return
+            
+            # Модель общая: генераторы получают ее без пересоздания
+            if self.map_gen:
+                self.map_gen.ml_enabled = True
+            
+            self.status_bar.set_status("ML модель обучена успешно!")
+            self.status_bar.set_ml_status("✅ обучена")
+        
+        self.status_bar.set_status("Начало обучения ML модели...")
+        get_registry().train_async(samples=20000, callback=on_trained)
     
     def apply_preset(self, preset_name):
         """Применение пресета биомов"""
         success = self.control_panel.apply_preset(preset_name)
         
         if success and self.map_gen and self.current_terrain is not None:
-            # Обновляем генератор
-            params = self.control_panel.get_biome_params()
-            self.map_gen.adjust_water_amount(params['water'])
-            self.map_gen.adjust_mountain_amount(params['mountain'])
-            self.map_gen.adjust_desert_amount(params['desert'])
-            self.map_gen.adjust_forest_amount(params['forest'])
-            self.map_gen.adjust_temperature_amount(params['temperature'])
-            
-            # Перегенерируем карту биомов
-            self.map_gen.generate_biome_map()
-            self.redraw_all_maps()
-            self.update_stats()
-            self.update_ml_info()
-            self.update_status()
+            # Пересчитываются только этапы после рельефа: шум берется из кэша
+            self.generate_map(keep_seed=True)
     
     def export_current_map(self):
         """Экспорт текущей карты"""
@@ -329,6 +374,73 @@ class MapGeneratorGUI:
         except Exception as e:
             self.status_bar.set_error(f"Ошибка при экспорте: {str(e)}")
     
+    def save_current_map(self):
+        """Сохранение текущей карты в архив (все слои и параметры)"""
+        if self.current_terrain is None or self.map_gen is None:
+            self.status_bar.set_status("Нет карты для сохранения")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=MAP_ARCHIVE_EXTENSION,
+            initialfile=f"map_{self.map_gen.seed}{MAP_ARCHIVE_EXTENSION}",
+            filetypes=[("Архив карты", f"*{MAP_ARCHIVE_EXTENSION}")]
+        )
+        if not filename:
+            return
+        
+        try:
+            metadata = {}
+            if self.current_params is not None:
+                metadata = {'scale': self.current_params['scale'],
+                            'roughness': self.current_params['roughness']}
+            filename = save_map_archive(filename, self.map_gen, metadata)
+            self.status_bar.set_status(f"Карта сохранена: {filename}")
+        except Exception as e:
+            self.status_bar.set_error(f"Ошибка при сохранении карты: {str(e)}")
+    
+    def open_map(self):
+        """Открытие карты из архива без повторной генерации"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Архив карты", f"*{MAP_ARCHIVE_EXTENSION}")]
+        )
+        if not filename:
+            return
+        
+        try:
+            archive = open_map_archive(filename)
+            map_gen = archive.to_generator()
+        except Exception as e:
+            self.status_bar.set_error(f"Ошибка при открытии карты: {str(e)}")
+            return
+        
+        self.cancel_generation()
+        if self._restart_id is not None:
+            self.root.after_cancel(self._restart_id)
+            self._restart_id = None
+        
+        # Параметры карты из заголовка архива - в панель управления, чтобы
+        # последующие изменения и сохранение исходили из открытой карты
+        header_params = archive.params
+        params = {'width': archive.width, 'height': archive.height, 'seed': archive.seed}
+        for name in ('scale', 'roughness'):
+            if name in archive.metadata:
+                params[name] = archive.metadata[name]
+        if 'use_ml' in header_params:
+            params['use_ml'] = bool(header_params['use_ml'])
+        biome_params = {name: header_params.get(f'{name}_amount')
+                        for name in ('water', 'mountain', 'desert', 'forest', 'temperature')}
+        self.control_panel.set_params(params, biome_params)
+        
+        self._on_generation_done({
+            'map_gen': map_gen,
+            'params': dict(self.control_panel.get_generation_params(), seed=archive.seed),
+            'terrain': map_gen.map_data,
+            'moisture': map_gen.moisture_data,
+            'temperature': map_gen.temperature_data,
+            'images': render_layers(map_gen),
+        })
+        self.status_bar.set_status(f"Карта открыта: {filename}")
+    
     def new_random_map(self):
         """Генерация новой случайной карты"""
         self.control_panel.generate_random_seed()
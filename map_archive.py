@@ -0,0 +1,254 @@
+"""
+Архив карты: двоичный формат для сохранения сгенерированных карт
+
+Структура файла:
+    0   MAP_ARCHIVE_MAGIC (8 байт)
+    8   версия формата (uint32, little-endian)
+    12  длина заголовка в байтах (uint32)
+    16  заголовок JSON (UTF-8): seed, размеры, параметры генератора,
+        метаданные и описание секций (имя, dtype, форма, смещение)
+    ... секции массивов, каждая выровнена на SECTION_ALIGNMENT байт;
+        смещения отсчитываются от начала данных (первая выровненная
+        позиция после заголовка)
+
+Массивы хранятся без сжатия в порядке C и little-endian, поэтому
+открываются через np.memmap без копирования и декодирования: файл
+читается лениво, по мере обращения к данным.
+"""
+
+import json
+import os
+import struct
+import tempfile
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+MAP_ARCHIVE_MAGIC = b'\x89MAPARC\n'
+MAP_ARCHIVE_VERSION = 1
+MAP_ARCHIVE_EXTENSION = '.maparc'
+
+# Выравнивание секций массивов в байтах
+SECTION_ALIGNMENT = 64
+
+_PREFIX = struct.Struct('<8sII')
+
+# Секции архива: имя секции -> атрибут генератора
+MAP_SECTIONS = {
+    'terrain': 'map_data',
+    'moisture': 'moisture_data',
+    'temperature': 'temperature_data',
+    'biomes': 'biome_data',
+    'ml_predictions': 'ml_predictions',
+}
+
+# Параметры генератора, сохраняемые в заголовке
+MAP_PARAMS = (
+    'water_amount', 'mountain_amount', 'desert_amount',
+    'forest_amount', 'temperature_amount',
+    'water_level', 'mountain_level', 'desert_moisture', 'forest_moisture',
+    'use_ml',
+)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+
+def write_archive(path: str, arrays: Dict[str, np.ndarray], header: Dict[str, Any]):
+    """
+    Запись архива из произвольных массивов
+    
+    Файл сначала пишется во временный файл рядом с path и затем
+    атомарно заменяет path (os.replace), поэтому читатели никогда не
+    видят недописанный архив.
+    
+    Args:
+        path: Путь к файлу архива
+        arrays: Секции: имя -> массив
+        header: Поля заголовка (должны сериализоваться в JSON)
+    """
+    sections = []
+    data = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+        offset = _align(offset)
+        sections.append({
+            'name': name,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+            'nbytes': array.nbytes,
+        })
+        data.append((offset, array))
+        offset += array.nbytes
+    
+    header_bytes = json.dumps(dict(header, sections=sections), ensure_ascii=False).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(header_bytes))
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(MAP_ARCHIVE_MAGIC, MAP_ARCHIVE_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for section_offset, array in data:
+                f.seek(data_start + section_offset)
+                f.write(memoryview(array).cast('B'))
+            # Файл не короче конца последней секции, даже если она пустая
+            f.truncate(data_start + offset)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Файл уже закрыт (иначе в Windows его нельзя удалить); ошибка
+        # удаления не должна скрывать исходную ошибку записи
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_map_archive(path: str, map_gen, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Сохранение сгенерированной карты
+    
+    Args:
+        path: Путь к файлу (расширение MAP_ARCHIVE_EXTENSION добавляется,
+            если его нет)
+        map_gen: Генератор (EnhancedMapGenerator) со сгенерированной картой
+        metadata: Дополнительные сведения (например, scale и roughness)
+    
+    Returns:
+        Путь к сохраненному файлу
+    """
+    if not path.endswith(MAP_ARCHIVE_EXTENSION):
+        path += MAP_ARCHIVE_EXTENSION
+    
+    arrays = {}
+    for name, attribute in MAP_SECTIONS.items():
+        array = getattr(map_gen, attribute, None)
+        if array is not None:
+            arrays[name] = array
+    
+    header = {
+        'seed': map_gen.seed,
+        'width': map_gen.width,
+        'height': map_gen.height,
+        'params': {name: getattr(map_gen, name) for name in MAP_PARAMS if hasattr(map_gen, name)},
+        'metadata': metadata or {},
+    }
+    write_archive(path, arrays, header)
+    return path
+
+
+class MapArchive:
+    """
+    Открытый архив карты
+    
+    Заголовок читается сразу, массивы - по обращению через np.memmap
+    (только для чтения). Чтение части массива (например, archive['terrain'][:10])
+    затрагивает только нужные страницы файла.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                raise ValueError(f"Файл слишком короткий для архива карты: {path}")
+            
+            magic, version, header_length = _PREFIX.unpack(prefix)
+            if magic != MAP_ARCHIVE_MAGIC:
+                raise ValueError(f"Файл не является архивом карты: {path}")
+            if version != MAP_ARCHIVE_VERSION:
+                raise ValueError(f"Неподдерживаемая версия архива карты: {version}")
+            
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+        
+        self.data_start = _align(_PREFIX.size + header_length)
+        self._sections = {section['name']: section for section in self.header['sections']}
+        self._arrays: Dict[str, np.ndarray] = {}
+    
+    @property
+    def seed(self) -> int:
+        return self.header['seed']
+    
+    @property
+    def width(self) -> int:
+        return self.header['width']
+    
+    @property
+    def height(self) -> int:
+        return self.header['height']
+    
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.header.get('params', {})
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.header.get('metadata', {})
+    
+    def keys(self):
+        """Имена секций архива"""
+        return self._sections.keys()
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Массив секции (np.memmap только для чтения)"""
+        if name not in self._arrays:
+            section = self._sections[name]
+            shape = tuple(section['shape'])
+            if section['nbytes'] == 0:
+                array = np.empty(shape, dtype=section['dtype'])
+            else:
+                array = np.memmap(self.path, dtype=section['dtype'], mode='r',
+                                  offset=self.data_start + section['offset'], shape=shape)
+            self._arrays[name] = array
+        return self._arrays[name]
+    
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+    
+    def to_generator(self, copy: bool = False):
+        """
+        Генератор с картой из архива
+        
+        Args:
+            copy: Скопировать массивы в память (иначе они остаются
+                отображенными на файл и доступны только для чтения)
+        """
+        from enhanced_map_generator import EnhancedMapGenerator
+        
+        gen = EnhancedMapGenerator(self.width, self.height, use_ml=False, auto_train=False)
+        gen.set_seed(self.seed)
+        for name, value in self.params.items():
+            setattr(gen, name, value)
+        return self.restore(gen, copy=copy)
+    
+    def restore(self, gen, copy: bool = False):
+        """Слои карты из архива в существующий генератор (параметры не меняются)"""
+        gen.width = self.width
+        gen.height = self.height
+        for name, attribute in MAP_SECTIONS.items():
+            array = self.get(name)
+            if array is not None and copy:
+                array = np.array(array)
+            setattr(gen, attribute, array)
+        return gen
+
+
+def open_map_archive(path: str) -> MapArchive:
+    """Открытие архива карты (заголовок читается сразу, массивы лениво)"""
+    return MapArchive(path)
+
+
+def load_map_archive(path: str, copy: bool = False):
+    """Загрузка карты из архива в генератор (см. MapArchive.to_generator)"""
+    return MapArchive(path).to_generator(copy=copy)
@@ -4,11 +4,25 @@
 
 import numpy as np
 import random
-import math
-from typing import Optional
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, List, Tuple, Union
 
-from noise_generator import ImprovedNoiseGenerator
+from noise_generator import ImprovedNoiseGenerator, NoisePyramid
 from biomes import BiomeType, BiomeSystem
+from profiling import stage, timed
+
+
+def _radial_distance(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    return np.sqrt(dx*dx + dy*dy)
+
+
+def _square_distance(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    return np.maximum(np.abs(dx), np.abs(dy))
+
+
+def _diamond_distance(dx: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    return np.abs(dx) + np.abs(dy)
 
 
 class MapGenerator:
@@ -16,6 +30,17 @@ class MapGenerator:
     Основной класс для генерации карт местности с системой биомов
     """
     
+    # Формы спада для эффекта острова: функция (dx, dy) -> расстояние от центра,
+    # где dx, dy - координаты клетки в диапазоне [-1, 1]
+    FALLOFF_SHAPES = {
+        "radial": _radial_distance,
+        "square": _square_distance,
+        "diamond": _diamond_distance,
+    }
+    # Встроенные формы: только для них результат можно кэшировать на диске
+    # по имени (register_falloff_shape может заменить форму под тем же именем)
+    BUILTIN_FALLOFF_SHAPES = dict(FALLOFF_SHAPES)
+    
     def __init__(self, width=60, height=40):
         self.width = width
         self.height = height
@@ -28,6 +53,13 @@ class MapGenerator:
         self.mountain_level = 0.4
         self.desert_moisture = 0.3
         self.forest_moisture = 0.6
+        
+        # Форма острова: имя из FALLOFF_SHAPES или функция (dx, dy) -> расстояние
+        self.island_shape = "radial"
+        
+        # Кэш фрагментов бесконечного мира (LRU)
+        self.chunk_cache_size = 64
+        self._chunk_cache = OrderedDict()
     
     def set_seed(self, seed=None):
         if seed is None:
@@ -61,91 +93,269 @@ class MapGenerator:
         if seed is not None:
             self.set_seed(seed)
         
+        terrain = self.terrain_base(scale, roughness, island_mode, smooth_iterations)
+        terrain = self.smooth_coastlines(terrain)
+        
+        self.map_data = terrain
+        return terrain
+    
+    def terrain_base(self, scale=8.0, roughness=0.5, island_mode=True, smooth_iterations=2,
+                     noise_map: Optional[np.ndarray] = None):
+        """
+        Рельеф до сглаживания побережий
+        
+        Зависит только от seed, размеров карты и параметров шума; уровень
+        воды используется позже, в smooth_coastlines.
+        
+        Args:
+            noise_map: Готовый шум рельефа формы (height, width), например
+                уровень NoisePyramid из terrain_pyramid (None - вычислить)
+        """
+        if noise_map is None:
+            with stage("terrain.noise", self.width * self.height):
+                noise_map = ImprovedNoiseGenerator.perlin_noise(
+                    width=self.width,
+                    height=self.height,
+                    **self._terrain_noise_params(scale, roughness)
+                )
+        
+        terrain = (noise_map * 2) - 1
+        
+        if island_mode:
+            terrain = self.apply_island_effect(terrain, strength=0.7)
+        
+        for _ in range(smooth_iterations):
+            terrain = self.smooth_terrain(terrain)
+        
+        return self.normalize_terrain(terrain)
+    
+    def _terrain_noise_params(self, scale: float, roughness: float) -> Dict[str, Any]:
+        """Параметры шума рельефа (общие для terrain_base и terrain_pyramid)"""
+        octaves, persistence = self._noise_params(roughness)
+        return {'scale': scale, 'octaves': octaves, 'persistence': persistence,
+                'lacunarity': 2.0, 'seed': self.seed}
+    
+    def terrain_pyramid(self, scale=8.0, roughness=0.5) -> NoisePyramid:
+        """
+        Шум рельефа с постепенным уточнением
+        
+        Уровень step передается в terrain_base (noise_map) генератора с
+        размерами карты, уменьшенными в step раз; полный уровень совпадает
+        с шумом terrain_base.
+        """
+        return NoisePyramid(self.width, self.height, **self._terrain_noise_params(scale, roughness))
+    
+    @staticmethod
+    def _noise_params(roughness: float) -> Tuple[int, float]:
+        """Число октав и persistence для заданной шероховатости"""
         adjusted_octaves = max(1, min(6, int(roughness * 6)))
         persistence = 0.4 + roughness * 0.3
+        return adjusted_octaves, persistence
+    
+    def generate_chunk(self, cx: int, cy: int, chunk_size: int = 64,
+                       scale=8.0, roughness=0.5, smooth_iterations=2) -> np.ndarray:
+        """
+        Генерация фрагмента бесконечного мира в мировых координатах
+        
+        Фрагмент (cx, cy) покрывает клетки [cx * chunk_size, (cx + 1) * chunk_size)
+        по x и аналогично по y. Шум нормализуется по глобальному диапазону
+        мира, а сглаживание считается с запасом по краям, поэтому соседние
+        фрагменты стыкуются без швов и совпадают с любым большим окном.
+        Эффект острова к бесконечному миру не применяется.
+        """
+        key = (self.seed, cx, cy, chunk_size, scale, roughness,
+               smooth_iterations, self.water_level)
+        cached = self._chunk_cache.get(key)
+        if cached is not None:
+            self._chunk_cache.move_to_end(key)
+            return cached
+        
+        octaves, persistence = self._noise_params(roughness)
         
-        noise_map = ImprovedNoiseGenerator.perlin_noise(
-            width=self.width,
-            height=self.height,
+        # Каждый проход сглаживания читает соседей на 1 клетку
+        halo = smooth_iterations + 1
+        size = chunk_size + 2 * halo
+        
+        raw = ImprovedNoiseGenerator.perlin_noise(
+            width=size,
+            height=size,
             scale=scale,
-            octaves=adjusted_octaves,
+            octaves=octaves,
             persistence=persistence,
             lacunarity=2.0,
-            seed=self.seed
+            seed=self.seed,
+            x_offset=cx * chunk_size - halo,
+            y_offset=cy * chunk_size - halo,
+            normalize=False
         )
         
-        terrain = (noise_map * 2) - 1
+        min_val, max_val = ImprovedNoiseGenerator.world_noise_range(
+            self.seed, scale, octaves, persistence, 2.0
+        )
+        if max_val > min_val:
+            noise_map = np.clip((raw - min_val) / (max_val - min_val), 0.0, 1.0)
+        else:
+            noise_map = np.full_like(raw, 0.5)
         
-        if island_mode:
-            terrain = self.apply_island_effect(terrain, strength=0.7)
+        terrain = (noise_map * 2) - 1
         
         for _ in range(smooth_iterations):
             terrain = self.smooth_terrain(terrain)
         
-        terrain = self.normalize_terrain(terrain)
         terrain = self.smooth_coastlines(terrain)
+        chunk = terrain[halo:halo + chunk_size, halo:halo + chunk_size].copy()
+        chunk.setflags(write=False)
         
-        self.map_data = terrain
-        return terrain
+        self._chunk_cache[key] = chunk
+        while len(self._chunk_cache) > self.chunk_cache_size:
+            self._chunk_cache.popitem(last=False)
+        
+        return chunk
     
-    def apply_island_effect(self, terrain, strength=0.7):
-        height, width = terrain.shape
+    @staticmethod
+    def chunks_in_view(x: int, y: int, width: int, height: int,
+                       chunk_size: int = 64, margin: int = 0) -> List[Tuple[int, int]]:
+        """
+        Координаты фрагментов, пересекающих окно просмотра
         
-        for y in range(height):
-            for x in range(width):
-                dx = (x / width - 0.5) * 2
-                dy = (y / height - 0.5) * 2
-                distance = math.sqrt(dx*dx + dy*dy)
-                
-                if distance < 0.7:
-                    terrain[y][x] += (1 - distance) * strength * 0.3
-                else:
-                    falloff = (1 - distance) * strength
-                    terrain[y][x] -= abs(falloff) * 0.5
+        Args:
+            margin: Сколько фрагментов добавить вокруг окна (предзагрузка)
+        """
+        cx0 = x // chunk_size - margin
+        cy0 = y // chunk_size - margin
+        cx1 = (x + width - 1) // chunk_size + margin
+        cy1 = (y + height - 1) // chunk_size + margin
+        return [(cx, cy) for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)]
+    
+    def generate_viewport(self, x: int, y: int, width: int, height: int,
+                          chunk_size: int = 64, **chunk_params) -> np.ndarray:
+        """
+        Рельеф окна просмотра мира, собранный из фрагментов
+        
+        Вычисляются только фрагменты, пересекающие окно; уже готовые
+        берутся из кэша. Параметры chunk_params передаются в generate_chunk.
+        """
+        view = np.empty((height, width))
         
+        for cx, cy in self.chunks_in_view(x, y, width, height, chunk_size):
+            chunk = self.generate_chunk(cx, cy, chunk_size, **chunk_params)
+            
+            # Пересечение фрагмента с окном в мировых координатах
+            left = max(x, cx * chunk_size)
+            top = max(y, cy * chunk_size)
+            right = min(x + width, (cx + 1) * chunk_size)
+            bottom = min(y + height, (cy + 1) * chunk_size)
+            
+            view[top - y:bottom - y, left - x:right - x] = chunk[
+                top - cy * chunk_size:bottom - cy * chunk_size,
+                left - cx * chunk_size:right - cx * chunk_size
+            ]
+        
+        return view
+    
+    @timed("terrain.island", cells=lambda self, terrain, *args, **kwargs: terrain.size)
+    def apply_island_effect(self, terrain, strength=0.7, shape=None):
+        """
+        Подъем центра карты и опускание краев (на месте)
+        
+        Args:
+            shape: Форма спада (None - self.island_shape)
+        """
+        height, width = terrain.shape
+        mask = self.falloff_mask(width, height, strength,
+                                 self.island_shape if shape is None else shape)
+        terrain += mask
         return terrain
     
+    @classmethod
+    def register_falloff_shape(cls, name: str,
+                               distance: Callable[[np.ndarray, np.ndarray], np.ndarray]):
+        """Регистрация формы спада: distance(dx, dy) для dx, dy в [-1, 1]"""
+        cls.FALLOFF_SHAPES[name] = distance
+        MapGenerator.falloff_mask.cache_clear()
+    
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def falloff_mask(width: int, height: int, strength: float = 0.7,
+                     shape: Union[str, Callable] = "radial") -> np.ndarray:
+        """
+        Аддитивная маска эффекта острова (кэшируется по размеру, силе и форме)
+        
+        Маска зависит только от этих параметров, поэтому при генерации
+        многих seed одного размера она строится один раз. Возвращаемый
+        массив доступен только для чтения.
+        """
+        distance_func = MapGenerator.FALLOFF_SHAPES[shape] if isinstance(shape, str) else shape
+        
+        dx = (np.arange(width) / width - 0.5) * 2
+        dy = (np.arange(height) / height - 0.5) * 2
+        distance = distance_func(dx[None, :], dy[:, None])
+        distance = np.broadcast_to(distance, (height, width))
+        
+        falloff = (1 - distance) * strength
+        mask = np.where(distance < 0.7, falloff * 0.3, -(np.abs(falloff) * 0.5))
+        mask.setflags(write=False)
+        return mask
+    
+    @staticmethod
+    def _neighborhood(terrain):
+        """
+        Срезы 3x3 окрестности для всех внутренних клеток
+        
+        Возвращает 9 представлений (без копирования) в порядке обхода
+        окрестности построчно; центральная клетка - под индексом 4.
+        """
+        height, width = terrain.shape
+        return [terrain[dy:height - 2 + dy, dx:width - 2 + dx]
+                for dy in range(3) for dx in range(3)]
+    
+    @timed("terrain.smooth", cells=lambda self, terrain: terrain.size)
     def smooth_terrain(self, terrain):
         height, width = terrain.shape
         smoothed = terrain.copy()
+        if height < 3 or width < 3:
+            return smoothed
+        
+        n = self._neighborhood(terrain)
+        
+        # Сумма в том же порядке, что и попарное суммирование np.mean
+        # для 9 элементов: результат совпадает с поклеточной версией бит в бит
+        total = ((n[0] + n[1]) + (n[2] + n[3])) + ((n[4] + n[5]) + (n[6] + n[7]))
+        total += n[8]
+        total /= 9
         
-        for y in range(1, height-1):
-            for x in range(1, width-1):
-                neighbors = [
-                    terrain[y-1][x-1], terrain[y-1][x], terrain[y-1][x+1],
-                    terrain[y][x-1], terrain[y][x], terrain[y][x+1],
-                    terrain[y+1][x-1], terrain[y+1][x], terrain[y+1][x+1]
-                ]
-                smoothed[y][x] = np.mean(neighbors) * 0.7 + terrain[y][x] * 0.3
+        smoothed[1:-1, 1:-1] = total * 0.7 + n[4] * 0.3
         
         return smoothed
     
+    @timed("terrain.coastlines", cells=lambda self, terrain: terrain.size)
     def smooth_coastlines(self, terrain):
         height, width = terrain.shape
         smoothed = terrain.copy()
+        if height < 3 or width < 3:
+            return smoothed
+        
+        water = terrain < self.water_level
+        
+        # Число водных соседей: сумма сдвинутых срезов маски без центра
+        n = self._neighborhood(water.view(np.uint8))
+        water_neighbors = np.zeros((height - 2, width - 2), dtype=np.uint8)
+        for i, shifted in enumerate(n):
+            if i != 4:
+                water_neighbors += shifted
+        
+        current = terrain[1:-1, 1:-1]
+        is_water = water[1:-1, 1:-1]
         
-        for y in range(1, height-1):
-            for x in range(1, width-1):
-                current = terrain[y][x]
-                is_water = current < self.water_level
-                
-                water_neighbors = 0
-                for dy in [-1, 0, 1]:
-                    for dx in [-1, 0, 1]:
-                        if dy == 0 and dx == 0:
-                            continue
-                        ny, nx = y + dy, x + dx
-                        if 0 <= ny < height and 0 <= nx < width:
-                            if terrain[ny][nx] < self.water_level:
-                                water_neighbors += 1
-                
-                if is_water and water_neighbors < 4:
-                    smoothed[y][x] = max(self.water_level + 0.1, current)
-                elif not is_water and water_neighbors > 4:
-                    smoothed[y][x] = min(self.water_level + 0.05, current)
+        inner = smoothed[1:-1, 1:-1]
+        raise_mask = is_water & (water_neighbors < 4)
+        lower_mask = ~is_water & (water_neighbors > 4)
+        inner[raise_mask] = np.maximum(self.water_level + 0.1, current[raise_mask])
+        inner[lower_mask] = np.minimum(self.water_level + 0.05, current[lower_mask])
         
         return smoothed
     
+    @timed("terrain.normalize", cells=lambda self, terrain: terrain.size)
     def normalize_terrain(self, terrain):
         min_val = np.min(terrain)
         max_val = np.max(terrain)
@@ -0,0 +1,365 @@
+"""
+Конвейер генерации карт с отслеживанием зависимостей между этапами
+"""
+
+import copy
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from enhanced_map_generator import EnhancedMapGenerator
+from model_registry import get_registry
+from generation_cache import GenerationCache, generation_key
+from profiling import timed
+
+
+class MapPipeline:
+    """
+    Инкрементальная генерация карт
+    
+    Этапы и их входные данные:
+        terrain  - seed, размеры, масштаб, шероховатость (рельеф до
+                   сглаживания побережий)
+        coast    - terrain, уровень воды
+        noise    - seed, размеры, масштаб (шум влажности и температуры)
+        climate  - coast, noise, влажность лесов/пустынь, температура
+        biomes   - climate, все настройки биомов, ML
+        images   - biomes
+    
+    Каждый результат хранится вместе с ключом из его входных данных; этап
+    пересчитывается только если ключ изменился. Рельеф и шум хранятся в
+    LRU кэше (noise_cache_size наборов), поэтому возврат к недавним
+    параметрам тоже не требует генерации шума. Изменение ползунков
+    биомов пересчитывает только климат и классификацию.
+    
+    Если задан cache (GenerationCache), готовые карты берутся с диска по
+    ключу из всех входных данных, а новые сохраняются в него.
+    
+    preview() строит уменьшенные карты по уровням NoisePyramid; шум,
+    вычисленный для предпросмотра, используется следующим update() с теми
+    же параметрами вместо генерации шума заново.
+    
+    Методы потокобезопасны: одновременно выполняется одно обновление.
+    """
+    
+    def __init__(self, auto_train: bool = True, noise_cache_size: int = 8,
+                 cache: Optional[GenerationCache] = None):
+        self.auto_train = auto_train
+        self.noise_cache_size = noise_cache_size
+        self.cache = cache
+        self.generator: Optional[EnhancedMapGenerator] = None
+        
+        # LRU кэши шума: ключ -> массив(ы)
+        self._terrain_cache = OrderedDict()
+        self._noise_cache = OrderedDict()
+        
+        # Пирамиды шума предпросмотра: (этап, ключ) -> пирамиды
+        self._pyramids = OrderedDict()
+        
+        # Последние результаты этапов: этап -> (ключ, значение)
+        self._results: Dict[str, Tuple[Any, Any]] = {}
+        self._lock = threading.RLock()
+    
+    def _get_generator(self, width: int, height: int, use_ml: bool) -> EnhancedMapGenerator:
+        """Генератор конвейера (создается один раз)"""
+        if self.generator is None:
+            self.generator = EnhancedMapGenerator(
+                width, height, use_ml=use_ml, auto_train=self.auto_train
+            )
+        
+        gen = self.generator
+        gen.width = width
+        gen.height = height
+        
+        # Модель общая для процесса: загружается один раз и перечитывается,
+        # если файлы на диске изменились; новая модель меняет ключ этапа biomes
+        if use_ml:
+            get_registry().ensure_model(auto_train=self.auto_train)
+        gen.set_ml_enabled(use_ml)
+        return gen
+    
+    def invalidate(self):
+        """Сброс всех кэшированных результатов"""
+        with self._lock:
+            self._terrain_cache.clear()
+            self._noise_cache.clear()
+            self._pyramids.clear()
+            self._results.clear()
+    
+    def _cached(self, cache: OrderedDict, key, compute: Callable[[], Any]):
+        """Значение из LRU кэша или вычисленное заново; второй элемент - пересчитано ли"""
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key], False
+        
+        value = compute()
+        cache[key] = value
+        while len(cache) > max(1, self.noise_cache_size):
+            cache.popitem(last=False)
+        return value, True
+    
+    def _stage(self, name: str, key, compute: Callable[[], Any]):
+        """Результат этапа: последний, если ключ совпадает, иначе вычисленный"""
+        cached = self._results.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1], False
+        
+        value = compute()
+        self._results[name] = (key, value)
+        return value, True
+    
+    def _refined(self, stage: str, key):
+        """
+        Полный уровень пирамид шума, оставшихся от предпросмотра
+        
+        Returns:
+            Массив (или кортеж массивов для нескольких пирамид) либо None,
+            если пирамид для ключа нет
+        """
+        pyramids = self._pyramids.pop((stage, key), None)
+        if pyramids is None:
+            return None
+        
+        levels = tuple(pyramid.refine(1) for pyramid in pyramids)
+        return levels if len(levels) > 1 else levels[0]
+    
+    @staticmethod
+    def _frozen(*arrays):
+        for array in arrays:
+            array.flags.writeable = False
+        return arrays if len(arrays) > 1 else arrays[0]
+    
+    @timed("pipeline.update")
+    def update(self, params: Dict[str, Any], biome_params: Dict[str, float],
+               progress: Optional[Callable[[str], None]] = None,
+               images: Optional[Callable[[EnhancedMapGenerator], Dict[str, np.ndarray]]] = None,
+               store: bool = True) -> Dict[str, Any]:
+        """
+        Приведение карты к новым параметрам с пересчетом только нужных этапов
+        
+        Args:
+            params: Параметры генерации (width, height, scale, roughness,
+                seed, use_ml); seed None - случайный
+            biome_params: Настройки биомов (water, mountain, desert, forest,
+                temperature)
+            progress: Вызывается с именем этапа перед его выполнением;
+                может прервать обновление исключением
+            images: Функция подготовки изображений по генератору (этап images)
+            store: Сохранить новую карту в дисковый кэш; False - сохранение
+                откладывается до вызова store(result)
+        
+        Returns:
+            Словарь: map_gen (снимок генератора), params (параметры с
+            выбранным seed), terrain, moisture, temperature, biomes,
+            images, recomputed (пересчитанные этапы), cached (карта
+            взята из дискового кэша), cache_key (ключ, под которым карта
+            еще не сохранена в кэш, или None)
+        """
+        with self._lock:
+            gen, params = self._prepare(params, biome_params)
+            width, height = int(params['width']), int(params['height'])
+            scale, roughness = float(params['scale']), float(params['roughness'])
+            relief = self._relief_options(params)
+            seed = params['seed']
+            
+            recomputed = []
+            
+            def run(name, compute):
+                if progress is not None:
+                    progress(name)
+                recomputed.append(name)
+                return compute()
+            
+            # Готовая карта из дискового кэша
+            cache_key = generation_key(gen, params) if self.cache is not None else None
+            archive = self.cache.get(cache_key) if cache_key is not None else None
+            if archive is not None:
+                archive.restore(gen)
+                biome_key = ('cache', cache_key)
+            else:
+                biome_key = self._compute(gen, seed, width, height, scale, roughness, relief, run)
+            
+            # Изображения
+            rendered = None
+            if images is not None:
+                rendered, _ = self._stage("images", (biome_key, images), lambda: run(
+                    "images", lambda: images(gen)
+                ))
+            
+            result = {
+                'map_gen': copy.copy(gen),
+                'params': params,
+                'terrain': gen.map_data,
+                'moisture': gen.moisture_data,
+                'temperature': gen.temperature_data,
+                'biomes': gen.biome_data,
+                'images': rendered,
+                'recomputed': recomputed,
+                'cached': archive is not None,
+                'cache_key': cache_key if archive is None else None,
+            }
+        
+        if store:
+            self.store(result)
+        return result
+    
+    def store(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        Сохранение результата update(..., store=False) в дисковый кэш
+        
+        Returns:
+            Путь к архиву или None, если сохранять нечего
+        """
+        cache_key = result.get('cache_key')
+        if self.cache is None or cache_key is None:
+            return None
+        
+        params = result['params']
+        path = self.cache.put(cache_key, result['map_gen'], {
+            'scale': float(params['scale']), 'roughness': float(params['roughness'])
+        })
+        result['cache_key'] = None
+        return path
+    
+    def _prepare(self, params: Dict[str, Any], biome_params: Dict[str, float]
+                 ) -> Tuple[EnhancedMapGenerator, Dict[str, Any]]:
+        """Генератор с примененными параметрами и параметры с выбранным seed"""
+        seed = params['seed'] if params['seed'] is not None else random.randint(1, 1000000)
+        
+        gen = self._get_generator(int(params['width']), int(params['height']), params['use_ml'])
+        gen.set_seed(seed)
+        gen.adjust_water_amount(biome_params['water'])
+        gen.adjust_mountain_amount(biome_params['mountain'])
+        gen.adjust_desert_amount(biome_params['desert'])
+        gen.adjust_forest_amount(biome_params['forest'])
+        gen.adjust_temperature_amount(biome_params['temperature'])
+        return gen, dict(params, seed=seed)
+    
+    def _pyramid(self, stage: str, key, create: Callable[[], Tuple]):
+        """Пирамиды шума этапа для ключа (создаются при первом обращении)"""
+        pyramid_key = (stage, key)
+        if pyramid_key not in self._pyramids:
+            self._pyramids[pyramid_key] = create()
+            # Пирамида хранит массив размера карты: держим только
+            # пирамиды последних параметров
+            while len(self._pyramids) > 2:
+                self._pyramids.popitem(last=False)
+        return self._pyramids[pyramid_key]
+    
+    @timed("pipeline.preview")
+    def preview(self, params: Dict[str, Any], biome_params: Dict[str, float], step: int,
+                images: Optional[Callable[[EnhancedMapGenerator], Dict[str, np.ndarray]]] = None
+                ) -> Optional[Dict[str, Any]]:
+        """
+        Карта, уменьшенная в step раз, для быстрого предпросмотра
+        
+        Шум берется из уровня step пирамид NoisePyramid (с меньшим числом
+        октав на грубых уровнях); пирамиды сохраняются, и следующий
+        preview() с меньшим шагом или update() только уточняют их.
+        Дальнейшие этапы (остров, сглаживание, климат, биомы) выполняются
+        на уменьшенной карте.
+        
+        Returns:
+            Словарь: map_gen (генератор уменьшенной карты), params
+            (параметры с выбранным seed - их нужно передать в update),
+            step, images; None, если предпросмотр не нужен, потому что
+            рельеф уже есть в кэше конвейера или карта - в дисковом кэше
+        """
+        with self._lock:
+            gen, params = self._prepare(params, biome_params)
+            width, height = int(params['width']), int(params['height'])
+            scale, roughness = float(params['scale']), float(params['roughness'])
+            relief = self._relief_options(params)
+            seed = params['seed']
+            
+            terrain_key = (seed, width, height, scale, roughness, relief)
+            if terrain_key in self._terrain_cache:
+                return None
+            if self.cache is not None:
+                cache_key = generation_key(gen, params)
+                if cache_key is not None and os.path.exists(self.cache.path(cache_key)):
+                    return None
+            
+            terrain_pyramid, = self._pyramid("terrain", terrain_key, lambda: (
+                gen.terrain_pyramid(scale=scale, roughness=roughness),
+            ))
+            climate_pyramids = self._pyramid("noise", (seed, width, height, scale),
+                                             lambda: gen.climate_pyramids(scale))
+            
+            preview = gen.preview_generator(step)
+            base = preview.terrain_base(scale=scale, roughness=roughness,
+                                        island_mode=relief[0], smooth_iterations=relief[1],
+                                        noise_map=terrain_pyramid.refine(step))
+            preview.map_data = preview.smooth_coastlines(base)
+            preview.climate_from_noise(*(pyramid.refine(step) for pyramid in climate_pyramids))
+            preview.generate_biome_map()
+            
+            return {
+                'map_gen': preview,
+                'params': params,
+                'step': step,
+                'images': images(preview) if images is not None else None,
+            }
+    
+    @staticmethod
+    def _relief_options(params: Dict[str, Any]) -> Tuple[bool, int]:
+        """island_mode и smooth_iterations из параметров (по умолчанию как в generate_terrain)"""
+        return bool(params.get('island_mode', True)), int(params.get('smooth_iterations', 2))
+    
+    def _compute(self, gen: EnhancedMapGenerator, seed: int, width: int, height: int,
+                 scale: float, roughness: float, relief: Tuple[bool, int], run) -> Any:
+        """
+        Этапы terrain - biomes с пересчетом только измененных
+        
+        Returns:
+            Ключ этапа biomes (входные данные изображений)
+        """
+        # Рельеф
+        terrain_key = (seed, width, height, scale, roughness, relief)
+        base, _ = self._cached(self._terrain_cache, terrain_key, lambda: run(
+            "terrain", lambda: self._frozen(gen.terrain_base(
+                scale=scale, roughness=roughness,
+                island_mode=relief[0], smooth_iterations=relief[1],
+                noise_map=self._refined("terrain", terrain_key)
+            ))
+        ))
+        
+        # Побережья
+        coast_key = (terrain_key, gen.water_level)
+        terrain, _ = self._stage("coast", coast_key, lambda: run(
+            "coast", lambda: self._frozen(gen.smooth_coastlines(base))
+        ))
+        gen.map_data = terrain
+        
+        # Шум климата
+        noise_key = (seed, width, height, scale)
+        noise, _ = self._cached(self._noise_cache, noise_key, lambda: run(
+            "noise", lambda: self._frozen(*(self._refined("noise", noise_key)
+                                            or gen.climate_noise(scale)))
+        ))
+        
+        # Климат
+        climate_key = (coast_key, noise_key, gen.forest_amount, gen.desert_amount,
+                       gen.temperature_amount, np.dtype(gen.climate_dtype).str)
+        climate, _ = self._stage("climate", climate_key, lambda: run(
+            "climate", lambda: self._frozen(*gen.climate_from_noise(*noise))
+        ))
+        gen.moisture_data, gen.temperature_data = climate
+        
+        # Биомы
+        classifier = gen.ml_classifier
+        biome_key = (climate_key, gen.water_level, gen.mountain_level,
+                     gen.desert_moisture, gen.forest_moisture,
+                     gen.water_amount, gen.mountain_amount,
+                     gen.desert_amount, gen.forest_amount,
+                     gen.ml_enabled, classifier.model_version,
+                     classifier.use_compiled)
+        biome_result, _ = self._stage("biomes", biome_key, lambda: run(
+            "biomes", lambda: (self._frozen(gen.generate_biome_map()), gen.ml_predictions)
+        ))
+        gen.biome_data, gen.ml_predictions = biome_result
+        return biome_key
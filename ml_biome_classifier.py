@@ -9,11 +9,64 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import classification_report, accuracy_score
+import hashlib
+import itertools
 import time
-from typing import List, Tuple, Optional
+import threading
+from typing import Callable, Iterable, Iterator, List, Tuple, Optional
 import os
 
-from biomes import BiomeType, BiomeSystem
+from biomes import BiomeType, BiomeSystem, BIOME_INDEX, BIOME_TYPES, encode_biomes
+from compiled_tree import CompiledTree, distill_forest
+from profiling import stage, timed
+
+# Индекс для классов модели, которым не соответствует ни один биом
+UNKNOWN_BIOME_INDEX = 255
+
+# Файлы обученной модели: модель, масштабировщик, кодировщик меток
+MODEL_DIR = 'models'
+MODEL_FILES = (
+    os.path.join(MODEL_DIR, 'biome_rf_model.pkl'),
+    os.path.join(MODEL_DIR, 'biome_scaler.pkl'),
+    os.path.join(MODEL_DIR, 'biome_label_encoder.pkl'),
+)
+
+# Лес, дистиллированный в одно дерево (см. compiled_tree)
+COMPILED_MODEL_FILE = os.path.join(MODEL_DIR, 'biome_tree.npz')
+
+# Номера версий моделей, уникальные в пределах процесса (см. model_version)
+_model_versions = itertools.count(1)
+
+
+
+def model_files_fingerprint() -> Optional[str]:
+    """SHA-256 содержимого файлов модели на диске (None если файлов нет)"""
+    digest = hashlib.sha256()
+    found = False
+    for path in MODEL_FILES + (COMPILED_MODEL_FILE,):
+        if not os.path.exists(path):
+            continue
+        found = True
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest() if found else None
+
+
+# Диапазоны признаков тренировочных примеров (в порядке признаков модели)
+FEATURE_RANGES = np.array([
+    (-1.0, 1.0),    # Высота
+    (0.0, 1.0),     # Влажность
+    (0.0, 1.0),     # Температура
+    (-0.8, 0.0),    # Уровень воды
+    (0.2, 0.8),     # Уровень гор
+    (0.1, 0.5),     # Пустынная влажность
+    (0.4, 0.9),     # Лесная влажность
+])
+
+# Метки классов (значения BiomeType) в порядке BIOME_TYPES
+BIOME_LABELS = np.array([biome.value for biome in BIOME_TYPES])
 
 
 class MLBiomeClassifier:
@@ -33,8 +86,29 @@ class MLBiomeClassifier:
         self.model = None
         self.scaler = None
         self.label_encoder = None
+        self.compiled = None
         self.biome_system = BiomeSystem()
+        
+        # Отпечаток файлов, из которых загружена (или в которые сохранена)
+        # модель; None - модель не совпадает ни с какими файлами
+        self.fingerprint = None
+        # Номер версии модели: меняется при каждой замене леса или дерева,
+        # ключ кэша результатов предсказания
+        self.model_version = next(_model_versions)
         self.is_trained = False
+        self.predict_chunk_size = 65536
+        
+        # Предсказание скомпилированным деревом вместо леса (если оно есть).
+        # Дерево только приближает лес (см. compile_model), поэтому
+        # включается явно; без леса дерево используется всегда
+        self.use_compiled = False
+        
+        # Таблица класс модели -> индекс BIOME_TYPES (строится по label_encoder)
+        self._biome_lookup = None
+        self._lookup_encoder = None
+        
+        # Защищает согласованную замену model/scaler/label_encoder
+        self._lock = threading.RLock()
         
         if use_ml:
             self.load_model()
@@ -42,78 +116,184 @@ class MLBiomeClassifier:
                 print("Автоматическое обучение модели...")
                 self.train_model(samples=50000, save=True)
     
+    @timed("ml.load")
     def load_model(self):
-        """Загрузка обученной модели"""
+        """
+        Загрузка обученной модели
+        
+        Загружаются лес и скомпилированное дерево; для предсказаний по сетке
+        достаточно одного дерева.
+        """
+        model = scaler = label_encoder = compiled = None
+        fingerprint = model_files_fingerprint()
         try:
-            self.model = joblib.load('models/biome_rf_model.pkl')
-            self.scaler = joblib.load('models/biome_scaler.pkl')
-            self.label_encoder = joblib.load('models/biome_label_encoder.pkl')
-            self.is_trained = True
-            print("ML модель успешно загружена")
+            model, scaler, label_encoder = (joblib.load(path) for path in MODEL_FILES)
         except Exception as e:
+            model = scaler = label_encoder = None
             print(f"Не удалось загрузить модель: {e}")
-            self.is_trained = False
+        
+        if os.path.exists(COMPILED_MODEL_FILE):
+            try:
+                compiled = CompiledTree.load(COMPILED_MODEL_FILE)
+            except Exception as e:
+                print(f"Не удалось загрузить скомпилированное дерево: {e}")
+        
+        if model is None and compiled is None:
+            with self._lock:
+                self.is_trained = False
+            return
+        
+        self.set_model(model, scaler, label_encoder, compiled, fingerprint)
+        if model is None:
+            print("Загружено скомпилированное дерево (без леса)")
+        else:
+            print("ML модель успешно загружена")
+    
+    def set_model(self, model, scaler, label_encoder, compiled: Optional[CompiledTree] = None,
+                  fingerprint: Optional[str] = None):
+        """
+        Замена обученной модели
+        
+        Модель, масштабировщик, кодировщик меток и скомпилированное дерево
+        заменяются вместе, поэтому предсказания в других потоках видят либо
+        старый, либо новый набор.
+        
+        Args:
+            fingerprint: Отпечаток файлов модели (model_files_fingerprint),
+                если модель совпадает с файлами на диске
+        """
+        with self._lock:
+            self.model = model
+            self.scaler = scaler
+            self.label_encoder = label_encoder
+            self.compiled = compiled
+            self.fingerprint = fingerprint
+            self.model_version = next(_model_versions)
+            self.is_trained = model is not None or compiled is not None
+    
+    def _snapshot(self):
+        """Согласованный набор (model, scaler, label_encoder, compiled) для предсказания"""
+        with self._lock:
+            return self.model, self.scaler, self.label_encoder, self.compiled
+    
+    def _backend(self):
+        """
+        Модель для предсказания: (model, scaler, label_encoder, compiled)
+        
+        compiled не None, только если предсказывать нужно деревом
+        (use_compiled или леса нет); predict_biome и predict_biome_grid
+        всегда используют одну и ту же модель.
+        """
+        model, scaler, label_encoder, compiled = self._snapshot()
+        if model is not None and not self.use_compiled:
+            compiled = None
+        return model, scaler, label_encoder, compiled
     
     def save_model(self):
         """Сохранение обученной модели"""
-        import os
-        os.makedirs('models', exist_ok=True)
+        os.makedirs(MODEL_DIR, exist_ok=True)
         
-        if self.model and self.scaler and self.label_encoder:
-            joblib.dump(self.model, 'models/biome_rf_model.pkl')
-            joblib.dump(self.scaler, 'models/biome_scaler.pkl')
-            joblib.dump(self.label_encoder, 'models/biome_label_encoder.pkl')
+        model, scaler, label_encoder, compiled = self._snapshot()
+        if model and scaler and label_encoder:
+            for obj, path in zip((model, scaler, label_encoder), MODEL_FILES):
+                joblib.dump(obj, path)
             print("ML модель сохранена")
+        
+        if compiled is not None:
+            compiled.save(COMPILED_MODEL_FILE)
+            print(f"Скомпилированное дерево сохранено ({compiled.node_count} узлов)")
+        elif model and os.path.exists(COMPILED_MODEL_FILE):
+            # Дерево от прежней модели не должно загрузиться вместе с новой
+            os.remove(COMPILED_MODEL_FILE)
+        
+        with self._lock:
+            if self.model is model and self.compiled is compiled:
+                self.fingerprint = model_files_fingerprint()
+    
+    @timed("ml.compile")
+    def compile_model(self, samples: int = 200000, max_depth: int = 24) -> Optional[CompiledTree]:
+        """
+        Дистилляция леса в одно дерево из плоских массивов
+        
+        Дерево обучается повторять ответы леса на samples примерах и
+        вычисляется по уровням сразу для всей сетки (CompiledTree.predict)
+        вместо обхода всех деревьев леса для каждой клетки. Оно примерно
+        в 10 раз быстрее, но только приближает лес (совпадение печатается;
+        на картах расходятся единицы процентов клеток), поэтому для
+        предсказания используется только при use_compiled = True.
+        
+        Returns:
+            Скомпилированное дерево или None если лес не обучен
+        """
+        model, scaler, label_encoder, _ = self._snapshot()
+        if model is None:
+            return None
+        
+        print(f"Компиляция модели в дерево ({samples} примеров)...")
+        X, _ = self.generate_training_data(num_samples=samples)
+        lookup = self._class_lookup(label_encoder)
+        compiled = distill_forest(
+            lambda features: model.predict(scaler.transform(features)),
+            X, lookup, max_depth=max_depth
+        )
+        
+        agreement = float(np.mean(compiled.predict(X) == lookup[model.predict(scaler.transform(X))]))
+        print(f"  Узлов: {compiled.node_count}, глубина: {compiled.depth}, "
+              f"размер: {compiled.nbytes / 1024:.1f} КБ, совпадение с лесом: {agreement:.4f}")
+        
+        with self._lock:
+            if self.model is model:
+                self.compiled = compiled
+                self.fingerprint = None
+                self.model_version = next(_model_versions)
+        return compiled
     
-    def generate_training_data(self, num_samples: int = 100000) -> Tuple[np.ndarray, np.ndarray]:
+    def generate_training_data(self, num_samples: int = 100000,
+                               seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
         """
         Генерация тренировочных данных на основе правил
         
         Args:
             num_samples: Количество примеров для генерации
+            seed: Seed генератора случайных чисел
             
         Returns:
             X: Признаки (elevation, moisture, temperature, water_level, mountain_level, desert_moisture, forest_moisture)
             y: Метки классов (биомы)
         """
         print(f"Генерация {num_samples} тренировочных примеров...")
+        return next(self.iter_training_data(num_samples, chunk_size=max(1, num_samples), seed=seed),
+                    (np.empty((0, len(FEATURE_RANGES))), BIOME_LABELS[:0]))
+    
+    def iter_training_data(self, num_samples: int, chunk_size: int = 100000,
+                           seed: int = 42) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Потоковая генерация тренировочных данных блоками
+        
+        Признаки блока выбираются одним вызовом Generator.uniform (форма
+        (n, 7)), метки - классификацией по правилам для всего блока
+        (BiomeSystem.classify_biome_grid). В памяти одновременно только
+        один блок; блоки вместе дают те же примеры, что и
+        generate_training_data с тем же seed.
+        
+        Yields:
+            (X, y) блока из не более чем chunk_size примеров
+        """
+        rng = np.random.default_rng(seed)
+        low, high = FEATURE_RANGES[:, 0], FEATURE_RANGES[:, 1]
         
-        X = []
-        y = []
-        
-        # Генерируем случайные параметры
-        np.random.seed(42)
-        
-        for i in range(num_samples):
-            # Случайные параметры карты
-            elevation = np.random.uniform(-1.0, 1.0)
-            moisture = np.random.uniform(0.0, 1.0)
-            temperature = np.random.uniform(0.0, 1.0)
-            water_level = np.random.uniform(-0.8, 0.0)
-            mountain_level = np.random.uniform(0.2, 0.8)
-            desert_moisture = np.random.uniform(0.1, 0.5)
-            forest_moisture = np.random.uniform(0.4, 0.9)
+        for start in range(0, num_samples, chunk_size):
+            count = min(chunk_size, num_samples - start)
+            X = rng.uniform(low, high, size=(count, len(FEATURE_RANGES)))
             
             # Классификация по правилам (ground truth)
-            biome = self.biome_system.classify_biome(
-                elevation, moisture, temperature,
-                water_level, mountain_level,
-                desert_moisture, forest_moisture
-            )
-            
-            X.append([elevation, moisture, temperature,
-                     water_level, mountain_level,
-                     desert_moisture, forest_moisture])
-            y.append(biome.value)
-            
-            # Прогресс
-            if (i + 1) % 10000 == 0:
-                print(f"  Сгенерировано {i + 1}/{num_samples} примеров")
-        
-        return np.array(X), np.array(y)
+            labels = self.biome_system.classify_biome_grid(*X.T)
+            yield X, BIOME_LABELS[labels]
     
+    @timed("ml.train")
     def train_model(self, samples: int = 50000, save: bool = True, 
-                   test_size: float = 0.2, random_state: int = 42):
+                   test_size: float = 0.2, random_state: int = 42,
+                   compile_tree: bool = False):
         """
         Обучение модели классификации биомов
         
@@ -122,6 +302,9 @@ class MLBiomeClassifier:
             save: Сохранять ли модель после обучения
             test_size: Доля тестовых данных
             random_state: Seed для воспроизводимости
+            compile_tree: Дистиллировать лес в одно дерево (compile_model,
+                около 200k предсказаний леса и обучение дерева - время
+                обучения почти удваивается)
         """
         print("=" * 60)
         print("ОБУЧЕНИЕ МОДЕЛИ КЛАССИФИКАЦИИ БИОМОВ")
@@ -132,13 +315,17 @@ class MLBiomeClassifier:
         # Генерация данных
         X, y = self.generate_training_data(num_samples=samples)
         
+        # Модель обучается в локальных переменных и заменяет прежнюю
+        # целиком (set_model): классификатор может использоваться другими
+        # потоками во время обучения
+        
         # Кодирование меток
-        self.label_encoder = LabelEncoder()
-        y_encoded = self.label_encoder.fit_transform(y)
+        label_encoder = LabelEncoder()
+        y_encoded = label_encoder.fit_transform(y)
         
         # Нормализация признаков
-        self.scaler = StandardScaler()
-        X_scaled = self.scaler.fit_transform(X)
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
         
         # Разделение на тренировочную и тестовую выборки
         X_train, X_test, y_train, y_test = train_test_split(
@@ -155,7 +342,7 @@ class MLBiomeClassifier:
         print("\nОбучение Random Forest классификатора...")
         
         # Быстрая модель для начала
-        self.model = RandomForestClassifier(
+        model = RandomForestClassifier(
             n_estimators=100,
             max_depth=15,
             min_samples_split=5,
@@ -164,11 +351,11 @@ class MLBiomeClassifier:
             n_jobs=-1  # Использовать все ядра
         )
         
-        self.model.fit(X_train, y_train)
+        model.fit(X_train, y_train)
         
         # Оценка модели
-        train_score = self.model.score(X_train, y_train)
-        test_score = self.model.score(X_test, y_test)
+        train_score = model.score(X_train, y_train)
+        test_score = model.score(X_test, y_test)
         
         print("\n" + "=" * 60)
         print("РЕЗУЛЬТАТЫ ОБУЧЕНИЯ")
@@ -177,9 +364,9 @@ class MLBiomeClassifier:
         print(f"Точность на тестовой выборке:  {test_score:.4f}")
         
         # Детальная классификация
-        y_pred = self.model.predict(X_test)
+        y_pred = model.predict(X_test)
         report = classification_report(y_test, y_pred, 
-                                      target_names=self.label_encoder.classes_,
+                                      target_names=label_encoder.classes_,
                                       zero_division=0)
         print("\nОтчет по классификации:\n")
         print(report)
@@ -189,7 +376,7 @@ class MLBiomeClassifier:
                         'Уровень воды', 'Уровень гор', 
                         'Пустынная влажность', 'Лесная влажность']
         
-        importances = self.model.feature_importances_
+        importances = model.feature_importances_
         indices = np.argsort(importances)[::-1]
         
         print("\nВажность признаков:")
@@ -200,12 +387,169 @@ class MLBiomeClassifier:
         training_time = time.time() - start_time
         print(f"\nВремя обучения: {training_time:.2f} секунд")
         
-        self.is_trained = True
+        self.set_model(model, scaler, label_encoder)
+        
+        if compile_tree:
+            self.compile_model()
         
         # Сохранение модели
         if save:
             self.save_model()
     
+    @timed("ml.train_streaming")
+    def train_model_streaming(self, samples: int = 1000000, chunks: Optional[Iterable] = None,
+                              chunk_size: int = 100000, n_estimators: int = 100,
+                              n_chunks: Optional[int] = None,
+                              test_samples: int = 20000, save: bool = True,
+                              random_state: int = 42, compile_tree: bool = False,
+                              progress: Optional[Callable[[int, Optional[int], int], None]] = None):
+        """
+        Потоковое обучение модели блоками данных
+        
+        Лес растет с warm_start: каждая группа подряд идущих блоков обучает
+        несколько новых деревьев и затем освобождается. Блоков в группе
+        столько, чтобы групп было не больше n_estimators, поэтому лес не
+        превышает n_estimators деревьев, а в обучении участвует каждый
+        блок; в памяти одновременно одна группа и сами деревья.
+        
+        Кодировщик меток обучается сразу на всех биомах, масштабировщик - на
+        первом блоке (деревьям масштаб признаков не важен, нужен лишь один
+        и тот же для всех блоков). Если в блоке нет какого-то биома,
+        к нему добавляются опорные примеры этого биома, чтобы все деревья
+        леса знали одинаковый набор классов. Качество оценивается на
+        отдельной синтетической выборке из test_samples примеров.
+        
+        Args:
+            samples: Количество синтетических примеров (если chunks не задан)
+            chunks: Итератор блоков (X, y), например из
+                iter_training_data или EnhancedMapGenerator.iter_training_data
+                для признаков реальных карт; y - значения BiomeType
+            chunk_size: Размер блока синтетических данных
+            n_estimators: Число деревьев леса
+            n_chunks: Число блоков в chunks (по нему блоки делятся на
+                группы); None - len(chunks), если он есть
+            test_samples: Размер проверочной выборки
+            save: Сохранять ли модель после обучения
+            random_state: Seed для воспроизводимости
+            compile_tree: Дистиллировать лес в одно дерево (compile_model,
+                около 200k предсказаний леса и обучение дерева - время
+                обучения почти удваивается)
+            progress: Вызывается после каждой группы с (обработано примеров,
+                всего примеров или None, деревьев в лесу)
+        """
+        print("=" * 60)
+        print("ПОТОКОВОЕ ОБУЧЕНИЕ МОДЕЛИ КЛАССИФИКАЦИИ БИОМОВ")
+        print("=" * 60)
+        
+        start_time = time.time()
+        
+        total = None
+        if chunks is None:
+            total = samples
+            chunks = self.iter_training_data(samples, chunk_size=chunk_size, seed=random_state)
+            n_chunks = -(-samples // chunk_size)
+        elif n_chunks is None:
+            if not hasattr(chunks, '__len__'):
+                raise ValueError("Для итератора chunks без len() нужно указать n_chunks")
+            n_chunks = len(chunks)
+        
+        # Блоки объединяются в группы так, чтобы групп было не больше
+        # n_estimators; деревья распределяются по группам поровну
+        group_chunks = max(1, -(-max(1, n_chunks) // n_estimators))
+        n_groups = max(1, -(-max(1, n_chunks) // group_chunks))
+        
+        label_encoder = LabelEncoder().fit(BIOME_LABELS)
+        all_classes = np.arange(len(label_encoder.classes_))
+        
+        # Опорные примеры: по несколько на каждый биом
+        X_anchor, y_anchor = self.generate_training_data(num_samples=20000, seed=random_state + 2)
+        y_anchor = label_encoder.transform(y_anchor)
+        anchor_rows = np.concatenate([np.flatnonzero(y_anchor == c)[:5] for c in all_classes])
+        X_anchor, y_anchor = X_anchor[anchor_rows], y_anchor[anchor_rows]
+        
+        scaler = None
+        model = RandomForestClassifier(
+            n_estimators=0,
+            max_depth=15,
+            min_samples_split=5,
+            min_samples_leaf=2,
+            random_state=random_state,
+            warm_start=True,
+            n_jobs=-1
+        )
+        
+        processed = 0
+        fitted_groups = 0
+        
+        def fit_group(group, trees):
+            nonlocal processed, fitted_groups
+            X = np.concatenate([X for X, _ in group])
+            y_encoded = np.concatenate([y for _, y in group])
+            processed += len(y_encoded)
+            
+            missing = np.setdiff1d(all_classes, y_encoded)
+            if len(missing):
+                extra = np.isin(y_anchor, missing)
+                X = np.concatenate([X, X_anchor[extra]])
+                y_encoded = np.concatenate([y_encoded, y_anchor[extra]])
+            
+            model.n_estimators += trees
+            model.fit(scaler.transform(X), y_encoded)
+            fitted_groups += 1
+            
+            print(f"  Обработано {processed}" + (f"/{total}" if total else "") +
+                  f" примеров, деревьев: {model.n_estimators}")
+            if progress is not None:
+                progress(processed, total, model.n_estimators)
+        
+        group = []
+        for X, y in chunks:
+            if scaler is None:
+                scaler = StandardScaler().fit(X)
+            group.append((X, label_encoder.transform(y)))
+            
+            # Последняя группа собирает все оставшиеся блоки (в том числе
+            # сверх n_chunks), поэтому в обучении участвует каждый блок
+            if len(group) == group_chunks and fitted_groups < n_groups - 1:
+                trees = (n_estimators * (fitted_groups + 1) // n_groups
+                         - n_estimators * fitted_groups // n_groups)
+                fit_group(group, trees)
+                group = []
+        
+        if group:
+            fit_group(group, n_estimators - model.n_estimators)
+        
+        if scaler is None:
+            raise ValueError("Нет данных для обучения")
+        
+        # Оценка на отдельной выборке
+        X_test, y_test = self.generate_training_data(num_samples=test_samples, seed=random_state + 1)
+        y_test = label_encoder.transform(y_test)
+        y_pred = model.predict(scaler.transform(X_test))
+        
+        print("\n" + "=" * 60)
+        print("РЕЗУЛЬТАТЫ ОБУЧЕНИЯ")
+        print("=" * 60)
+        print(f"Примеров: {processed}, деревьев: {model.n_estimators}")
+        print(f"Точность на тестовой выборке:  {accuracy_score(y_test, y_pred):.4f}")
+        print("\nОтчет по классификации:\n")
+        print(classification_report(y_test, y_pred, labels=all_classes,
+                                    target_names=label_encoder.classes_,
+                                    zero_division=0))
+        
+        training_time = time.time() - start_time
+        print(f"\nВремя обучения: {training_time:.2f} секунд")
+        
+        # Готовая модель заменяет старую целиком
+        model.warm_start = False
+        self.set_model(model, scaler, label_encoder)
+        
+        if compile_tree:
+            self.compile_model()
+        
+        if save:
+            self.save_model()
+    
     def predict_biome(self, elevation: float, moisture: float, temperature: float,
                      water_level: float, mountain_level: float,
                      desert_moisture: float, forest_moisture: float) -> Optional[BiomeType]:
@@ -233,14 +577,19 @@ class MLBiomeClassifier:
                                 water_level, mountain_level,
                                 desert_moisture, forest_moisture]])
             
+            model, scaler, label_encoder, compiled = self._backend()
+            if compiled is not None:
+                index = int(compiled.predict(features)[0])
+                return BIOME_TYPES[index] if index != UNKNOWN_BIOME_INDEX else None
+            
             # Масштабирование
-            features_scaled = self.scaler.transform(features)
+            features_scaled = scaler.transform(features)
             
             # Предсказание
-            prediction = self.model.predict(features_scaled)[0]
+            prediction = model.predict(features_scaled)[0]
             
             # Декодирование
-            biome_str = self.label_encoder.inverse_transform([prediction])[0]
+            biome_str = label_encoder.inverse_transform([prediction])[0]
             
             # Преобразование в BiomeType
             for biome in BiomeType:
@@ -252,7 +601,72 @@ class MLBiomeClassifier:
         except Exception as e:
             print(f"Ошибка при предсказании: {e}")
             return None
+    
+    def _class_lookup(self, label_encoder) -> np.ndarray:
+        """Таблица перевода номеров классов модели в индексы BIOME_TYPES"""
+        with self._lock:
+            if self._lookup_encoder is not label_encoder:
+                lookup = np.full(len(label_encoder.classes_), UNKNOWN_BIOME_INDEX, dtype=np.uint8)
+                values = {biome.value: index for biome, index in BIOME_INDEX.items()}
+                for class_id, biome_str in enumerate(label_encoder.classes_):
+                    lookup[class_id] = values.get(biome_str, UNKNOWN_BIOME_INDEX)
+                
+                self._biome_lookup = lookup
+                self._lookup_encoder = label_encoder
+            return self._biome_lookup
+    
+    def predict_biome_grid(self, elevation, moisture, temperature,
+                           water_level, mountain_level,
+                           desert_moisture, forest_moisture) -> Optional[np.ndarray]:
+        """
+        Предсказание биомов для целых массивов
+        
+        Аргументы могут быть скалярами или массивами с общей формой после
+        broadcasting. Признаки собираются блоками по predict_chunk_size
+        клеток, модель вызывается один раз на блок. Модель та же, что и у
+        predict_biome (см. _backend), поэтому результаты совпадают поклеточно.
+        
+        Returns:
+            Массив индексов BIOME_TYPES (uint8); UNKNOWN_BIOME_INDEX там, где
+            класс модели не соответствует биому. None если модель не обучена
+        """
+        if not self.use_ml or not self.is_trained:
+            return None
         
+        try:
+            columns = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (
+                elevation, moisture, temperature,
+                water_level, mountain_level,
+                desert_moisture, forest_moisture
+            )))
+            shape = columns[0].shape
+            columns = [column.ravel() for column in columns]
+            total = columns[0].size
+            
+            model, scaler, label_encoder, compiled = self._backend()
+            lookup = self._class_lookup(label_encoder) if compiled is None else None
+            result = np.empty(total, dtype=np.uint8)
+            
+            chunk_size = max(1, self.predict_chunk_size)
+            features = np.empty((min(chunk_size, total), len(columns)))
+            
+            with stage("ml.predict.tree" if compiled is not None else "ml.predict.forest", total):
+                for start in range(0, total, chunk_size):
+                    end = min(start + chunk_size, total)
+                    chunk = features[:end - start]
+                    for i, column in enumerate(columns):
+                        chunk[:, i] = column[start:end]
+                    
+                    if compiled is not None:
+                        result[start:end] = compiled.predict(chunk)
+                    else:
+                        result[start:end] = lookup[model.predict(scaler.transform(chunk))]
+            
+            return result.reshape(shape)
+            
+        except Exception as e:
+            print(f"Ошибка при предсказании: {e}")
+            return None
     
     def predict_proba(self, elevation: float, moisture: float, temperature: float,
                      water_level: float, mountain_level: float,
@@ -271,8 +685,12 @@ class MLBiomeClassifier:
                                 water_level, mountain_level,
                                 desert_moisture, forest_moisture]])
             
-            features_scaled = self.scaler.transform(features)
-            probabilities = self.model.predict_proba(features_scaled)[0]
+            model, scaler, _, _ = self._snapshot()
+            if model is None:
+                return None
+            
+            features_scaled = scaler.transform(features)
+            probabilities = model.predict_proba(features_scaled)[0]
             
             return probabilities
             
@@ -287,26 +705,24 @@ class MLBiomeClassifier:
         """
         Оценка модели на сгенерированной карте
         
+        Args:
+            biome_map: Карта индексов BIOME_TYPES или объектов BiomeType
+        
         Returns:
             Словарь с метриками оценки
         """
         if not self.use_ml or not self.is_trained:
             return {}
         
-        height, width = terrain_map.shape
-        correct = 0
-        total = 0
+        predicted = self.predict_biome_grid(
+            terrain_map, moisture_map, temperature_map,
+            water_level, mountain_level, desert_moisture, forest_moisture
+        )
+        if predicted is None:
+            return {}
         
-        for y in range(height):
-            for x in range(width):
-                ml_biome = self.predict_biome(
-                    terrain_map[y][x], moisture_map[y][x], temperature_map[y][x],
-                    water_level, mountain_level, desert_moisture, forest_moisture
-                )
-                
-                if ml_biome == biome_map[y][x]:
-                    correct += 1
-                total += 1
+        correct = int(np.count_nonzero(predicted == encode_biomes(biome_map)))
+        total = int(predicted.size)
         
         accuracy = correct / total if total > 0 else 0
         
@@ -327,8 +743,9 @@ def train_main():
     print("1. Быстрое обучение (50k примеров)")
     print("2. Полное обучение (200k примеров)")
     print("3. Обучение с настройкой гиперпараметров")
+    print("4. Компиляция сохраненной модели в дерево")
     
-    choice = input("\nВаш выбор (1-3): ").strip()
+    choice = input("\nВаш выбор (1-4): ").strip()
     
     if choice == '1':
         classifier.train_model(samples=50000, save=True)
@@ -337,6 +754,12 @@ def train_main():
     elif choice == '3':
         classifier.train_model(samples=100000, save=True)
         # Здесь можно добавить GridSearchCV для оптимизации
+    elif choice == '4':
+        classifier.load_model()
+        if classifier.compile_model() is not None:
+            classifier.save_model()
+        else:
+            print("Нет обученного леса для компиляции")
     else:
         print("Неверный выбор. Запуск быстрого обучения...")
         classifier.train_model(samples=50000, save=True)
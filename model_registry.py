@@ -0,0 +1,156 @@
+"""
+Общий для процесса ML классификатор биомов
+
+Модель загружается с диска один раз и используется всеми генераторами и
+потоками. При изменении файлов модели (например, после обучения в
+train_model.py) она перечитывается при следующем обращении; обучение
+выполняется в фоновом потоке и не задерживает создание генераторов.
+"""
+
+import os
+import threading
+from typing import Callable, Optional, Tuple
+
+from ml_biome_classifier import MLBiomeClassifier, MODEL_FILES, COMPILED_MODEL_FILE
+
+
+class ModelRegistry:
+    """
+    Реестр ML модели
+    
+    Классификатор создается один раз; его модель заменяется на месте
+    (MLBiomeClassifier.set_model), поэтому генераторы, получившие
+    классификатор раньше, видят новую модель без пересоздания.
+    """
+    
+    def __init__(self, model_files: Tuple[str, ...] = MODEL_FILES + (COMPILED_MODEL_FILE,)):
+        self.model_files = model_files
+        self._lock = threading.RLock()
+        self._classifier: Optional[MLBiomeClassifier] = None
+        
+        # Время изменения файлов, из которых загружена модель
+        self._loaded_mtimes = None
+        self._training: Optional[threading.Thread] = None
+        self._callbacks = []
+    
+    def _file_mtimes(self):
+        """Время изменения файлов модели (None для отсутствующих; None если нет ни одного)"""
+        mtimes = tuple(
+            os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            for path in self.model_files
+        )
+        return mtimes if any(mtime is not None for mtime in mtimes) else None
+    
+    def classifier(self, load: bool = True) -> MLBiomeClassifier:
+        """
+        Общий классификатор
+        
+        Args:
+            load: Загрузить модель, если она еще не загружена или файлы
+                модели изменились с момента загрузки
+        """
+        with self._lock:
+            if self._classifier is None:
+                self._classifier = MLBiomeClassifier(use_ml=False, auto_train=False)
+                self._classifier.use_ml = True
+            
+            if load:
+                self._refresh()
+            return self._classifier
+    
+    def _refresh(self):
+        """Загрузка модели, если файлы изменились"""
+        # Файлы сейчас записывает фоновое обучение этого процесса
+        if self._training is not None:
+            return
+        
+        mtimes = self._file_mtimes()
+        if mtimes is None or mtimes == self._loaded_mtimes:
+            return
+        
+        self._classifier.load_model()
+        if self._classifier.is_trained:
+            self._loaded_mtimes = mtimes
+    
+    @property
+    def training(self) -> bool:
+        """Идет ли фоновое обучение"""
+        with self._lock:
+            return self._training is not None
+    
+    def ensure_model(self, auto_train: bool = True, samples: int = 50000) -> MLBiomeClassifier:
+        """
+        Общий классификатор с загруженной моделью
+        
+        Если модели нет и auto_train включен, запускается фоновое обучение;
+        до его окончания классификатор остается необученным.
+        """
+        classifier = self.classifier(load=True)
+        if not classifier.is_trained and auto_train:
+            self.train_async(samples=samples)
+        return classifier
+    
+    def train_async(self, samples: int = 50000,
+                    callback: Optional[Callable[[Optional[Exception]], None]] = None
+                    ) -> threading.Thread:
+        """
+        Обучение модели в фоновом потоке
+        
+        Модель обучается отдельным классификатором, сохраняется и затем
+        передается общему классификатору. Если обучение уже идет, новое
+        не запускается: callback вызывается по окончании текущего.
+        
+        Args:
+            samples: Количество тренировочных примеров
+            callback: Вызывается в фоновом потоке по окончании обучения
+                с исключением или None при успехе
+        
+        Returns:
+            Поток обучения
+        """
+        with self._lock:
+            if callback is not None:
+                self._callbacks.append(callback)
+            if self._training is not None:
+                return self._training
+            
+            thread = threading.Thread(target=self._train, args=(samples,), daemon=True)
+            self._training = thread
+            thread.start()
+            return thread
+    
+    def _train(self, samples: int):
+        """Обучение в фоновом потоке"""
+        error = None
+        try:
+            trainer = MLBiomeClassifier(use_ml=False, auto_train=False)
+            trainer.train_model(samples=samples, save=True)
+            
+            with self._lock:
+                shared = self.classifier(load=False)
+                shared.set_model(trainer.model, trainer.scaler, trainer.label_encoder,
+                                 trainer.compiled, trainer.fingerprint)
+                self._loaded_mtimes = self._file_mtimes()
+        except Exception as e:
+            print(f"Ошибка при обучении модели: {e}")
+            error = e
+        
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+            self._training = None
+        for callback in callbacks:
+            callback(error)
+
+
+# Реестр процесса
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """Реестр ML модели текущего процесса"""
+    return _registry
+
+
+def shared_classifier(load: bool = True) -> MLBiomeClassifier:
+    """Общий классификатор текущего процесса"""
+    return _registry.classifier(load=load)
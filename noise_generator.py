@@ -3,59 +3,369 @@
 """
 
 import numpy as np
-import random
 import math
+from functools import lru_cache
 from typing import Optional, List, Tuple
 
+from profiling import stage
+
+
+# Размер таблицы перестановок (степень двойки, индексы берутся по маске)
+TABLE_SIZE = 256
+TABLE_MASK = TABLE_SIZE - 1
+
+# Фиксированный набор единичных градиентов, равномерно распределенных по кругу.
+# Случайность вносит только таблица перестановок конкретного seed.
+_DIRECTION_ANGLES = np.arange(TABLE_SIZE) * (2 * math.pi / TABLE_SIZE)
+GRADIENT_DIRECTIONS = np.stack([np.cos(_DIRECTION_ANGLES), np.sin(_DIRECTION_ANGLES)], axis=1)
+GRADIENT_DIRECTIONS.setflags(write=False)
+
+# Сдвиг соли между слоями шума (нечетный, чтобы слои не совпадали по модулю 256)
+_LAYER_SALT = 97
+
 
 class ImprovedNoiseGenerator:
     """
     Улучшенный генератор шума для более естественных карт
     """
     
+    # Бэкенд по умолчанию: "numpy" (векторизованный) или "python" (поклеточный эталон)
+    default_backend = "numpy"
+    
     @staticmethod
-    def perlin_noise(width: int, height: int, scale: float = 8.0, 
-                     octaves: int = 4, persistence: float = 0.5, 
-                     lacunarity: float = 2.0, seed: Optional[int] = None) -> np.ndarray:
+    def perlin_noise(width: int, height: int, scale: float = 8.0,
+                     octaves: int = 4, persistence: float = 0.5,
+                     lacunarity: float = 2.0, seed: Optional[int] = None,
+                     backend: Optional[str] = None, layer: int = 0,
+                     x_offset: float = 0, y_offset: float = 0, step: float = 1.0,
+                     normalize: bool = True) -> np.ndarray:
         """
         Генерация шума Перлина с несколькими октавами
+        
+        Args:
+            backend: "numpy" или "python" (None - ImprovedNoiseGenerator.default_backend)
+            layer: Номер слоя шума. Слои одного seed используют общую таблицу
+                   перестановок, но получают независимые градиенты
+            x_offset, y_offset: Мировые координаты левого верхнего пикселя
+            step: Шаг между соседними пикселями в мировых координатах
+            normalize: Растянуть результат на [0, 1] по его min/max. Без
+                       нормализации возвращается сырая сумма октав, которая
+                       не зависит от размера и положения окна
         """
         if scale <= 0:
             scale = 0.0001
         
-        base_noise = np.zeros((height, width))
+        if backend is None:
+            backend = ImprovedNoiseGenerator.default_backend
+        if backend not in ("numpy", "python"):
+            raise ValueError(f"Неизвестный бэкенд шума: {backend}")
+        
+        if seed is None:
+            # Локальный генератор: глобальное состояние np.random не трогаем
+            seed = int(np.random.default_rng().integers(0, 2**31))
         
-        if seed is not None:
-            np.random.seed(seed)
-            random.seed(seed)
+        perm = ImprovedNoiseGenerator.permutation_table(seed)
+        grad_x, grad_y = ImprovedNoiseGenerator.layer_gradients(seed, layer)
         
-        gradients = []
-        for _ in range(256):
-            angle = np.random.uniform(0, 2 * math.pi)
-            gradients.append((math.cos(angle), math.sin(angle)))
+        xs = x_offset + np.arange(width) * step
+        ys = y_offset + np.arange(height) * step
+        
+        if backend == "numpy":
+            base_noise = ImprovedNoiseGenerator._octave_noise_numpy(
+                perm, grad_x, grad_y, xs, ys, scale, octaves, persistence, lacunarity
+            )
+        else:
+            base_noise = ImprovedNoiseGenerator._octave_noise_python(
+                perm, grad_x, grad_y, xs, ys, scale, octaves, persistence, lacunarity
+            )
+        
+        if not normalize:
+            return base_noise
+        
+        return ImprovedNoiseGenerator.normalize(base_noise)
+    
+    @staticmethod
+    def normalize(base_noise: np.ndarray) -> np.ndarray:
+        """Растяжение шума на [0, 1] по его min/max"""
+        min_val = np.min(base_noise)
+        max_val = np.max(base_noise)
+        if max_val > min_val:
+            base_noise = (base_noise - min_val) / (max_val - min_val)
+        
+        return base_noise
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def permutation_table(seed: int) -> np.ndarray:
+        """
+        Таблица перестановок для seed (uint8, кэшируется)
+        
+        Строится собственным np.random.Generator, поэтому не зависит от
+        глобального состояния и безопасна при генерации из нескольких потоков.
+        Возвращаемый массив доступен только для чтения.
+        """
+        rng = np.random.default_rng(seed)
+        perm = rng.permutation(TABLE_SIZE).astype(np.uint8)
+        perm.setflags(write=False)
+        return perm
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def layer_gradients(seed: int, layer: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Градиенты слоя, заранее сведенные с таблицей перестановок
+        
+        Элемент k соответствует узлу решетки с хешем k (см. hash), так что
+        при генерации нужна одна выборка на угол вместо двух. Таблицы
+        продублированы до 512 элементов: сумму частей хеша по x и по y
+        можно использовать как индекс без взятия по модулю.
+        """
+        perm = ImprovedNoiseGenerator.permutation_table(seed).astype(np.intp)
+        salt = (layer * _LAYER_SALT) & TABLE_MASK
+        directions = perm[(perm + salt) & TABLE_MASK]
+        grad_x = np.tile(GRADIENT_DIRECTIONS[directions, 0], 2)
+        grad_y = np.tile(GRADIENT_DIRECTIONS[directions, 1], 2)
+        grad_x.setflags(write=False)
+        grad_y.setflags(write=False)
+        return grad_x, grad_y
+    
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def world_noise_range(seed: int, scale: float, octaves: int, persistence: float,
+                          lacunarity: float = 2.0, layer: int = 0) -> Tuple[float, float]:
+        """
+        Глобальный диапазон сырого шума (perlin_noise(..., normalize=False))
+        
+        Хеш решетки периодичен с периодом TABLE_SIZE узлов, поэтому весь
+        бесконечный мир повторяет один период размером TABLE_SIZE * scale.
+        Клетки периода (шаг не больше клетки; для целого периода - ровно
+        клетки мира) просматриваются в два прохода: грубая сетка не больше
+        _RANGE_SAMPLES x _RANGE_SAMPLES, затем все клетки в окрестностях
+        _RANGE_CANDIDATES наибольших и наименьших значений грубой сетки.
+        Время расчета не зависит от scale (десятые доли секунды), для
+        небольших scale грубая сетка совпадает с клетками и диапазон точен.
+        
+        Результат кэшируется: он одинаков для всех окон мира, что дает
+        детерминированную нормализацию для отдельно сгенерированных
+        фрагментов (редкие значения за пределами оценки обрезаются).
+        """
+        period = TABLE_SIZE * max(scale, 0.0001)
+        samples = max(1, int(np.ceil(period - 1e-9)))
+        step = period / samples
+        
+        # Грубая сетка: каждая stride-я клетка периода
+        stride = max(1, -(-samples // ImprovedNoiseGenerator._RANGE_SAMPLES))
+        coarse = -(-samples // stride)
+        band = max(1, (1 << 20) // coarse)
+        
+        def noise(width, height, x_offset, y_offset, cell_step):
+            return ImprovedNoiseGenerator.perlin_noise(
+                width, height, scale, octaves, persistence, lacunarity,
+                seed=seed, layer=layer, x_offset=x_offset, y_offset=y_offset,
+                step=cell_step, normalize=False
+            )
+        
+        count = ImprovedNoiseGenerator._RANGE_CANDIDATES
+        highs, lows = [], []
+        for row in range(0, coarse, band):
+            raw = noise(coarse, min(band, coarse - row), 0.0, row * stride * step, stride * step)
+            flat = raw.ravel()
+            k = min(count, flat.size)
+            for chosen, index in ((highs, np.argpartition(flat, -k)[-k:]),
+                                  (lows, np.argpartition(flat, k - 1)[:k])):
+                chosen.extend(zip(flat[index].tolist(), (row + index // coarse).tolist(),
+                                  (index % coarse).tolist()))
+        
+        highs = sorted(highs)[-count:]
+        lows = sorted(lows)[:count]
+        max_val = highs[-1][0]
+        min_val = lows[0][0]
+        
+        # Уточнение: все клетки между соседними узлами грубой сетки
+        if stride > 1:
+            window = 2 * stride + 1
+            for _, row, col in highs + lows:
+                raw = noise(window, window, (col - 1) * stride * step,
+                            (row - 1) * stride * step, step)
+                min_val = min(min_val, float(np.min(raw)))
+                max_val = max(max_val, float(np.max(raw)))
+        return float(min_val), float(max_val)
+    
+    # Размер грубой сетки и число уточняемых экстремумов world_noise_range
+    _RANGE_SAMPLES = 1024
+    _RANGE_CANDIDATES = 64
+    
+    # Примерное число клеток в одном блоке строк векторного движка:
+    # временные массивы блока помещаются в кэш процессора
+    _BLOCK_CELLS = 1 << 13
+    
+    @staticmethod
+    def _octave_noise_numpy(perm, grad_x, grad_y, xs: np.ndarray, ys: np.ndarray,
+                            scale: float, octaves: int, persistence: float,
+                            lacunarity: float) -> np.ndarray:
+        """Сумма октав для всей сетки целиком (без поклеточных вызовов)"""
+        value = np.zeros((len(ys), len(xs)))
+        max_value = ImprovedNoiseGenerator._accumulate_octaves(
+            value, perm, grad_x, grad_y, xs, ys, scale, 0, octaves, persistence, lacunarity
+        )
+        
+        if max_value > 0:
+            value /= max_value
+        
+        return value
+    
+    @staticmethod
+    def _accumulate_octaves(value: np.ndarray, perm, grad_x, grad_y,
+                            xs: np.ndarray, ys: np.ndarray, scale: float,
+                            first: int, last: int, persistence: float,
+                            lacunarity: float) -> float:
+        """
+        Добавление октав first..last-1 к сумме value (на месте)
+        
+        Октавы добавляются по возрастанию, как и при генерации всех октав
+        сразу, поэтому сумма, накопленная за несколько вызовов, совпадает
+        с вычисленной за один бит в бит.
+        
+        Хеш раскладывается на часть по x (перестановка) и часть по y
+        (сложение по модулю 256), поэтому углы решетки, смещения и затухание
+        считаются один раз на векторах строк/столбцов. Градиенты углов и
+        произведения dx * grad_x зависят только от строки решетки (не
+        больше TABLE_SIZE разных) и столбца, поэтому они считаются один раз
+        на строку решетки, а не на каждую строку карты. Двумерными остаются
+        только выборка строк этих таблиц и интерполяция; они выполняются
+        блоками строк, чтобы временные массивы не покидали кэш.
+        
+        Returns:
+            Сумма амплитуд октав 0..last-1 (делитель для нормализации)
+        """
+        height, width = len(ys), len(xs)
+        block_rows = max(1, ImprovedNoiseGenerator._BLOCK_CELLS // max(1, width))
+        amplitude = 1.0
+        frequency = 1.0
+        max_value = 0.0
+        
+        for _ in range(first):
+            max_value += amplitude
+            amplitude *= persistence
+            frequency *= lacunarity
+        
+        for octave in range(first, last):
+            with stage(f"noise.octave{octave}", height * width):
+                sample_x = xs / scale * frequency
+                sample_y = ys / scale * frequency
+                
+                x0 = np.floor(sample_x).astype(np.int64)
+                y0 = np.floor(sample_y).astype(np.int64)
+                sx = sample_x - x0
+                sy = sample_y - y0
+                
+                hx0 = perm[x0 & TABLE_MASK].astype(np.intp)
+                hx1 = perm[(x0 + 1) & TABLE_MASK].astype(np.intp)
+                hy0 = (y0 & TABLE_MASK).astype(np.intp)
+                hy1 = ((y0 + 1) & TABLE_MASK).astype(np.intp)
+                
+                # Смещения от углов решетки (dx зависит только от x, dy - от y)
+                dx0 = sx
+                dx1 = sample_x - (x0 + 1)
+                dy0 = sy
+                dy1 = sample_y - (y0 + 1)
+                
+                fx = (1 - np.cos(sx * math.pi)) * 0.5
+                gx = 1 - fx
+                fy = (1 - np.cos(sy * math.pi)) * 0.5
+                gy = 1 - fy
+                
+                # Таблицы углов для используемых строк решетки:
+                # строка таблицы для каждой строки карты - r0 (верх), r1 (низ)
+                lattice_rows = np.union1d(hy0, hy1)
+                table_row = np.zeros(TABLE_SIZE, dtype=np.intp)
+                table_row[lattice_rows] = np.arange(len(lattice_rows))
+                r0 = table_row[hy0]
+                r1 = table_row[hy1]
+                
+                # Таблицы градиентов продублированы, поэтому маска не нужна
+                idx0 = lattice_rows[:, None] + hx0
+                idx1 = lattice_rows[:, None] + hx1
+                corners = (dx0 * grad_x[idx0], grad_y[idx0],
+                           dx1 * grad_x[idx1], grad_y[idx1])
+                
+                for row in range(0, height, block_rows):
+                    rows = slice(row, row + block_rows)
+                
+                    top = ImprovedNoiseGenerator._lerp_rows(
+                        corners, r0[rows], dy0[rows, None], fx, gx
+                    )
+                    bottom = ImprovedNoiseGenerator._lerp_rows(
+                        corners, r1[rows], dy1[rows, None], fx, gx
+                    )
+                
+                    top *= gy[rows, None]
+                    bottom *= fy[rows, None]
+                    top += bottom
+                    top *= amplitude
+                    value[rows] += top
+                
+                max_value += amplitude
+                amplitude *= persistence
+                frequency *= lacunarity
+        
+        return max_value
+    
+    @staticmethod
+    def _lerp_rows(corners, table_rows, dy, fx, gx) -> np.ndarray:
+        """
+        Интерполяция по x между двумя углами решетки для блока строк
+        
+        corners - таблицы (dx0 * grad_x, grad_y) левого и правого углов по
+        строкам решетки, table_rows - строки таблиц для строк блока.
+        Порядок операций повторяет dot_grid_gradient/interpolate (сложение
+        двух произведений коммутативно), поэтому результат совпадает с
+        поклеточной версией бит в бит.
+        """
+        dot_x0, grad_y0, dot_x1, grad_y1 = corners
+        n0 = grad_y0[table_rows]
+        n0 *= dy
+        n0 += dot_x0[table_rows]
+        n1 = grad_y1[table_rows]
+        n1 *= dy
+        n1 += dot_x1[table_rows]
+        
+        n0 *= gx
+        n1 *= fx
+        n0 += n1
+        return n0
+    
+    @staticmethod
+    def _octave_noise_python(perm, grad_x, grad_y, xs: np.ndarray, ys: np.ndarray,
+                             scale: float, octaves: int, persistence: float,
+                             lacunarity: float) -> np.ndarray:
+        """Поклеточная сумма октав (эталонная реализация)"""
+        base_noise = np.zeros((len(ys), len(xs)))
+        gradients = list(zip(grad_x.tolist(), grad_y.tolist()))
+        perm = perm.tolist()
         
         def noise(x: float, y: float) -> float:
-            x0 = int(x)
+            x0 = math.floor(x)
             x1 = x0 + 1
-            y0 = int(y)
+            y0 = math.floor(y)
             y1 = y0 + 1
             
             sx = x - x0
             sy = y - y0
             
-            n0 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, x0, y0, x, y)
-            n1 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, x1, y0, x, y)
+            n0 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, perm, x0, y0, x, y)
+            n1 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, perm, x1, y0, x, y)
             ix0 = ImprovedNoiseGenerator.interpolate(n0, n1, sx)
             
-            n0 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, x0, y1, x, y)
-            n1 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, x1, y1, x, y)
+            n0 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, perm, x0, y1, x, y)
+            n1 = ImprovedNoiseGenerator.dot_grid_gradient(gradients, perm, x1, y1, x, y)
             ix1 = ImprovedNoiseGenerator.interpolate(n0, n1, sx)
             
             value = ImprovedNoiseGenerator.interpolate(ix0, ix1, sy)
             return value
         
-        for y in range(height):
-            for x in range(width):
+        for row, y in enumerate(ys.tolist()):
+            for col, x in enumerate(xs.tolist()):
                 amplitude = 1.0
                 frequency = 1.0
                 value = 0.0
@@ -74,19 +384,13 @@ class ImprovedNoiseGenerator:
                 if max_value > 0:
                     value /= max_value
                 
-                base_noise[y][x] = value
-        
-        min_val = np.min(base_noise)
-        max_val = np.max(base_noise)
-        if max_val > min_val:
-            base_noise = (base_noise - min_val) / (max_val - min_val)
+                base_noise[row][col] = value
         
         return base_noise
     
     @staticmethod
-    def dot_grid_gradient(gradients, ix: int, iy: int, x: float, y: float) -> float:
-        gradient_idx = ImprovedNoiseGenerator.hash(ix, iy) % len(gradients)
-        gradient = gradients[gradient_idx]
+    def dot_grid_gradient(gradients, perm, ix: int, iy: int, x: float, y: float) -> float:
+        gradient = gradients[ImprovedNoiseGenerator.hash(perm, ix, iy)]
         dx = x - ix
         dy = y - iy
         return dx * gradient[0] + dy * gradient[1]
@@ -98,5 +402,148 @@ class ImprovedNoiseGenerator:
         return a * (1 - f) + b * f
     
     @staticmethod
-    def hash(x: int, y: int) -> int:
-        return (x * 1836311903) ^ (y * 2971215073 + 123456789)
\ No newline at end of file
+    def hash(perm, x: int, y: int) -> int:
+        """Хеш узла решетки: индекс в таблице градиентов слоя (0..255)"""
+        return (perm[x & TABLE_MASK] + y) & TABLE_MASK
+
+class NoisePyramid:
+    """
+    Шум Перлина с постепенным уточнением (уровни детализации)
+    
+    Уровень с шагом step - это клетки карты с координатами, кратными
+    step, то есть в точности те же точки полной сетки. Сначала
+    вычисляется грубый уровень с малым числом октав (предпросмотр), затем
+    уровни с шагом step / 2, ... 1. При уточнении уже посчитанные клетки
+    не пересчитываются: к ним добавляются только недостающие октавы, а
+    полный набор октав считается лишь для новых клеток. Последний уровень
+    (step=1) совпадает с ImprovedNoiseGenerator.perlin_noise с теми же
+    параметрами бит в бит.
+    """
+    
+    def __init__(self, width: int, height: int, scale: float = 8.0,
+                 octaves: int = 4, persistence: float = 0.5,
+                 lacunarity: float = 2.0, seed: Optional[int] = None, layer: int = 0,
+                 x_offset: float = 0, y_offset: float = 0):
+        if scale <= 0:
+            scale = 0.0001
+        if seed is None:
+            seed = int(np.random.default_rng().integers(0, 2**31))
+        
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.octaves = octaves
+        self.persistence = persistence
+        self.lacunarity = lacunarity
+        self.seed = seed
+        self.layer = layer
+        
+        self._perm = ImprovedNoiseGenerator.permutation_table(seed)
+        self._grad_x, self._grad_y = ImprovedNoiseGenerator.layer_gradients(seed, layer)
+        self._xs = x_offset + np.arange(width) * 1.0
+        self._ys = y_offset + np.arange(height) * 1.0
+        
+        # Сумма октав для клеток уровня self.step (без деления на сумму амплитуд)
+        self._sum = np.zeros((height, width))
+        self._max_value = 0.0
+        
+        # Самый подробный вычисленный уровень и число его октав
+        self.step: Optional[int] = None
+        self.octaves_done = 0
+    
+    @staticmethod
+    def preview_steps(width: int, height: int, preview_size: int = 128) -> List[int]:
+        """
+        Шаги уровней предпросмотра (степени двойки, по убыванию, без 1)
+        
+        Первый уровень - не больше preview_size клеток по большей стороне.
+        """
+        steps = []
+        step = 1
+        while max(width, height) / step > max(1, preview_size):
+            step *= 2
+        while step > 1:
+            steps.append(step)
+            step //= 2
+        return steps
+    
+    def octaves_for_step(self, step: int) -> int:
+        """
+        Число октав, различимых на уровне step
+        
+        Октава учитывается, пока расстояние между соседними клетками
+        уровня не больше одной ячейки ее решетки: более высокие частоты
+        на грубой сетке дают только шум наложения. На полном уровне
+        используются все октавы.
+        """
+        if step <= 1:
+            return self.octaves
+        
+        count = 0
+        frequency = 1.0
+        while count < self.octaves and step * frequency / self.scale <= 1.0:
+            count += 1
+            frequency *= self.lacunarity
+        return max(1, count)
+    
+    def _accumulate(self, rows: slice, cols: slice, first: int, last: int):
+        """Добавление октав first..last-1 к клеткам среза rows x cols (на месте)"""
+        block = self._sum[rows, cols]
+        if first >= last or block.size == 0:
+            return
+        
+        self._max_value = ImprovedNoiseGenerator._accumulate_octaves(
+            block, self._perm, self._grad_x, self._grad_y, self._xs[cols], self._ys[rows],
+            self.scale, first, last, self.persistence, self.lacunarity
+        )
+    
+    def refine(self, step: int = 1, octaves: Optional[int] = None) -> np.ndarray:
+        """
+        Уточнение до уровня step и нормализованный шум этого уровня
+        
+        Args:
+            step: Шаг уровня: делитель шага уже вычисленного уровня или
+                кратное ему (тогда возвращается прореживание)
+            octaves: Число октав (None - octaves_for_step(step)); не
+                меньше уже вычисленного
+        
+        Returns:
+            Массив формы (ceil(height / step), ceil(width / step)),
+            растянутый на [0, 1], как у perlin_noise
+        """
+        step = max(1, int(step))
+        target = octaves if octaves is not None else self.octaves_for_step(step)
+        target = max(1, self.octaves_done, min(self.octaves, target))
+        
+        if self.step is None:
+            grid = slice(0, None, step)
+            self._accumulate(grid, grid, 0, target)
+            self.step = step
+            self.octaves_done = target
+        
+        if step < self.step and self.step % step:
+            raise ValueError(f"Шаг {step} не делит шаг вычисленного уровня {self.step}")
+        if step > self.step and step % self.step:
+            raise ValueError(f"Шаг {step} не кратен шагу вычисленного уровня {self.step}")
+        
+        # Недостающие октавы для уже вычисленных клеток
+        old = self.step
+        grid = slice(0, None, old)
+        self._accumulate(grid, grid, self.octaves_done, target)
+        
+        # Новые клетки (строки между строками прежнего уровня и столбцы
+        # между его столбцами) - все октавы
+        if step < old:
+            for offset in range(step, old, step):
+                self._accumulate(slice(offset, None, old), slice(0, None, step), 0, target)
+                self._accumulate(grid, slice(offset, None, old), 0, target)
+            self.step = step
+        self.octaves_done = target
+        
+        level = self._sum[::step, ::step] / self._max_value
+        return ImprovedNoiseGenerator.normalize(level)
+    
+    @property
+    def complete(self) -> bool:
+        """Вычислен ли полный уровень со всеми октавами"""
+        return self.step == 1 and self.octaves_done == self.octaves
@@ -0,0 +1,339 @@
+"""
+Параллельная генерация больших карт в пуле процессов
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from enhanced_map_generator import EnhancedMapGenerator
+from model_registry import get_registry
+from noise_generator import ImprovedNoiseGenerator
+from profiling import profiler
+
+
+# Описание массива в общей памяти: (имя блока, форма, dtype)
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+# Генератор рабочего процесса (создается один раз на процесс)
+_worker_gen = None
+
+# Параметры генератора, которые передаются в рабочие процессы с каждой задачей
+# (размеры тоже: генератор могут изменить после создания пула, а широта в
+# _climate_rows считается от self.height)
+_WORKER_PARAMS = (
+    'width', 'height', 'seed', 'water_level', 'mountain_level', 'desert_moisture', 'forest_moisture',
+    'water_amount', 'mountain_amount', 'desert_amount', 'forest_amount',
+    'temperature_amount',
+)
+
+
+def _init_worker(width: int, height: int):
+    """Инициализация рабочего процесса"""
+    global _worker_gen
+    # ML модель загружается лениво, только если задача ее запросит
+    _worker_gen = EnhancedMapGenerator(width, height, use_ml=False, auto_train=False)
+
+
+def _run_task(task, specs: List[ArraySpec], row_start: int, row_end: int,
+              params: Dict[str, Any], kwargs: Dict[str, Any],
+              profile: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Выполнение задачи над полосой строк [row_start, row_end)
+    
+    Массивы открываются по именам блоков общей памяти; задача пишет
+    результат прямо в них.
+    
+    Returns:
+        Замеры этапов, сделанные в рабочем процессе во время задачи
+        (get_stats(); пустой словарь, если замеры отключены)
+    """
+    for name, value in params.items():
+        setattr(_worker_gen, name, value)
+    
+    # Замеры процесса сбрасываются перед каждой задачей, чтобы родитель
+    # не добавил одну и ту же статистику дважды
+    profiler.enabled = profile
+    profiler.reset()
+    
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=block.buf)
+              for block, (_, shape, dtype) in zip(blocks, specs)]
+    try:
+        task(_worker_gen, arrays, row_start, row_end, **kwargs)
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+    return profiler.get_stats()
+
+
+def _noise_task(gen, arrays, row_start, row_end, scale, octaves, persistence, layer):
+    """Сырой (ненормализованный) шум полосы"""
+    out, = arrays
+    out[row_start:row_end] = ImprovedNoiseGenerator.perlin_noise(
+        width=out.shape[1],
+        height=row_end - row_start,
+        scale=scale,
+        octaves=octaves,
+        persistence=persistence,
+        lacunarity=2.0,
+        seed=gen.seed,
+        layer=layer,
+        y_offset=row_start,
+        normalize=False
+    )
+
+
+def _smooth_task(gen, arrays, row_start, row_end, iterations, coastlines):
+    """
+    Сглаживание полосы с запасом строк по краям
+    
+    Каждый проход читает соседей на 1 строку, поэтому полоса берется
+    с запасом iterations строк; после обрезки результат совпадает со
+    сглаживанием всей карты целиком.
+    """
+    src, dst = arrays
+    lo = max(0, row_start - iterations)
+    hi = min(src.shape[0], row_end + iterations)
+    
+    band = src[lo:hi].copy()
+    for _ in range(iterations):
+        band = gen.smooth_coastlines(band) if coastlines else gen.smooth_terrain(band)
+    
+    dst[row_start:row_end] = band[row_start - lo:row_end - lo]
+
+
+def _climate_task(gen, arrays, row_start, row_end, has_terrain):
+    """Корректировка влажности и температура полосы"""
+    terrain, moisture, temperature = arrays
+    rows = slice(row_start, row_end)
+    
+    moisture_band, temperature_band = gen._climate_rows(
+        moisture[rows], temperature[rows],
+        terrain[rows] if has_terrain else None,
+        row_offset=row_start
+    )
+    moisture[rows] = moisture_band
+    temperature[rows] = temperature_band
+
+
+def _biome_task(gen, arrays, row_start, row_end, use_ml):
+    """Классификация биомов полосы (индексы BIOME_TYPES)"""
+    terrain, moisture, temperature, biomes, ml_mask = arrays
+    rows = slice(row_start, row_end)
+    
+    if use_ml and not gen.ml_classifier.is_trained:
+        get_registry().classifier(load=True)
+    
+    biomes[rows], ml_mask[rows] = gen._classify_rows(
+        terrain[rows], moisture[rows], temperature[rows], use_ml
+    )
+
+
+class _SharedArrays:
+    """
+    Массивы в общей памяти, живущие в пределах блока with
+    
+    При выходе блоки закрываются и удаляются, поэтому результаты нужно
+    скопировать до конца блока.
+    """
+    
+    def __init__(self):
+        self._blocks = []
+        self._arrays = []
+    
+    def __enter__(self):
+        return self
+    
+    def new(self, shape: Tuple[int, ...], dtype=np.float64,
+            fill: Optional[np.ndarray] = None) -> Tuple[ArraySpec, np.ndarray]:
+        """Создание массива; fill - начальные данные (копируются)"""
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if fill is not None:
+            array[...] = fill
+        
+        self._blocks.append(block)
+        self._arrays.append(array)
+        return (block.name, tuple(shape), dtype.str), array
+    
+    def __exit__(self, *exc):
+        self._arrays.clear()
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks.clear()
+        return False
+
+
+class ParallelMapGenerator(EnhancedMapGenerator):
+    """
+    Генератор, распределяющий шум, климат и биомы по пулу процессов
+    
+    Карта делится на полосы строк; рабочие процессы читают входные данные
+    и пишут результаты прямо в общую память, массивы не пересылаются
+    через pickle. Шаги, которым нужна вся карта (нормализация по min/max),
+    выполняются в основном процессе, поэтому результат совпадает с
+    EnhancedMapGenerator для того же seed и параметров.
+    
+    Пул создается при первой генерации; освободить его можно close()
+    или используя генератор как контекстный менеджер.
+    """
+    
+    def __init__(self, width=60, height=40, use_ml: bool = True,
+                 workers: Optional[int] = None, bands_per_worker: int = 2):
+        super().__init__(width, height, use_ml=use_ml)
+        self.workers = workers or os.cpu_count() or 1
+        self.bands_per_worker = bands_per_worker
+        self._executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+    
+    def close(self):
+        """Остановка пула процессов"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.width, self.height)
+            )
+        return self._executor
+    
+    def _bands(self) -> List[Tuple[int, int]]:
+        """Разбиение строк карты на полосы"""
+        count = max(1, min(self.height, self.workers * self.bands_per_worker))
+        edges = np.linspace(0, self.height, count + 1).astype(int)
+        return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+    
+    def _run_bands(self, jobs: List[Tuple[Any, List[ArraySpec], Dict[str, Any]]]):
+        """
+        Выполнение задач над всеми полосами и ожидание завершения
+        
+        Замеры этапов из рабочих процессов добавляются в profiler
+        текущего процесса.
+        
+        Args:
+            jobs: Список (функция задачи, массивы, именованные параметры)
+        """
+        pool = self._pool()
+        params = {name: getattr(self, name) for name in _WORKER_PARAMS}
+        futures = [
+            pool.submit(_run_task, task, specs, lo, hi, params, kwargs, profiler.enabled)
+            for task, specs, kwargs in jobs
+            for lo, hi in self._bands()
+        ]
+        for future in futures:
+            profiler.merge(future.result())
+    
+    def generate_terrain(self, scale=8.0, roughness=0.5, octaves=4, seed=None,
+                         island_mode=True, smooth_iterations=2):
+        if seed is not None:
+            self.set_seed(seed)
+        
+        adjusted_octaves, persistence = self._noise_params(roughness)
+        shape = (self.height, self.width)
+        
+        with _SharedArrays() as shared:
+            src_spec, src = shared.new(shape)
+            dst_spec, dst = shared.new(shape)
+            
+            self._run_bands([(_noise_task, [src_spec], dict(
+                scale=scale, octaves=adjusted_octaves,
+                persistence=persistence, layer=0
+            ))])
+            
+            terrain = (ImprovedNoiseGenerator.normalize(src) * 2) - 1
+            if island_mode:
+                terrain = self.apply_island_effect(terrain, strength=0.7)
+            src[...] = terrain
+            
+            if smooth_iterations > 0:
+                self._run_bands([(_smooth_task, [src_spec, dst_spec], dict(
+                    iterations=smooth_iterations, coastlines=False
+                ))])
+                src[...] = dst
+            
+            src[...] = self.normalize_terrain(src.copy())
+            self._run_bands([(_smooth_task, [src_spec, dst_spec], dict(
+                iterations=1, coastlines=True
+            ))])
+            terrain = dst.copy()
+        
+        self.map_data = terrain
+        return terrain
+    
+    def generate_climate_maps(self, scale=8.0, dtype=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Генерация карт влажности и температуры"""
+        shape = (self.height, self.width)
+        has_terrain = self.map_data is not None
+        
+        with _SharedArrays() as shared:
+            terrain_spec, _ = shared.new(shape, fill=self.map_data if has_terrain else 0)
+            moisture_spec, moisture = shared.new(shape)
+            temperature_spec, temperature = shared.new(shape)
+            
+            self._run_bands([
+                (_noise_task, [moisture_spec], dict(
+                    scale=scale * 0.7, octaves=3, persistence=0.5,
+                    layer=self.MOISTURE_LAYER
+                )),
+                (_noise_task, [temperature_spec], dict(
+                    scale=scale * 0.5, octaves=2, persistence=0.4,
+                    layer=self.TEMPERATURE_LAYER
+                )),
+            ])
+            
+            moisture[...] = ImprovedNoiseGenerator.normalize(moisture)
+            temperature[...] = ImprovedNoiseGenerator.normalize(temperature)
+            
+            self._run_bands([(_climate_task, [terrain_spec, moisture_spec, temperature_spec],
+                              dict(has_terrain=has_terrain))])
+            
+            moisture_map = moisture.copy()
+            temperature_map = temperature.copy()
+        
+        return self._finish_climate_maps(moisture_map, temperature_map, dtype)
+    
+    def generate_biome_map(self, use_ml: bool = None) -> np.ndarray:
+        """Генерация карты биомов в пуле процессов"""
+        if self.map_data is None:
+            self.generate_terrain()
+        
+        if self.moisture_data is None or self.temperature_data is None:
+            self.generate_climate_maps()
+        
+        use_ml_final = use_ml if use_ml is not None else self.ml_enabled
+        shape = (self.height, self.width)
+        
+        with _SharedArrays() as shared:
+            specs = [
+                shared.new(shape, fill=self.map_data)[0],
+                shared.new(shape, fill=self.moisture_data)[0],
+                shared.new(shape, fill=self.temperature_data)[0],
+            ]
+            biome_spec, biomes = shared.new(shape, dtype=np.uint8)
+            ml_spec, ml_mask = shared.new(shape, dtype=bool)
+            
+            self._run_bands([(_biome_task, specs + [biome_spec, ml_spec],
+                              dict(use_ml=use_ml_final))])
+            
+            biome_map = biomes.copy()
+            ml_predictions = ml_mask.copy()
+        
+        return self._finish_biome_map(biome_map, ml_predictions, use_ml_final)
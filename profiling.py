@@ -0,0 +1,203 @@
+"""
+Замеры времени этапов генерации
+
+Этапы отмечаются контекстным менеджером или декоратором:
+    
+    with stage("terrain.noise", cells=width * height):
+        ...
+    
+    @timed("ml.predict")
+    def predict(...):
+        ...
+
+Для каждого этапа накапливаются число вызовов, суммарное, минимальное,
+максимальное и последнее время, а также число обработанных клеток.
+Статистика доступна через get_stats()/format_stats(), выводится на
+вкладке "Статистика" и сохраняется в JSON (dump_json, переменная
+окружения PROFILE_ENV, batch_generate.py --profile) для внешних панелей
+мониторинга.
+
+Замеры включены по умолчанию; накладные расходы - два вызова
+time.perf_counter на этап. set_enabled(False) отключает их полностью.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+# Переменная окружения с путем JSON файла, который графический интерфейс
+# перезаписывает после каждой генерации
+PROFILE_ENV = 'MAP_GENERATOR_PROFILE'
+
+
+class StageStats:
+    """Накопленная статистика одного этапа"""
+    
+    __slots__ = ('count', 'total', 'min', 'max', 'last', 'cells')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.last = 0.0
+        self.cells = 0
+    
+    def add(self, seconds: float, cells: int = 0, count: int = 1):
+        self.count += count
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        self.cells += cells
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'last': self.last,
+            'cells': self.cells,
+            'cells_per_second': self.cells / self.total if self.total > 0 else 0.0,
+        }
+
+
+class Profiler:
+    """Сборщик статистики этапов (потокобезопасный)"""
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._stats: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, name: str, seconds: float, cells: int = 0):
+        """Добавление одного замера этапа"""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = StageStats()
+            stats.add(seconds, cells)
+    
+    @contextmanager
+    def stage(self, name: str, cells: int = 0):
+        """Замер времени блока with как этапа name"""
+        if not self.enabled:
+            yield
+            return
+        
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, cells)
+    
+    def timed(self, name: Optional[str] = None,
+              cells: Optional[Callable[..., int]] = None):
+        """
+        Декоратор замера времени функции
+        
+        Args:
+            name: Имя этапа (по умолчанию - имя функции с классом)
+            cells: Функция от аргументов вызова, возвращающая число
+                обрабатываемых клеток
+        """
+        def decorator(func):
+            stage_name = name or func.__qualname__
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.record(stage_name, elapsed, cells(*args, **kwargs) if cells else 0)
+            return wrapper
+        return decorator
+    
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика всех этапов: имя -> словарь (см. StageStats.as_dict)"""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stats.items())}
+    
+    def merge(self, snapshot: Dict[str, Dict[str, Any]]):
+        """Добавление статистики из get_stats() другого процесса"""
+        with self._lock:
+            for name, data in snapshot.items():
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = StageStats()
+                if data['count']:
+                    stats.count += data['count']
+                    stats.total += data['total']
+                    stats.min = min(stats.min, data['min'])
+                    stats.max = max(stats.max, data['max'])
+                    stats.last = data['last']
+                    stats.cells += data['cells']
+    
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._stats.clear()
+    
+    def dump_json(self, path: str, extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Сохранение статистики в JSON
+        
+        Returns:
+            Путь к файлу
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        data = {'timestamp': time.time(), 'stages': self.get_stats()}
+        if extra:
+            data.update(extra)
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return path
+
+
+# Сборщик процесса
+profiler = Profiler()
+
+stage = profiler.stage
+timed = profiler.timed
+record = profiler.record
+get_stats = profiler.get_stats
+reset_stats = profiler.reset
+dump_json = profiler.dump_json
+
+
+def set_enabled(enabled: bool):
+    """Включение/отключение замеров"""
+    profiler.enabled = enabled
+
+
+def format_stats(stats: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """Текстовая таблица статистики этапов"""
+    if stats is None:
+        stats = get_stats()
+    if not stats:
+        return "Нет данных о времени этапов\n"
+    
+    width = max(len(name) for name in stats)
+    lines = [f"{'Этап':<{width}}  {'выз.':>5}  {'посл., мс':>9}  {'сред., мс':>9}  {'всего, с':>8}"]
+    for name, data in stats.items():
+        lines.append(
+            f"{name:<{width}}  {data['count']:>5}  {data['last'] * 1000:>9.1f}  "
+            f"{data['mean'] * 1000:>9.1f}  {data['total']:>8.2f}"
+        )
+    return "\n".join(lines) + "\n"
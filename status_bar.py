@@ -17,6 +17,7 @@ class StatusBar:
         self.status_label = None
         self.ml_status_label = None
         self.seed_label = None
+        self.progress_bar = None
         
         self.setup_status_bar()
     
@@ -37,6 +38,10 @@ class StatusBar:
         # Seed
         self.seed_label = ttk.Label(self.frame, text="Seed: -")
         self.seed_label.pack(side=tk.RIGHT, padx=10)
+        
+        # Ход генерации
+        self.progress_bar = ttk.Progressbar(self.frame, length=150, mode='determinate')
+        self.progress_bar.pack(side=tk.RIGHT, padx=10)
     
     def set_status(self, message):
         """Установка основного статуса"""
@@ -53,6 +58,13 @@ class StatusBar:
         if self.seed_label:
             self.seed_label.config(text=f"Seed: {seed}")
     
+    def set_progress(self, value, maximum=None):
+        """Установка хода выполнения (value из maximum этапов)"""
+        if self.progress_bar:
+            if maximum is not None:
+                self.progress_bar.config(maximum=maximum)
+            self.progress_bar.config(value=value)
+    
     def set_error(self, error_message):
         """Установка сообщения об ошибке"""
         if self.status_label:
@@ -37,11 +37,12 @@ def main():
     print("2. Стандартное обучение (100,000 примеров, ~20-40 секунд)")
     print("3. Полное обучение (200,000 примеров, ~40-80 секунд)")
     print("4. Экспертное обучение (500,000 примеров, ~2-3 минуты)")
-    print("5. Выход")
+    print("5. Потоковое обучение (10,000,000 примеров, постоянный объем памяти)")
+    print("6. Выход")
     
     while True:
         try:
-            choice = input("\nВаш выбор (1-5): ").strip()
+            choice = input("\nВаш выбор (1-6): ").strip()
             
             if choice == '1':
                 print("\nЗапуск быстрого обучения...")
@@ -76,11 +77,19 @@ def main():
                 break
                 
             elif choice == '5':
+                print("\nЗапуск потокового обучения...")
+                start_time = time.time()
+                classifier.train_model_streaming(samples=10000000, save=True)
+                elapsed = time.time() - start_time
+                print(f"\nОбучение завершено за {elapsed:.1f} секунд")
+                break
+                
+            elif choice == '6':
                 print("\nВыход...")
                 sys.exit(0)
                 
             else:
-                print("Пожалуйста, введите число от 1 до 5")
+                print("Пожалуйста, введите число от 1 до 6")
                 
         except KeyboardInterrupt:
             print("\n\nОбучение прервано пользователем")